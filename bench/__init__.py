@@ -0,0 +1,62 @@
+"""
+Description:
+Benchmark and load test harness. Scenarios run the bot's real code against
+in-process fakes of Discord, Plex and the state files, and report their numbers
+as JSON so runs can be compared. Run it with ``python -m bench``.
+"""
+
+import statistics
+
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    """
+    Register a scenario, a coroutine function that takes the scale and returns a dictionary of results.
+
+    :param name: The name the scenario is selected by on the command line.
+    """
+
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+
+    return register
+
+
+def summarize(samples: list) -> dict:
+    """
+    Summarize latency samples given in seconds, in milliseconds.
+
+    :param samples: The samples.
+    :return: The count, mean, percentiles and maximum.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def loop_lag(metrics) -> dict:
+    """
+    Summarize the event loop lag a Metrics sampler measured, in milliseconds.
+
+    :param metrics: The Metrics instance whose sampler ran during the scenario.
+    """
+    histogram = metrics.histogram("loop_lag_seconds")
+    return {
+        "samples": histogram.count,
+        "p99_ms": histogram.quantile(0.99) * 1000,
+        "max_ms": histogram.max * 1000,
+    }
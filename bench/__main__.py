@@ -0,0 +1,78 @@
+"""
+Description:
+Run benchmark scenarios and write their results as JSON.
+
+    python -m bench                               # every scenario, JSON on stdout
+    python -m bench changelog warns -o run.json   # some of them, into a file
+    python -m bench --scale 0.1                   # a tenth of the default sizes
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import bench.scenarios  # noqa: F401, registers the scenarios
+from bench import SCENARIOS
+from bench.fakes import ROOT
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(names: list, scale: float) -> dict:
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        start = time.perf_counter()
+        try:
+            results[name] = await SCENARIOS[name](scale)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        results[name]["wall_s"] = time.perf_counter() - start
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Run benchmark scenarios.")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run, out of {', '.join(SCENARIOS)}. Default is all.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of every scenario.")
+    parser.add_argument("-o", "--output", help="Write the results to this file instead of stdout.")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    # The bot's log records are not part of the results
+    logging.basicConfig(handlers=[logging.NullHandler()])
+    report = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+        },
+        "results": asyncio.run(run(args.scenarios or list(SCENARIOS), args.scale)),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+"""
+Description:
+In-process fakes for the benchmark scenarios: Discord channels, threads and
+messages behind a fake API with per-route rate limits, a local HTTP endpoint
+that answers like Discord including 429s, a plexapi-like PlexServer with
+library sections, and a throwaway directory with the bot's state files.
+"""
+
+import asyncio
+import collections
+import contextlib
+import itertools
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+from aiohttp import web
+
+from database import DatabaseManager
+from outbox import route_key
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class FakeDiscordAPI:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        limit: int = None,
+        window: float = 5.0,
+        observer=None,
+        clock=time.monotonic,
+    ) -> None:
+        """
+        :param latency: How long every call takes, in seconds.
+        :param limit: How many calls a route allows per window, None for no limit.
+        :param window: The length of a rate limit window, in seconds.
+        :param observer: Gets (method, path, status, headers) of every response, like Outbox.observe.
+        """
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.observer = observer
+        self.clock = clock
+        self.calls = collections.Counter()
+        self.limited = 0
+        # route key to (window end, calls left)
+        self._buckets = {}
+
+    def take(self, key: str, now: float) -> tuple:
+        """
+        Take a call from the bucket of a route.
+
+        :param key: The route key.
+        :param now: The current time of the clock.
+        :return: Whether the call is allowed, the rate limit headers to answer with and how long to wait if not.
+        """
+        if self.limit is None:
+            return True, {}, 0.0
+        reset_at, remaining = self._buckets.get(key, (0.0, 0))
+        if reset_at <= now:
+            reset_at, remaining = now + self.window, self.limit
+        allowed = remaining > 0
+        if allowed:
+            remaining -= 1
+            self._buckets[key] = (reset_at, remaining)
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset-After": f"{reset_at - now:.3f}",
+        }
+        if not allowed:
+            self.limited += 1
+            headers["Retry-After"] = headers["X-RateLimit-Reset-After"]
+        return allowed, headers, 0.0 if allowed else reset_at - now
+
+    async def call(self, method: str, path: str, result=None):
+        """
+        Make a call, waiting out 429s the way discord.py does.
+
+        :param method: The HTTP method.
+        :param path: The request path.
+        :param result: What the call returns.
+        """
+        key = route_key(method, path)
+        while True:
+            allowed, headers, wait = self.take(key, self.clock())
+            if allowed:
+                break
+            if self.observer is not None:
+                self.observer(method, path, 429, headers)
+            await asyncio.sleep(wait)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[key] += 1
+        if self.observer is not None and headers:
+            self.observer(method, path, 200, headers)
+        return result
+
+
+class FakeMessage:
+    def __init__(self, api: FakeDiscordAPI, channel, content=None, embed=None) -> None:
+        self.api = api
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.created_at = datetime.now(timezone.utc)
+        self.id = discord.utils.time_snowflake(self.created_at) + random.randrange(1 << 22)
+
+    async def delete(self) -> None:
+        await self.api.call("DELETE", f"/channels/{self.channel.id}/messages/{self.id}")
+
+
+class FakeChannel:
+    def __init__(self, api: FakeDiscordAPI, id: int, name: str = "channel") -> None:
+        self.api = api
+        self.id = id
+        self.name = name
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None, **kwargs) -> FakeMessage:
+        message = FakeMessage(self.api, self, content, embed)
+        await self.api.call("POST", f"/channels/{self.id}/messages")
+        self.sent.append(message)
+        return message
+
+
+class FakeThread(FakeChannel):
+    def __init__(
+        self,
+        api: FakeDiscordAPI,
+        id: int,
+        name: str,
+        parent_id: int,
+        created_at: datetime,
+        last_activity: datetime,
+        *,
+        archived: bool = False,
+        auto_archive_duration: int = 10080,
+    ) -> None:
+        super().__init__(api, id, name)
+        self.parent_id = parent_id
+        self.created_at = created_at
+        self.archive_timestamp = last_activity
+        self.last_message_id = None
+        self.archived = archived
+        self.auto_archive_duration = auto_archive_duration
+        self.mention = f"<#{id}>"
+
+    async def send(self, content=None, **kwargs) -> FakeMessage:
+        message = await super().send(content, **kwargs)
+        self.last_message_id = message.id
+        return message
+
+    async def edit(self, *, archived: bool = None, auto_archive_duration: int = None):
+        await self.api.call("PATCH", f"/channels/{self.id}")
+        if archived is not None:
+            self.archived = archived
+            self.archive_timestamp = datetime.now(timezone.utc)
+        if auto_archive_duration is not None:
+            self.auto_archive_duration = auto_archive_duration
+        return self
+
+
+def make_threads(
+    api: FakeDiscordAPI, count: int, parent_id: int, *, now: datetime, seed: int = 0
+) -> list:
+    """
+    Build a game library forum with random names and activity, some threads close to auto-archiving.
+
+    :param count: How many threads to make.
+    :param parent_id: The ID of the forum channel.
+    :param now: The current time, timezone aware.
+    """
+    rng = random.Random(seed)
+    threads = []
+    for i in range(count):
+        created = now - timedelta(days=rng.uniform(0, 700))
+        activity = max(created, now - timedelta(days=rng.uniform(0, 7)))
+        threads.append(
+            FakeThread(
+                api,
+                10_000_000 + i,
+                f"{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')}game {i:05d}",
+                parent_id,
+                created,
+                activity,
+                archived=rng.random() < 0.02,
+            )
+        )
+    return threads
+
+
+class FakeDiscordServer:
+    def __init__(self, *, limit: int = 5, window: float = 1.0, global_every: int = 0) -> None:
+        """
+        A local HTTP endpoint for channel messages that rate limits like Discord.
+
+        :param limit: How many messages a channel allows per window.
+        :param window: The length of a window, in seconds.
+        :param global_every: Answer every n-th request with a global 429, 0 for never.
+        """
+        self.api = FakeDiscordAPI(limit=limit, window=window)
+        self.global_every = global_every
+        self.requests = 0
+        self.limited = 0
+        self.url = None
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        now = self.api.clock()
+        key = route_key(request.method, request.path)
+        if self.global_every and self.requests % self.global_every == 0:
+            self.limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "global": True, "retry_after": 0.05},
+                status=429,
+                headers={"Retry-After": "0.05", "X-RateLimit-Global": "true", "X-RateLimit-Scope": "global"},
+            )
+        allowed, headers, wait = self.api.take(key, now)
+        if not allowed:
+            self.limited += 1
+            return web.json_response({"retry_after": wait}, status=429, headers=headers)
+        return web.json_response({"id": str(self.requests)}, headers=headers)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/api/v10/channels/{channel_id}/messages", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/api/v10"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakePartial:
+    """
+    Like plexapi's search results: reading an attribute that is None, unless auto reload
+    was turned off, fetches the whole item from the server, one request per item.
+    """
+
+    def __init__(self, server) -> None:
+        self._server = server
+        self._autoReload = True
+
+    def __getattribute__(self, attr):
+        value = super().__getattribute__(attr)
+        if value is None and not attr.startswith("_") and self._autoReload:
+            self._server.requests += 1
+            self._server.reloads += 1
+            time.sleep(self._server.latency)
+        return value
+
+
+class FakeMovie(FakePartial):
+    def __init__(self, server, ratingKey, title, year, addedAt, editionTitle=None) -> None:
+        super().__init__(server)
+        self.ratingKey = ratingKey
+        self.title = title
+        self.titleSort = title
+        self.year = year
+        self.editionTitle = editionTitle
+        self.addedAt = addedAt
+
+
+class FakeShow(FakePartial):
+    def __init__(self, server, ratingKey, title, year) -> None:
+        super().__init__(server)
+        self.ratingKey = ratingKey
+        self.title = title
+        self.titleSort = title
+        self.year = year
+
+    def episodes(self) -> list:
+        server = self._server
+        server.requests += 1
+        time.sleep(server.latency)
+        return list(server.episodes[self.ratingKey])
+
+
+class FakeEpisode(FakePartial):
+    def __init__(self, server, ratingKey, show: FakeShow, season, episode, addedAt) -> None:
+        super().__init__(server)
+        self.ratingKey = ratingKey
+        self.title = f"Episode {episode}"
+        self.grandparentRatingKey = show.ratingKey
+        self.parentIndex = season
+        self.index = episode
+        self.addedAt = addedAt
+        self.locations = [f"/tv/{show.title}/Season {season:02d}/{show.title} - S{season:02d}E{episode:02d}.mkv"]
+
+
+class FakeSection:
+    def __init__(self, server, items: list) -> None:
+        self.server = server
+        self.items = items
+
+    def search(
+        self,
+        libtype=None,
+        filters=None,
+        container_start=0,
+        container_size=100,
+        maxresults=None,
+        **kwargs,
+    ) -> list:
+        if libtype == "show":
+            items = list(self.server.shows.values())
+        else:
+            cutoff = (filters or {}).get("addedAt>>")
+            items = [item for item in self.items if cutoff is None or item.addedAt > cutoff]
+        end = None if maxresults is None else container_start + maxresults
+        items = items[container_start:end]
+        # Like plexapi, one request per container of results however many the caller wanted
+        requests = max(1, -(-len(items) // container_size))
+        self.server.requests += requests
+        time.sleep(self.server.latency * requests)
+        return items
+
+
+class FakeLibrary:
+    def __init__(self, server) -> None:
+        self.server = server
+        self.sections = {}
+
+    def section(self, name: str) -> FakeSection:
+        self.server.requests += 1
+        return self.sections[name]
+
+
+class FakePlexServer:
+    def __init__(self, *, latency: float = 0.0) -> None:
+        """
+        :param latency: How long every request blocks, in seconds, like plexapi's blocking requests do.
+        """
+        self.latency = latency
+        self.requests = 0
+        # The requests plexapi's auto reload would have made
+        self.reloads = 0
+        self.shows = {}
+        # Show rating key to its episodes, for Show.episodes()
+        self.episodes = collections.defaultdict(list)
+        self._keys = itertools.count(1_000_000)
+        self.library = FakeLibrary(self)
+        self.library.sections = {"Movies": FakeSection(self, []), "Series": FakeSection(self, [])}
+
+    def fetchItems(self, keys: list) -> list:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [self.shows[key] for key in keys]
+
+    def add(self, since: datetime, until: datetime, movies: int, shows: int, episodes: int, seed: int = 0) -> None:
+        """
+        Add items with random addedAt times within a date range.
+
+        :param movies: How many movies to add.
+        :param shows: How many shows to spread the episodes over, new shows are made as needed.
+        :param episodes: How many episodes to add.
+        """
+        rng = random.Random(seed)
+        span = (until - since).total_seconds()
+        for _ in range(movies):
+            key = next(self._keys)
+            self.library.sections["Movies"].items.append(
+                FakeMovie(
+                    self,
+                    key,
+                    f"Movie {key}",
+                    rng.randint(1950, 2025),
+                    since + timedelta(seconds=rng.uniform(0, span)),
+                    "Director's Cut" if rng.random() < 0.02 else None,
+                )
+            )
+        while len(self.shows) < shows:
+            key = next(self._keys)
+            self.shows[key] = FakeShow(self, key, f"Show {key}", rng.randint(1990, 2025))
+        showList = list(self.shows.values())[-shows:]
+        counts = collections.Counter(
+            item.grandparentRatingKey for item in self.library.sections["Series"].items
+        )
+        for i in range(episodes):
+            show = showList[i % len(showList)]
+            season, episode = divmod(counts[show.ratingKey], 20)
+            counts[show.ratingKey] += 1
+            item = FakeEpisode(
+                self,
+                next(self._keys),
+                show,
+                season + 1,
+                episode + 1,
+                since + timedelta(seconds=rng.uniform(0, span)),
+            )
+            self.library.sections["Series"].items.append(item)
+            self.episodes[show.ratingKey].append(item)
+
+
+def fake_plex_client(server: FakePlexServer, **kwargs):
+    """
+    Build a PlexClient whose session is the fake server, so its thread pool and timeouts still run.
+    """
+    from plex.client import PlexClient
+
+    client = PlexClient("http://plex.invalid", "token", **kwargs)
+    client._server = server
+    return client
+
+
+@contextlib.contextmanager
+def state_files(*, plex_date: datetime = None, schedule: list = ()):
+    """
+    Work in a throwaway directory holding the bot's state files.
+
+    :param plex_date: What plexDate.txt holds, None to leave it out.
+    :param schedule: (time, code) entries for schedule.csv.
+    :return: The path of the directory.
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="fulcrum-bench-") as directory:
+        if plex_date is not None:
+            with open(os.path.join(directory, "plexDate.txt"), "w") as file:
+                file.write(plex_date.strftime("%Y-%m-%d"))
+        with open(os.path.join(directory, "schedule.csv"), "w") as file:
+            for itemTime, itemCode in schedule:
+                file.write(f"{itemTime.strftime('%Y-%m-%d,%H:%M:%S')},{itemCode}\n")
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+async def open_database(directory: str, **kwargs) -> DatabaseManager:
+    """
+    Create a database in a directory the way the bot does, with the schema and every migration.
+    """
+    database = await DatabaseManager.connect(os.path.join(directory, "database.db"), **kwargs)
+    async with database.transaction() as connection:
+        with open(os.path.join(ROOT, "database", "schema.sql")) as file:
+            await connection.executescript(file.read())
+    await database.migrate(os.path.join(ROOT, "database", "migrations"))
+    return database
+
+
+def user_payload(id: int, name: str, *, bot: bool = False) -> dict:
+    return {"id": str(id), "username": name, "discriminator": "0", "avatar": None, "bot": bot}
+
+
+def message_payload(id: int, channel_id: int, author: dict, content: str) -> dict:
+    """
+    Build a message the way the gateway delivers it in MESSAGE_CREATE.
+    """
+    return {
+        "id": str(id),
+        "channel_id": str(channel_id),
+        "type": 0,
+        "content": content,
+        "author": author,
+        "attachments": [],
+        "embeds": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "edited_timestamp": None,
+        "flags": 0,
+        "components": [],
+    }
+
+
+class FakeHTTP:
+    def __init__(self, user: dict, *, latency: float = 0.0) -> None:
+        """
+        Stands in for discord.py's HTTPClient.request, answering every route like Discord would.
+
+        :param user: The payload of the bot's own user, the author of what it sends.
+        :param latency: How long every request takes, in seconds.
+        """
+        self.user = user
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._ids = itertools.count(1 << 40)
+
+    async def request(self, route, **kwargs):
+        self.calls[f"{route.method} {route.path}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if route.method == "POST" and route.path.endswith("/messages"):
+            payload = kwargs.get("json") or {}
+            return message_payload(next(self._ids), route.channel_id, self.user, payload.get("content") or "")
+        return {}
+
+
+async def offline_bot(*, latency: float = 0.0):
+    """
+    Build the bot without a gateway connection, its requests go to a FakeHTTP.
+
+    :param latency: How long every Discord request takes, in seconds.
+    :return: The bot, its FakeHTTP and a DM channel with a user to deliver messages in.
+    """
+    from bot import DiscordBot
+
+    bot = DiscordBot()
+    await bot._async_setup_hook()
+    state = bot._connection
+    user = user_payload(1238671384104800346, "fulcrum", bot=True)
+    state.user = discord.ClientUser(state=state, data=user)
+    http = FakeHTTP(user, latency=latency)
+    bot.http.request = http.request
+    bot.instrument_http()
+    bot.lazy_lock = asyncio.Lock()
+    channel = discord.DMChannel(
+        me=state.user,
+        state=state,
+        data={"id": "5000", "type": 1, "recipients": [user_payload(3000, "member")]},
+    )
+    return bot, http, channel
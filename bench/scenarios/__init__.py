@@ -0,0 +1,22 @@
+"""
+Description:
+The benchmark scenarios, importing the package registers every one of them.
+"""
+
+from bench.scenarios import (
+    changelog,
+    chat_replay,
+    command_storm,
+    episodes,
+    game_index,
+    keepalive,
+    log_flood,
+    metrics_overhead,
+    outbox,
+    plex_scan,
+    shards,
+    startup,
+    warn_reports,
+    warns,
+    warns_1m,
+)
@@ -0,0 +1,114 @@
+"""
+Description:
+A large Plex library and a busy week: the weekly changelog job end to end, from
+plexDate.txt through the incremental sync to the messages in the channel, plus
+what the library snapshot costs on disk and how fast it answers searches.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bench import loop_lag, scenario, summarize
+from bench.fakes import (
+    FakeChannel,
+    FakeDiscordAPI,
+    FakePlexServer,
+    fake_plex_client,
+    open_database,
+    state_files,
+)
+from games import GameLibraryIndex
+from metrics import Metrics
+from outbox import Outbox
+from plex import PlexLibrary
+
+
+@scenario("changelog")
+async def run(scale: float) -> dict:
+    from bot import DiscordBot
+
+    metrics = Metrics()
+    metrics.start(0.01)
+    outbox = Outbox()
+    outbox.start()
+    api = FakeDiscordAPI(latency=0.005, limit=5, window=1.0, observer=outbox.observe)
+    channel = FakeChannel(api, 1223505800706789378, "changelog")
+
+    now = datetime.now()
+    lastLog = now - timedelta(days=7)
+    server = FakePlexServer(latency=0.002)
+    server.add(
+        now - timedelta(days=3650),
+        lastLog,
+        movies=int(20_000 * scale),
+        shows=max(1, int(2_000 * scale)),
+        episodes=int(80_000 * scale),
+    )
+    plex = fake_plex_client(server)
+    result = {"library_items": int(100_000 * scale)}
+    with state_files(plex_date=lastLog) as directory:
+        database = await open_database(directory)
+        library = PlexLibrary(database=database)
+
+        start = time.perf_counter()
+        await library.sync(plex)
+        result["initial_sync_s"] = time.perf_counter() - start
+        await database.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["snapshot_mb"] = os.path.getsize(os.path.join(directory, "database.db")) / 2**20
+
+        server.add(
+            lastLog,
+            now,
+            movies=int(400 * scale),
+            shows=max(1, int(150 * scale)),
+            episodes=int(2_000 * scale),
+            seed=1,
+        )
+        # The job itself, with the seed it would get from plexDate.txt on its first run
+        bot = SimpleNamespace(
+            plex=plex,
+            plex_library=library,
+            game_library=GameLibraryIndex(),
+            outbox=outbox,
+            get_channel=lambda id: channel,
+        )
+        seed = DiscordBot.plex_log_seed(bot)
+        requests = server.requests
+        start = time.perf_counter()
+        await DiscordBot.plex_log(bot, seed["last_run"])
+        result["changelog_s"] = time.perf_counter() - start
+        result["changelog_plex_requests"] = server.requests - requests
+        # Every attribute read that plexapi would have turned into a request, over the whole run
+        result["plex_reloads"] = server.reloads
+        result["messages"] = len(channel.sent)
+        result["longest_message"] = max(len(m.content) for m in channel.sent)
+
+        searches = []
+        for i in range(200):
+            start = time.perf_counter()
+            await library.search(f"{'Movie' if i % 2 else 'Show'} {1_000_000 + i * 37}")
+            searches.append(time.perf_counter() - start)
+        result["search"] = summarize(searches)
+
+        ranges = []
+        for days in range(7, 7 * 53, 7):
+            start = time.perf_counter()
+            await library.get_new_movies(now - timedelta(days=days), now - timedelta(days=days - 7))
+            await library.get_new_episodes(now - timedelta(days=days), now - timedelta(days=days - 7))
+            ranges.append(time.perf_counter() - start)
+        result["weekly_range"] = summarize(ranges)
+
+        # Every hundredth movie was removed from Plex
+        del server.library.sections["Movies"].items[::100]
+        start = time.perf_counter()
+        result["pruned"] = await library.prune(plex)
+        result["prune_s"] = time.perf_counter() - start
+        await database.close()
+
+    plex.close()
+    outbox.stop()
+    metrics.stop()
+    result["loop_lag"] = loop_lag(metrics)
+    return result
@@ -0,0 +1,100 @@
+"""
+Description:
+A replay of a busy guild's chat, mostly plain chatter with the odd mention of
+the bot, typo and command in between. Measures the CPU time every message costs
+with the on_message prefilter, and without it, when every message went through
+process_commands and when_mentioned_or.
+"""
+
+import asyncio
+import time
+import types
+
+import discord
+from discord.ext import commands
+
+from bench import scenario
+from bench.fakes import message_payload, offline_bot, user_payload
+
+# Out of every 100 messages, the rest is chatter
+COMMANDS = 3
+MENTIONS = 2
+TYPOS = 1
+CHATTER = (
+    "lol",
+    "anyone up for a round of mario kart tonight?",
+    "the new episode dropped, no spoilers please",
+    "https://tenor.com/view/cat-typing-gif-12002898",
+    "brb",
+)
+
+
+def content(i: int, prefix: str, mention: str) -> str:
+    kind = i % 100
+    if kind < COMMANDS:
+        return f"{prefix}ping"
+    if kind < COMMANDS + MENTIONS:
+        return f"{mention} is plex down again?"
+    if kind < COMMANDS + MENTIONS + TYPOS:
+        return f"{prefix}pnig"
+    return CHATTER[i % len(CHATTER)]
+
+
+async def replay(bot, channel, count: int) -> dict:
+    invoked = 0
+
+    @bot.command(name="ping")
+    async def ping(context) -> None:
+        nonlocal invoked
+        invoked += 1
+        await context.send("pong")
+
+    prefix, mention = bot.config["prefix"], bot.user.mention
+    authors = [user_payload(3000 + i, f"member{i}") for i in range(200)]
+    cpu = 0.0
+    for start in range(0, count, 1_000):
+        # Parsing the gateway payload costs the same either way, it is left out
+        messages = [
+            discord.Message(
+                state=bot._connection,
+                channel=channel,
+                data=message_payload(
+                    1 << 32 | i, channel.id, authors[i % len(authors)], content(i, prefix, mention)
+                ),
+            )
+            for i in range(start, min(count, start + 1_000))
+        ]
+        began = time.process_time()
+        for message in messages:
+            await bot.on_message(message)
+        # Let the command_completion and command_error events run as well
+        for _ in range(3):
+            await asyncio.sleep(0)
+        cpu += time.process_time() - began
+    return {"cpu_s": cpu, "cpu_us_per_message": cpu / count * 1e6, "commands": invoked}
+
+
+@scenario("chat_replay")
+async def run(scale: float) -> dict:
+    count = max(100, int(100_000 * scale))
+
+    bot, _, channel = await offline_bot()
+    # How every message was handled before the prefilter
+    bot.get_prefix = types.MethodType(commands.Bot.get_prefix, bot)
+
+    async def on_message(message: discord.Message) -> None:
+        if message.author == bot.user or message.author.bot:
+            return
+        await bot.process_commands(message)
+
+    bot.on_message = on_message
+    before = await replay(bot, channel, count)
+
+    bot, _, channel = await offline_bot()
+    after = await replay(bot, channel, count)
+    return {
+        "messages": count,
+        "before": before,
+        "after": after,
+        "speedup": before["cpu_s"] / after["cpu_s"],
+    }
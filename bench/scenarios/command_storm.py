@@ -0,0 +1,67 @@
+"""
+Description:
+A storm of prefix commands delivered to the bot at a fixed rate, the way the
+gateway dispatches MESSAGE_CREATE: every message is parsed and handled in its
+own task. Latency is measured from when a message arrives to when its reply
+was sent.
+"""
+
+import asyncio
+import time
+
+import discord
+
+from bench import loop_lag, scenario, summarize
+from bench.fakes import message_payload, offline_bot, user_payload
+
+RATE = 500
+# Share of each kind of message, the rest are known commands
+MENTIONS = 0.10
+UNKNOWN = 0.10
+
+
+@scenario("command_storm")
+async def run(scale: float) -> dict:
+    bot, http, channel = await offline_bot(latency=0.02)
+    bot.metrics.start(0.01)
+
+    @bot.command(name="ping")
+    async def ping(context) -> None:
+        await context.send("pong")
+
+    count = max(1, int(RATE * 10 * scale))
+    prefix = bot.config["prefix"]
+    authors = [user_payload(3000 + i, f"member{i}") for i in range(100)]
+    samples = []
+    tasks = []
+
+    async def deliver(i: int, arrival: float) -> None:
+        if i % 100 < MENTIONS * 100:
+            content = f"<@{bot.user.id}> ping"
+        elif i % 100 < (MENTIONS + UNKNOWN) * 100:
+            content = f"{prefix}nothing"
+        else:
+            content = f"{prefix}ping"
+        data = message_payload(1 << 32 | i, channel.id, authors[i % len(authors)], content)
+        await bot.on_message(discord.Message(state=bot._connection, channel=channel, data=data))
+        samples.append(time.perf_counter() - arrival)
+
+    start = time.perf_counter()
+    for i in range(count):
+        arrival = start + i / RATE
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver(i, arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    bot.metrics.stop()
+    return {
+        "messages": count,
+        "target_rate": RATE,
+        "achieved_rate": count / elapsed,
+        "latency": summarize(samples),
+        "replies": sum(n for route, n in http.calls.items() if route.startswith("POST")),
+        "loop_lag": loop_lag(bot.metrics),
+    }
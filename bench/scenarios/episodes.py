@@ -0,0 +1,58 @@
+"""
+Description:
+Season and episode parsing over a synthetic 50k episode list, the way a large
+initial sync sees it. A tenth of the episodes have no season or episode number
+in their metadata and are parsed from the file name. Measures the parsing and
+range collapsing, and counts the requests plexapi's auto reload would have made.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from bench import scenario
+from bench.fakes import FakePlexServer
+from plex.episodes import episode_ranges, group_episodes, parse_episode, season_ranges
+
+MISSING = 10
+
+
+@scenario("episodes")
+async def run(scale: float) -> dict:
+    count = max(1_000, int(50_000 * scale))
+    now = datetime.now()
+    server = FakePlexServer()
+    server.add(now - timedelta(days=3650), now, movies=0, shows=max(1, count // 500), episodes=count)
+    episodes = server.library.sections["Series"].items
+    for i, e in enumerate(episodes):
+        if i % MISSING == 0:
+            e.parentIndex = e.index = None
+
+    start = time.perf_counter()
+    pairs = [parse_episode(e) for e in episodes]
+    parse_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ranges = season_ranges(group_episodes(pairs))
+    ranges_s = time.perf_counter() - start
+
+    # Every show the changelog lists is collapsed on its own
+    shows = {}
+    for e in episodes:
+        shows.setdefault(e.grandparentRatingKey, []).append(e)
+    start = time.perf_counter()
+    for showEpisodes in shows.values():
+        episode_ranges(showEpisodes)
+    per_show_s = time.perf_counter() - start
+
+    return {
+        "episodes": count,
+        "shows": len(shows),
+        "from_file_name": count // MISSING + (count % MISSING > 0),
+        "unparsed": pairs.count(None),
+        "parse_ms": parse_s * 1000,
+        "parse_us_per_episode": parse_s / count * 1e6,
+        "ranges_ms": ranges_s * 1000,
+        "seasons": len(ranges),
+        "per_show_ranges_ms": per_show_s * 1000,
+        "plex_reloads": server.reloads,
+    }
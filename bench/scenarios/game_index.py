@@ -0,0 +1,52 @@
+"""
+Description:
+Lookups on the game library index against walking every thread, the way the
+changelog and the game command found their threads before the index existed.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench import scenario, summarize
+from bench.fakes import FakeDiscordAPI, FakeThread, make_threads
+from games import GAME_CHANNEL_ID, GameLibraryIndex, normalize
+
+
+def timed(func, repeat: int) -> dict:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+@scenario("game_index")
+async def run(scale: float) -> dict:
+    now = datetime.now(timezone.utc)
+    api = FakeDiscordAPI()
+    threads = make_threads(api, max(2, int(5_000 * scale)), GAME_CHANNEL_ID, now=now)
+    index = GameLibraryIndex()
+    start = time.perf_counter()
+    index.load(threads)
+    result = {"threads": len(index), "load_ms": (time.perf_counter() - start) * 1000}
+
+    since = now - timedelta(days=7)
+    result["names_since"] = timed(lambda i: index.names_since(since), 200)
+    result["names_since_scan"] = timed(
+        lambda i: sorted(t.name for t in threads if t.created_at >= since), 200
+    )
+    queries = [f"{chr(65 + i % 26)}game {i % 100:02d}" for i in range(200)]
+    result["search"] = timed(lambda i: index.search(queries[i]), 200)
+    result["search_scan"] = timed(
+        lambda i: [t.name for t in threads if normalize(queries[i]) in normalize(t.name)][:25],
+        200,
+    )
+
+    def churn(i: int) -> None:
+        thread = FakeThread(api, 20_000_000 + i, f"New game {i}", GAME_CHANNEL_ID, now, now)
+        index.add(thread)
+        index.remove(thread.id)
+
+    result["add_remove"] = timed(churn, 1_000)
+    return result
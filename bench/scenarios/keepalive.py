@@ -0,0 +1,51 @@
+"""
+Description:
+A keepalive pass over a large game library forum. The bumps go through the
+outbox into a fake API with per-route rate limits, a second pass right after
+the first one should have nothing left to do.
+"""
+
+import time
+from datetime import datetime, timezone
+
+from bench import loop_lag, scenario
+from bench.fakes import FakeDiscordAPI, make_threads
+from games import GAME_CHANNEL_ID, GameKeepalive, GameLibraryIndex
+from metrics import Metrics
+from outbox import Outbox
+
+
+@scenario("keepalive")
+async def run(scale: float) -> dict:
+    metrics = Metrics()
+    metrics.start(0.01)
+    outbox = Outbox()
+    outbox.start()
+    api = FakeDiscordAPI(latency=0.001, limit=5, window=1.0, observer=outbox.observe)
+    threads = make_threads(
+        api, max(2, int(1_000 * scale)), GAME_CHANNEL_ID, now=datetime.now(timezone.utc)
+    )
+    keepalive = GameKeepalive(GameLibraryIndex(), outbox)
+
+    start = time.perf_counter()
+    keepalive.load(threads)
+    result = {"threads": len(keepalive.index), "load_ms": (time.perf_counter() - start) * 1000}
+
+    start = time.perf_counter()
+    result["planned"] = len(keepalive.plan(datetime.now(timezone.utc)))
+    result["plan_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    result["bumped"] = await keepalive.run_pass()
+    result["pass_s"] = time.perf_counter() - start
+    result["api_calls"] = sum(api.calls.values())
+    result["rate_limited"] = api.limited
+
+    start = time.perf_counter()
+    result["second_pass_bumped"] = await keepalive.run_pass()
+    result["second_pass_ms"] = (time.perf_counter() - start) * 1000
+
+    outbox.stop()
+    metrics.stop()
+    result["loop_lag"] = loop_lag(metrics)
+    return result
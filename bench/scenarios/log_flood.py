@@ -0,0 +1,58 @@
+"""
+Description:
+A flood of log records from the event loop. Only putting the records on the
+queue should block the loop, formatting, writing and rotating the files
+happens on the listener thread.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from bench import loop_lag, scenario
+from bench.fakes import state_files
+from logs import setup_logging
+from metrics import Metrics
+
+
+@scenario("logging")
+async def run(scale: float) -> dict:
+    metrics = Metrics()
+    metrics.start(0.01)
+    count = max(1, int(100_000 * scale))
+    logger = logging.getLogger("discord_bot.bench")
+
+    with state_files() as directory:
+        listener = setup_logging(
+            ("discord_bot.bench",), filename=os.path.join(directory, "discord.log"), max_bytes=1024 * 1024
+        )
+        # The console handler of the listener would dominate, only the file is measured
+        listener.handlers = listener.handlers[1:]
+        blocked = 0.0
+        start = time.perf_counter()
+        for i in range(0, count, 1_000):
+            chunk = time.perf_counter()
+            for j in range(i, min(count, i + 1_000)):
+                logger.info("Executed %s command by %s (ID: %d)", "ping", "member", j)
+            blocked += time.perf_counter() - chunk
+            # Let the loop run between bursts, like between gateway events
+            await asyncio.sleep(0)
+        emitted = time.perf_counter() - start
+        listener.stop()
+        flushed = time.perf_counter() - start
+        for handler in listener.handlers:
+            handler.close()
+        logger.handlers.clear()
+        files = os.listdir(directory)
+
+    metrics.stop()
+    return {
+        "records": count,
+        "loop_blocked_s": blocked,
+        "per_record_us": blocked / count * 1e6,
+        "emit_s": emitted,
+        "flush_s": flushed,
+        "rotated_files": sum(name.endswith(".gz") for name in files),
+        "loop_lag": loop_lag(metrics),
+    }
@@ -0,0 +1,69 @@
+"""
+Description:
+What the latency histograms cost the code they measure: a bare observation, a
+timer block and a wrapped coroutine call against the unwrapped one. The wrap
+overhead is set against a call the bot really wraps, a warn lookup that misses
+the cache and reads SQLite, to check it stays under 1% of it.
+"""
+
+import time
+
+from bench import scenario
+from bench.fakes import open_database, state_files
+from metrics import Metrics
+
+SERVER = 42
+USERS = 50
+
+
+async def noop() -> None:
+    pass
+
+
+@scenario("metrics_overhead")
+async def run(scale: float) -> dict:
+    metrics = Metrics()
+    count = max(1, int(200_000 * scale))
+
+    start = time.perf_counter()
+    for _ in range(count):
+        metrics.observe("bench_seconds", "observe", 0.001)
+    observe = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        with metrics.timer("bench_seconds", "timer"):
+            pass
+    timer = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await noop()
+    bare = time.perf_counter() - start
+
+    wrapped = metrics.wrap(noop, "bench_seconds", "wrap")
+    start = time.perf_counter()
+    for _ in range(count):
+        await wrapped()
+    wrap = time.perf_counter() - start
+    overhead = (wrap - bare) / count
+
+    reads = max(1, count // 100)
+    with state_files() as directory:
+        database = await open_database(directory, cache_size=0)
+        await database.add_warns([(i % USERS, SERVER, 7, "spam") for i in range(USERS * 10)])
+        start = time.perf_counter()
+        for i in range(reads):
+            await database.get_warnings(i % USERS, SERVER)
+        read = (time.perf_counter() - start) / reads
+        await database.close()
+
+    return {
+        "calls": count,
+        "observe_us": observe / count * 1e6,
+        "timer_us": timer / count * 1e6,
+        "wrap_overhead_us": overhead * 1e6,
+        "db_read_us": read * 1e6,
+        "db_read_overhead_ratio": overhead / read,
+        "under_1_percent": overhead < read * 0.01,
+    }
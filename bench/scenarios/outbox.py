@@ -0,0 +1,70 @@
+"""
+Description:
+Command replies and keepalive bumps competing for the same channels of a local
+endpoint that rate limits like Discord, including the odd global 429. The
+outbox learns the buckets from the response headers, so replies should not
+wait behind the bumps and few requests should run into a 429.
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from bench import scenario, summarize
+from bench.fakes import FakeDiscordServer
+from outbox import COMMAND, MAINTENANCE, Outbox, route_key
+
+CHANNELS = (4001, 4002, 4003, 4004)
+
+
+@scenario("outbox")
+async def run(scale: float) -> dict:
+    server = FakeDiscordServer(limit=5, window=1.0, global_every=500)
+    url = await server.start()
+    outbox = Outbox()
+    outbox.start()
+    count = max(len(CHANNELS), int(400 * scale))
+    samples = {COMMAND: [], MAINTENANCE: []}
+    retries = 0
+
+    async with aiohttp.ClientSession(trace_configs=[outbox.trace_config()]) as session:
+
+        async def post(channel: int) -> dict:
+            nonlocal retries
+            while True:
+                async with session.post(f"{url}/channels/{channel}/messages", json={}) as response:
+                    body = await response.json()
+                    if response.status != 429:
+                        return body
+                retries += 1
+                await asyncio.sleep(body.get("retry_after", 0.05))
+
+        async def send(i: int, priority: int) -> None:
+            channel = CHANNELS[i % len(CHANNELS)]
+            start = time.perf_counter()
+            await outbox.request(
+                route_key("POST", f"/channels/{channel}/messages"),
+                lambda: post(channel),
+                priority=priority,
+            )
+            samples[priority].append(time.perf_counter() - start)
+
+        # A backlog of bumps is queued first, the replies trickle in while it drains
+        bumps = [asyncio.create_task(send(i, MAINTENANCE)) for i in range(count)]
+        replies = []
+        for i in range(count // 4):
+            replies.append(asyncio.create_task(send(i, COMMAND)))
+            await asyncio.sleep(0.1)
+        await asyncio.gather(*replies)
+        await asyncio.gather(*bumps)
+
+    outbox.stop()
+    await server.stop()
+    return {
+        "requests": server.requests,
+        "rate_limited": server.limited,
+        "retries": retries,
+        "command": summarize(samples[COMMAND]),
+        "maintenance": summarize(samples[MAINTENANCE]),
+    }
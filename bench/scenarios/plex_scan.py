@@ -0,0 +1,97 @@
+"""
+Description:
+The event loop lag of the weekly Plex scan on a 500 show library, before and
+after plexapi moved into the thread pool. Before is the scan plex_log used to
+run: every section search and the episodes of every show fetched with blocking
+calls on the event loop. After is the sync the job runs now, from an empty
+snapshot so it reads the whole library too, and then the week it lists.
+"""
+
+import asyncio
+import re
+import time
+from datetime import datetime, timedelta
+
+from bench import loop_lag, scenario
+from bench.fakes import FakePlexServer, fake_plex_client, open_database, state_files
+from metrics import Metrics
+from plex import PlexLibrary
+
+# The heartbeat of the Discord gateway is late once the loop is blocked for longer than this
+LAG_INTERVAL = 0.01
+
+
+def old_scan(server: FakePlexServer, logDate: datetime) -> tuple:
+    """
+    The Plex part of plex_log before the thread pool, on the fake server instead of a PlexServer.
+    """
+    movies = server.library.section("Movies")
+    series = server.library.section("Series")
+    newMovies = [
+        (m.title, m.year, m.editionTitle) for m in movies.search() if m.addedAt >= logDate
+    ]
+    newShows = []
+    for s in series.search(libtype="show"):
+        showEpisodes = {}
+        for e in s.episodes():
+            if e.addedAt >= logDate:
+                epTitle = re.search(r"[sS](\d{1,4})[eE](\d{1,4})", e.locations[0], re.IGNORECASE)
+                if epTitle:
+                    showEpisodes.setdefault(int(epTitle.group(1)), set()).add(int(epTitle.group(2)))
+        if showEpisodes:
+            newShows.append((s.title, s.year, showEpisodes))
+    return newMovies, newShows
+
+
+async def measure(server: FakePlexServer, scan) -> dict:
+    metrics = Metrics()
+    metrics.start(LAG_INTERVAL)
+    # A few samples of the idle loop first
+    await asyncio.sleep(LAG_INTERVAL * 5)
+    requests = server.requests
+    start = time.perf_counter()
+    movies, shows = await scan()
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(LAG_INTERVAL * 5)
+    metrics.stop()
+    return {
+        "scan_s": elapsed,
+        "plex_requests": server.requests - requests,
+        "new_movies": len(movies),
+        "new_shows": len(shows),
+        "loop_lag": loop_lag(metrics),
+    }
+
+
+@scenario("plex_scan")
+async def run(scale: float) -> dict:
+    shows = max(10, int(500 * scale))
+    now = datetime.now()
+    logDate = now - timedelta(days=7)
+    server = FakePlexServer(latency=0.002)
+    server.add(now - timedelta(days=3650), logDate, movies=shows * 4, shows=shows, episodes=shows * 20)
+    server.add(logDate, now, movies=shows // 5, shows=shows, episodes=shows * 2, seed=1)
+    result = {"shows": shows, "episodes": shows * 22, "plex_latency_ms": server.latency * 1000}
+
+    async def before() -> tuple:
+        return old_scan(server, logDate)
+
+    result["before"] = await measure(server, before)
+
+    plex = fake_plex_client(server)
+    with state_files() as directory:
+        database = await open_database(directory)
+        library = PlexLibrary(database=database)
+
+        async def after() -> tuple:
+            await library.sync(plex)
+            return await library.get_new_movies(logDate), await library.get_new_episodes(logDate)
+
+        result["after"] = await measure(server, after)
+        await database.close()
+    plex.close()
+
+    result["max_lag_ratio"] = result["before"]["loop_lag"]["max_ms"] / max(
+        result["after"]["loop_lag"]["max_ms"], 1e-3
+    )
+    return result
@@ -0,0 +1,117 @@
+"""
+Description:
+Several shard processes on one database, as bot.py spawns them. They migrate
+the database at the same time, elect a leader through the lease and only the
+leader runs the jobs. Halfway through the leader is killed without releasing
+the lease, another process should take over within about one lease TTL and
+no job run may happen twice.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import time
+from datetime import timedelta
+
+from bench import scenario
+from bench.fakes import open_database, state_files
+from scheduler import JobScheduler, Lease
+
+PROCESSES = 4
+TTL = 1.0
+INTERVAL = 0.2
+
+
+def worker(directory: str, seconds: float) -> None:
+    asyncio.run(work(directory, seconds))
+
+
+async def work(directory: str, seconds: float) -> None:
+    database = await open_database(directory)
+    holder = f"bench:{os.getpid()}"
+    async with database.transaction() as connection:
+        await connection.execute(
+            "CREATE TABLE IF NOT EXISTS bench_runs (holder TEXT, last_run REAL, started REAL)"
+        )
+
+    async def job(lastRun) -> None:
+        async with database.transaction() as connection:
+            await connection.execute(
+                "INSERT INTO bench_runs VALUES (?, ?, ?)",
+                (holder, lastRun.timestamp() if lastRun is not None else None, time.time()),
+            )
+
+    lease = Lease("singletons", holder, database=database, ttl=TTL)
+    scheduler = JobScheduler(database=database, lease=lease)
+    await scheduler.add_job("bench", job, timedelta(seconds=INTERVAL))
+    lease.start()
+    scheduler.start()
+    await asyncio.sleep(seconds)
+    scheduler.stop()
+    await lease.stop()
+    await database.close()
+
+
+def current_leader(path: str) -> str:
+    try:
+        with sqlite3.connect(path, timeout=10) as connection:
+            row = connection.execute(
+                "SELECT holder FROM leases WHERE name='singletons' AND expires_at>?", (time.time(),)
+            ).fetchone()
+    except sqlite3.OperationalError:
+        # The workers have not migrated the database yet
+        return None
+    return row[0] if row is not None else None
+
+
+@scenario("shards")
+async def run(scale: float) -> dict:
+    seconds = max(4.0, 20 * scale)
+    context = multiprocessing.get_context("spawn")
+    with state_files() as directory:
+        path = os.path.join(directory, "database.db")
+        workers = {}
+        try:
+            for i in range(PROCESSES):
+                process = context.Process(target=worker, args=(directory, seconds), name=f"shards-{i}")
+                process.start()
+                workers[f"bench:{process.pid}"] = process
+
+            # Starting a spawned process takes a while, wait for one of them to lead
+            leader = None
+            while leader is None:
+                if not any(process.is_alive() for process in workers.values()):
+                    raise RuntimeError("every worker exited before one took the lease")
+                await asyncio.sleep(0.1)
+                leader = current_leader(path)
+            await asyncio.sleep(seconds / 4)
+            killed = time.time()
+            workers[leader].kill()
+
+            for process in workers.values():
+                await asyncio.get_running_loop().run_in_executor(None, process.join)
+        finally:
+            for process in workers.values():
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+        with sqlite3.connect(path, timeout=10) as connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            runs, slots, holders = connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT COALESCE(last_run, 0)), COUNT(DISTINCT holder) FROM bench_runs"
+            ).fetchone()
+            takeover = connection.execute(
+                "SELECT MIN(started) FROM bench_runs WHERE holder!=? AND started>?", (leader, killed)
+            ).fetchone()[0]
+
+    return {
+        "processes": PROCESSES,
+        "user_version": version,
+        "runs": runs,
+        "duplicate_runs": runs - slots,
+        "leaders": holders,
+        "failover_s": takeover - killed if takeover is not None else None,
+        "lease_ttl_s": TTL,
+    }
@@ -0,0 +1,120 @@
+"""
+Description:
+The bot's boot sequence against a stubbed Discord client: the import of bot.py
+in a fresh interpreter, what the deferred imports would have added to it, and
+the real setup_hook with its database, cogs and jobs, reported per phase the
+way on_ready logs them. The gateway is not connected, its ready event is left
+out. The lazy cogs of config.json are loaded on their first command at the end,
+they ship in cogs.rar and are only measured when it was unpacked into cogs/.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime, timedelta
+
+import discord
+
+from bench import scenario, summarize
+from bench.fakes import ROOT, FakeHTTP, open_database, state_files, user_payload
+from startup import StartupTimer
+
+IMPORT_BOT = (
+    "import json, sys; import bot; "
+    "print(json.dumps({'phases': bot.startupTimer.phases, "
+    "'heavy': sorted(m for m in ('plexapi', 'playwright') if m in sys.modules)}))"
+)
+DEFERRED = ("plexapi.server", "playwright.async_api")
+
+
+def python(code: str) -> tuple:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return output, time.perf_counter() - start
+
+
+def deferred_import(module: str):
+    try:
+        output, _ = python(
+            f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        )
+    except subprocess.CalledProcessError:
+        # Not installed here
+        return None
+    return float(output) * 1000
+
+
+async def boot(directory: str) -> dict:
+    from bot import DiscordBot
+
+    bot = DiscordBot()
+    bot.startup = StartupTimer(time.perf_counter())
+    await bot._async_setup_hook()
+    state = bot._connection
+    user = user_payload(1238671384104800346, "fulcrum", bot=True)
+    state.user = discord.ClientUser(state=state, data=user)
+    http = FakeHTTP(user)
+    bot.http.request = http.request
+
+    # The same as DiscordBot.init_db, on the database of the state directory
+    async def init_db(self) -> None:
+        self.database = await open_database(
+            directory,
+            cache_size=self.config["warn_cache_size"],
+            cache_ttl=self.config["warn_cache_ttl"],
+        )
+        self.metrics.instrument(self.database, "database_seconds")
+
+    bot.init_db = types.MethodType(init_db, bot)
+    start = time.perf_counter()
+    await bot.setup_hook()
+    setup_hook = time.perf_counter() - start
+
+    lazy = {}
+    for cog, commands in bot.config["lazy_cogs"].items():
+        if not os.path.isfile(os.path.join(ROOT, "cogs", f"{cog}.py")):
+            lazy[cog] = None
+            continue
+        start = time.perf_counter()
+        await bot.load_lazy_command(commands[0])
+        lazy[cog] = (time.perf_counter() - start) * 1000
+
+    result = {
+        "setup_hook_ms": setup_hook * 1000,
+        "phases_ms": {name: seconds * 1000 for name, seconds in bot.startup.phases},
+        "cogs_loaded": sorted(bot.extensions),
+        "jobs": sorted(bot.scheduler.jobs),
+        "first_lazy_command_ms": lazy,
+        "discord_requests": sum(http.calls.values()),
+    }
+    await bot.close()
+    return result
+
+
+@scenario("startup")
+async def run(scale: float) -> dict:
+    imports = []
+    heavy = set()
+    for _ in range(max(3, int(10 * scale))):
+        output, _ = python(IMPORT_BOT)
+        report = json.loads(output)
+        imports.append(dict(report["phases"])["imports"])
+        heavy.update(report["heavy"])
+
+    with state_files(plex_date=datetime.now() - timedelta(days=3)) as directory:
+        result = await boot(directory)
+    # Let the tasks the bot cancelled on close wind down
+    await asyncio.sleep(0.1)
+
+    return {
+        "import_bot": summarize(imports),
+        "heavy_modules_imported": sorted(heavy),
+        "deferred_import_ms": {module: deferred_import(module) for module in DEFERRED},
+        **result,
+    }
@@ -0,0 +1,100 @@
+"""
+Description:
+Warning reports on a server with a million warnings: the time to the first page
+of the paged listing and of every aggregate report, and the resident memory
+while the whole table is streamed page by page, compared to reading it at once.
+"""
+
+import os
+import resource
+import time
+
+from bench import scenario
+from bench.fakes import open_database, state_files
+
+SERVER = 101
+USERS = 20_000
+MODERATORS = 40
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def timed(coroutine) -> tuple:
+    start = time.perf_counter()
+    result = await coroutine
+    return result, (time.perf_counter() - start) * 1000
+
+
+@scenario("warn_reports")
+async def run(scale: float) -> dict:
+    count = max(1_000, int(1_000_000 * scale))
+    result = {"warnings": count}
+    with state_files() as directory:
+        database = await open_database(directory)
+        start = time.perf_counter()
+        async with database.transaction() as connection:
+            await connection.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?) "
+                "INSERT INTO warns(id, user_id, server_id, moderator_id, reason, created_at) "
+                "SELECT i / ? + 1, 1000 + i % ?, ?, 1 + abs(random()) % ?, 'Spamming in #general', "
+                "datetime('now', '-' || (abs(random()) % 730) || ' days') FROM n",
+                (count, USERS, USERS, SERVER, MODERATORS),
+            )
+        await connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["fill_s"] = time.perf_counter() - start
+
+        _, result["first_page_ms"] = await timed(database.get_warnings_page(SERVER, limit=11))
+        page, _ = await timed(database.get_warnings_page(SERVER, limit=11))
+        _, result["next_page_ms"] = await timed(
+            database.get_warnings_page(SERVER, after=(page[-1][0], page[-1][5]), limit=11)
+        )
+        _, result["user_first_page_ms"] = await timed(
+            database.get_warnings_page(SERVER, user_id=1000 + USERS // 2, limit=11)
+        )
+        _, result["top_warned_ms"] = await timed(database.get_top_warned(SERVER, limit=100))
+        _, result["per_moderator_ms"] = await timed(database.get_warns_per_moderator(SERVER, limit=100))
+        for period in ("day", "week", "month"):
+            _, result[f"per_{period}_ms"] = await timed(
+                database.get_warns_over_time(SERVER, period=period)
+            )
+
+        # Streaming the whole server must keep the memory flat
+        baseline = rss_mb()
+        peak = baseline
+        streamed = 0
+        start = time.perf_counter()
+        async for page in database.iter_warnings(SERVER):
+            streamed += len(page)
+            peak = max(peak, rss_mb())
+        result["stream"] = {
+            "warnings": streamed,
+            "seconds": time.perf_counter() - start,
+            "rss_growth_mb": peak - baseline,
+        }
+
+        # What reading it in one go costs, last since it raises the peak of the process for good
+        before = peak_rss_mb()
+        start = time.perf_counter()
+        rows = await database.reader.execute(
+            "SELECT user_id, server_id, moderator_id, reason, strftime('%s', created_at), id "
+            "FROM warns WHERE server_id=? ORDER BY user_id, id",
+            (SERVER,),
+        )
+        async with rows as cursor:
+            everything = tuple(await cursor.fetchall())
+        result["fetchall"] = {
+            "warnings": len(everything),
+            "seconds": time.perf_counter() - start,
+            "peak_rss_growth_mb": peak_rss_mb() - before,
+        }
+        del everything
+        await database.close()
+    return result
@@ -0,0 +1,149 @@
+"""
+Description:
+A moderation burst against the warns table: concurrent adds, lookups, bulk
+lookups and removals, as the warning commands issue them. Runs once on the
+DatabaseManager of before the connection manager, one connection committing
+every write on the baseline schema, and once on the current one.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+import aiosqlite
+
+from bench import loop_lag, scenario, summarize
+from bench.fakes import ROOT, open_database, state_files
+from metrics import Metrics
+
+SERVERS = (101, 102, 103)
+# Share of each operation, the rest are single lookups
+ADDS = 0.30
+REMOVES = 0.10
+BULK = 0.05
+
+
+class OldDatabaseManager:
+    """
+    The warn queries the way DatabaseManager ran them before, on a single connection.
+    """
+
+    def __init__(self, connection: aiosqlite.Connection) -> None:
+        self.connection = connection
+
+    @classmethod
+    async def connect(cls, path: str) -> "OldDatabaseManager":
+        connection = await aiosqlite.connect(path)
+        with open(os.path.join(ROOT, "database", "schema.sql")) as file:
+            await connection.executescript(file.read())
+        await connection.commit()
+        return cls(connection)
+
+    async def add_warn(self, user_id: int, server_id: int, moderator_id: int, reason: str) -> int:
+        rows = await self.connection.execute(
+            "SELECT id FROM warns WHERE user_id=? AND server_id=? ORDER BY id DESC LIMIT 1",
+            (user_id, server_id),
+        )
+        async with rows as cursor:
+            result = await cursor.fetchone()
+            warn_id = result[0] + 1 if result is not None else 1
+            await self.connection.execute(
+                "INSERT INTO warns(id, user_id, server_id, moderator_id, reason) VALUES (?, ?, ?, ?, ?)",
+                (warn_id, user_id, server_id, moderator_id, reason),
+            )
+            await self.connection.commit()
+            return warn_id
+
+    async def remove_warn(self, warn_id: int, user_id: int, server_id: int) -> int:
+        await self.connection.execute(
+            "DELETE FROM warns WHERE id=? AND user_id=? AND server_id=?",
+            (warn_id, user_id, server_id),
+        )
+        await self.connection.commit()
+        rows = await self.connection.execute(
+            "SELECT COUNT(*) FROM warns WHERE user_id=? AND server_id=?", (user_id, server_id)
+        )
+        async with rows as cursor:
+            result = await cursor.fetchone()
+            return result[0] if result is not None else 0
+
+    async def get_warnings(self, user_id: int, server_id: int) -> list:
+        rows = await self.connection.execute(
+            "SELECT user_id, server_id, moderator_id, reason, strftime('%s', created_at), id FROM warns WHERE user_id=? AND server_id=?",
+            (user_id, server_id),
+        )
+        async with rows as cursor:
+            return list(await cursor.fetchall())
+
+    async def get_warnings_bulk(self, user_ids: list, server_id: int) -> dict:
+        # There was no bulk query, every user was looked up on their own
+        return {user_id: await self.get_warnings(user_id, server_id) for user_id in user_ids}
+
+    async def close(self) -> None:
+        await self.connection.close()
+
+
+async def burst(database, operations: int) -> dict:
+    """
+    Run the same seeded mix of warn commands against a database manager.
+    """
+    metrics = Metrics()
+    metrics.start(0.01)
+    rng = random.Random(0)
+    users = range(1, 1 + max(1, operations // 20))
+    samples = {"add": [], "get": [], "bulk": [], "remove": []}
+    warnIds = []
+
+    async def operation() -> None:
+        user, server = rng.choice(users), rng.choice(SERVERS)
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < ADDS:
+            kind = "add"
+            warnIds.append((await database.add_warn(user, server, 1, "spam"), user, server))
+        elif roll < ADDS + REMOVES and warnIds:
+            kind = "remove"
+            await database.remove_warn(*warnIds.pop(rng.randrange(len(warnIds))))
+        elif roll < ADDS + REMOVES + BULK:
+            kind = "bulk"
+            await database.get_warnings_bulk(rng.sample(users, min(25, len(users))), server)
+        else:
+            kind = "get"
+            await database.get_warnings(user, server)
+        samples[kind].append(time.perf_counter() - start)
+
+    # Commands arrive concurrently, a few dozen at a time
+    start = time.perf_counter()
+    remaining = operations
+    while remaining:
+        batch = min(50, remaining)
+        await asyncio.gather(*(operation() for _ in range(batch)))
+        remaining -= batch
+    elapsed = time.perf_counter() - start
+    metrics.stop()
+
+    result = {"ops_per_s": operations / elapsed}
+    result.update({kind: summarize(values) for kind, values in samples.items()})
+    result["loop_lag"] = loop_lag(metrics)
+    return result
+
+
+@scenario("warns")
+async def run(scale: float) -> dict:
+    operations = max(1, int(10_000 * scale))
+    result = {"operations": operations}
+
+    with state_files() as directory:
+        database = await OldDatabaseManager.connect(os.path.join(directory, "database.db"))
+        result["before"] = await burst(database, operations)
+        await database.close()
+
+    with state_files() as directory:
+        database = await open_database(directory)
+        result["after"] = await burst(database, operations)
+        result["after"]["cache"] = database.warn_cache.stats()
+        await database.close()
+
+    result["speedup"] = result["after"]["ops_per_s"] / result["before"]["ops_per_s"]
+    return result
@@ -0,0 +1,79 @@
+"""
+Description:
+add_warn, get_warnings and remove_warn on a table of a million warnings, before
+and after the warns table was migrated. Before is the baseline schema with the
+IDs and snowflakes as text and no index, queried the way DatabaseManager used
+to. The same file is then migrated and queried with the current DatabaseManager,
+its warn cache turned off so every lookup reads the table.
+"""
+
+import os
+import random
+import time
+
+from bench import scenario, summarize
+from bench.fakes import ROOT, state_files
+from bench.scenarios.warns import OldDatabaseManager
+from database import DatabaseManager
+
+SERVER = 101
+USERS = 20_000
+MODERATORS = 40
+
+
+async def operations(database, count: int) -> dict:
+    """
+    Time the three warn operations one at a time on random users.
+    """
+    rng = random.Random(0)
+    samples = {"add_warn": [], "get_warnings": [], "remove_warn": []}
+    for _ in range(count):
+        user = 1000 + rng.randrange(USERS)
+
+        start = time.perf_counter()
+        warn_id = await database.add_warn(user, SERVER, 1, "Spamming in #general")
+        samples["add_warn"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await database.get_warnings(user, SERVER)
+        samples["get_warnings"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await database.remove_warn(warn_id, user, SERVER)
+        samples["remove_warn"].append(time.perf_counter() - start)
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+@scenario("warns_1m")
+async def run(scale: float) -> dict:
+    count = max(1_000, int(1_000_000 * scale))
+    calls = max(10, int(100 * scale))
+    result = {"warnings": count, "calls": calls}
+    with state_files() as directory:
+        path = os.path.join(directory, "database.db")
+        database = await OldDatabaseManager.connect(path)
+        start = time.perf_counter()
+        await database.connection.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?) "
+            "INSERT INTO warns(id, user_id, server_id, moderator_id, reason, created_at) "
+            "SELECT i / ? + 1, 1000 + i % ?, ?, 1 + abs(random()) % ?, 'Spamming in #general', "
+            "datetime('now', '-' || (abs(random()) % 730) || ' days') FROM n",
+            (count, USERS, USERS, SERVER, MODERATORS),
+        )
+        await database.connection.commit()
+        result["fill_s"] = time.perf_counter() - start
+        result["before"] = await operations(database, calls)
+        await database.close()
+
+        database = await DatabaseManager.connect(path, cache_size=0)
+        start = time.perf_counter()
+        result["user_version"] = await database.migrate(os.path.join(ROOT, "database", "migrations"))
+        result["migrate_s"] = time.perf_counter() - start
+        result["after"] = await operations(database, calls)
+        await database.close()
+
+    result["speedup_p50"] = {
+        name: result["before"][name]["p50_ms"] / result["after"][name]["p50_ms"]
+        for name in result["after"]
+    }
+    return result
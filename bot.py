@@ -2,15 +2,30 @@
 Original Repository (Version: 6.1.0) Copyright © Krypton 2019-2023 - https://github.com/kkrypt0nn (https://krypton.ninja)
 """
 
-import json, logging, os, platform, random, sys, aiosqlite, discord, csv, re, datetime, time, asyncio
+import time
+importStart = time.perf_counter()
+
+import json, logging, os, platform, random, sys, discord, re, datetime, asyncio, multiprocessing
 from datetime import datetime, timedelta
-from plexapi.server import PlexServer
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from dotenv import load_dotenv
-from playwright.async_api import async_playwright, Playwright
 
+# playwright and plexapi are heavy, they are only imported once they are first used
 from database import DatabaseManager
+from plex import PlexLibrary
+from plex.changelog import changelog_blocks, pack_messages
+from plex.client import PlexClient
+from games import GAME_CHANNEL_ID, GameKeepalive, GameLibraryIndex
+from logs import setup_logging
+from metrics import Metrics
+from outbox import COMMAND, Outbox
+from scheduler import JobScheduler, Lease
+from startup import LazyCommandTree, StartupTimer
+from streams import BrowserPool, StreamScheduler
+
+startupTimer = StartupTimer(importStart)
+startupTimer.mark("imports", time.perf_counter() - importStart)
 
 if not os.path.isfile(f"{os.path.realpath(os.path.dirname(__file__))}/config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -24,62 +39,25 @@ intents = discord.Intents.default()
 # This enables traditional prefix commands to work
 intents.message_content = True
 
-# Setup both of the loggers
-class LoggingFormatter(logging.Formatter):
-    # Colors
-    black = "\x1b[30m"
-    red = "\x1b[31m"
-    green = "\x1b[32m"
-    yellow = "\x1b[33m"
-    blue = "\x1b[34m"
-    gray = "\x1b[38m"
-    # Styles
-    reset = "\x1b[0m"
-    bold = "\x1b[1m"
-
-    COLORS = {
-        logging.DEBUG: gray + bold,
-        logging.INFO: blue + bold,
-        logging.WARNING: yellow + bold,
-        logging.ERROR: red,
-        logging.CRITICAL: red + bold,
-    }
-
-    def format(self, record):
-        log_color = self.COLORS[record.levelno]
-        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
-        format = format.replace("(black)", self.black + self.bold)
-        format = format.replace("(reset)", self.reset)
-        format = format.replace("(levelcolor)", log_color)
-        format = format.replace("(green)", self.green + self.bold)
-        formatter = logging.Formatter(format, "%Y-%m-%d %H:%M:%S", style="{")
-        return formatter.format(record)
-
-
+# The loggers are set up by each bot process, see run_bot
 logger = logging.getLogger("discord_bot")
-logger.setLevel(logging.INFO)
 
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(LoggingFormatter())
-# File handler
-file_handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-file_handler_formatter = logging.Formatter(
-    "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
-)
-file_handler.setFormatter(file_handler_formatter)
+# The word after the prefix, discord.py reads the invoked command up to the first whitespace
+INVOKED_NAME = re.compile(r"\S*")
 
-# Add the handlers
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
 
-
-class DiscordBot(commands.Bot):
-    def __init__(self) -> None:
+class DiscordBot(commands.AutoShardedBot):
+    def __init__(self, shardIds: list = None, shardCount: int = None) -> None:
+        # The outbox reads the rate limit headers of every response discord.py gets
+        outbox = Outbox()
         super().__init__(
             command_prefix=commands.when_mentioned_or(config["prefix"]),
             intents=intents,
             help_command=None,
+            tree_cls=LazyCommandTree,
+            http_trace=outbox.trace_config(),
+            shard_ids=shardIds,
+            shard_count=shardCount,
         )
         
         # This creates custom bot variables so that we can access these variables in cogs more easily.
@@ -91,198 +69,157 @@ class DiscordBot(commands.Bot):
         self.logger = logger
         self.config = config
         self.database = None
+        self.plex_library = None
+        self.plex = None
+        self.game_library = None
+        self.game_keepalive = None
+        self.scheduler = None
+        self.scheduler_task = None
+        # How many changelog messages of a failed plex_log run went through, as (logDate, count)
+        self.plex_log_sent = (None, 0)
+        self.lease = None
+        self.streams = None
+        self.startup = startupTimer
+        self.metrics = Metrics()
+        self.outbox = outbox
+
+        # Lazy cogs are left out at startup and loaded the first time one of their commands is used.
+        # A cog that is not in cogs/ is skipped, its commands stay unknown instead of failing to load
+        cogsDir = f"{os.path.realpath(os.path.dirname(__file__))}/cogs"
+        self.lazy_commands = {
+            command: cog
+            for cog, cogCommands in self.config["lazy_cogs"].items()
+            if os.path.isfile(f"{cogsDir}/{cog}.py")
+            for command in cogCommands
+        }
+        self.lazy_lock = None
+
+        # Built on first use, the mention prefixes need the bot's user
+        self.prefixes = None
+        self.command_names = None
 
 
     # Initialize the database
     async def init_db(self) -> None:
-        async with aiosqlite.connect(
-            f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
-        ) as db:
+        self.database = await DatabaseManager.connect(
+            f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db",
+            cache_size=self.config["warn_cache_size"],
+            cache_ttl=self.config["warn_cache_ttl"],
+        )
+        async with self.database.transaction() as db:
             with open(
                 f"{os.path.realpath(os.path.dirname(__file__))}/database/schema.sql"
             ) as file:
                 await db.executescript(file.read())
-            await db.commit()
-
+        await self.database.migrate(
+            f"{os.path.realpath(os.path.dirname(__file__))}/database/migrations"
+        )
+        self.metrics.instrument(self.database, "database_seconds")
+        self.metrics.gauge("warn_cache", self.database.warn_cache.stats)
+
+    # Time every Discord API call, by route
+    def instrument_http(self) -> None:
+        request = self.http.request
+
+        async def timedRequest(route, **kwargs):
+            with self.metrics.timer("discord_seconds", f"{route.method} {route.path}"):
+                return await request(route, **kwargs)
+
+        self.http.request = timedRequest
+
+
+    # Load a single cog, a failing cog is logged and does not stop the others
+    async def load_cog(self, extension: str) -> None:
+        try:
+            with self.startup.phase(f"cog {extension}"):
+                await self.load_extension(f"cogs.{extension}")
+            self.logger.info(f"Loaded extension '{extension}'")
+        except Exception as e:
+            exception = f"{type(e).__name__}: {e}"
+            self.logger.error(
+                f"Failed to load extension {extension}\n{exception}"
+            )
 
-    # This code is run during bot startup, and loads all cogs
+    # This code is run during bot startup, and loads all cogs that are not lazy
     async def load_cogs(self) -> None:
-        for file in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs"):
-            if file.endswith(".py"):
-                extension = file[:-3]
-                try:
-                    await self.load_extension(f"cogs.{extension}")
-                    self.logger.info(f"Loaded extension '{extension}'")
-                except Exception as e:
-                    exception = f"{type(e).__name__}: {e}"
-                    self.logger.error(
-                        f"Failed to load extension {extension}\n{exception}"
-                    )
-
-    
-    # Keep game library threads active
-    @tasks.loop(minutes=1.0)
-    async def games_active(self) -> None:
-        print("Sorting task activated. 120 seconds to sort.")
-        await asyncio.sleep(120)
-        games = (bot.get_channel(1229215621875630151)).threads
-
-        gameDict = {}
-        for t in games:
-            if t.name != "Game Library Index":
-                gameDict[t.name] = t.id
-        sortDict = {key: gameDict[key] for key in sorted(gameDict)}
-        
-        idListOrdered = list(sortDict.values())
-        revListOrdered = reversed(idListOrdered)
+        lazyCogs = set(self.lazy_commands.values())
+        for cog in sorted(self.config["lazy_cogs"].keys() - lazyCogs):
+            self.logger.warning(f"Lazy cog '{cog}' is not in cogs/, its commands are left out")
+        await asyncio.gather(
+            *(
+                self.load_cog(file[:-3])
+                for file in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs")
+                if file.endswith(".py") and file[:-3] not in lazyCogs
+            )
+        )
 
-        idListOrig = list(gameDict.values())
-        
-        with open('gameDate.txt', 'r') as dateFile:
-            logDate = datetime.strptime(dateFile.read().strip(), "%Y-%m-%d")
+    # Load the lazy cog that provides a command, if it isn't loaded yet
+    async def load_lazy_command(self, name: str) -> bool:
+        cog = self.lazy_commands.get(name)
+        if cog is None:
+            return False
+        async with self.lazy_lock:
+            if f"cogs.{cog}" not in self.extensions:
+                await self.load_cog(cog)
+        return f"cogs.{cog}" in self.extensions
 
-        nowDate = datetime.now().strftime("%Y-%m-%d")
-        dateDiff = datetime.strptime(nowDate, "%Y-%m-%d") - logDate
-
-        if(gameDict != sortDict) or (dateDiff.days >=2):
-            print("Sort condition met.")
-            await asyncio.sleep(28)
-            for id in revListOrdered:
-                print(f"Sorting {id}")
-                await asyncio.sleep(28)
-                message = await (bot.get_channel(id)).send("Just checking to see if this thread is still active!")
-                await asyncio.sleep(28)
-                await message.delete()
-                await (bot.get_channel(id)).edit(archived=False, auto_archive_duration=10080)
-        
-                newTime = (datetime.strptime(nowDate, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-        
-                with open('gameDate.txt', 'w') as dateFile:
-                    dateFile.write(newTime)
-        else:
-            print("Sort condition not met.")
+    
+    # Periodically resync the game library index from the channel cache, in case a thread event was missed.
+    # It is first filled in before_scheduler, before any job runs
+    async def games_active(self, lastRun: datetime) -> None:
+        gameCh = self.get_channel(GAME_CHANNEL_ID)
+        if gameCh is not None:
+            self.game_keepalive.load(gameCh.threads)
 
 
-    # Keep game library threads active
+    # Start the scheduled video streams that are due
     @tasks.loop(minutes=1.0)
     async def vid_stream(self) -> None:
+        with self.metrics.timer("task_seconds", "vid_stream"):
+            started = self.streams.tick()
+        if started:
+            self.logger.info(f"Started {started} scheduled streams")
 
-        with open('schedule.csv', newline='') as schedFile:
-            sched = csv.reader(schedFile, delimiter=' ', quotechar='|')
-            nowDate = datetime.now()
-            for row in sched:
-                itemTime = (str(row[0]).split(",")[0]) + " " + (str(row[0]).split(",")[1])
-                itemTime = datetime.strptime(itemTime, "%Y-%m-%d %H:%M:%S")
-                itemCode = str(row[0]).split(",")[2]
-
-                if(nowDate >= itemTime):
-                    print("It's time!")
-                    async with async_playwright() as p:
-                        browser = await p.chromium.launch(headless=False)
-                        page = await browser.new_page()
-                        await page.goto("http://www.youtube.com")
-                        print(await page.title())
-                        await page.pause()
-                else:
-                    print("It's not time yet!")
-
-
-    # Check the date of the last Plex log, sending another one if enough time has passed.
-    @tasks.loop(minutes=1.0)
-    async def plex_log(self) -> None:
-        bigString = ""
-
-        def format_numbers(arr):
-            if not arr: return ""
-            
-            result = []
-            start = arr[0]
-            end = arr[0]
-
-            for num in arr[1:]:
-                if num == end + 1:
-                    end = num
-                else:
-                    if start == end:
-                        result.append(f"{start:02d}")
-                    else:
-                        result.append(f"{start:02d}-{end:02d}")
-                    start = num
-                    end = num
-            if start == end:
-                result.append(f"{start:02d}")
-            else:
-                result.append(f"{start:02d}-{end:02d}")
-            return ", ".join(result)
 
-        # Read the last log date
+    # The first changelog picks up from plexDate.txt, after that the scheduler keeps track of it
+    def plex_log_seed(self) -> dict:
+        if not os.path.isfile("plexDate.txt"):
+            return {"last_run": datetime.now() - timedelta(days=7)}
         with open('plexDate.txt', 'r') as dateFile:
             logDate = datetime.strptime(dateFile.read().strip(), "%Y-%m-%d")
-
-        nowDate = datetime.now().strftime("%Y-%m-%d")
-        dateDiff = datetime.strptime(nowDate, "%Y-%m-%d") - logDate
-
-        if dateDiff.days > 6:
-            baseurl = os.getenv("PLEX_URL")
-            token = os.getenv("PLEX_TOKEN")
-            plex = PlexServer(baseurl, token)
-            movies = plex.library.section('Movies')
-            series = plex.library.section('Series')
-
-            bigString += "```\n"
-            bigString += f"FULCRUM Automated Changelog // {logDate.strftime('%Y/%m/%d')} - {datetime.now().strftime('%Y/%m/%d')}\n\n"
-            bigString += "Movies\n------\n"
-            for m in movies.search():
-                if m.addedAt >= logDate:
-                    if m.editionTitle is None:
-                        bigString += f" + {m.title} ({m.year})\n"
-                    else:
-                        bigString += f" + {m.title} ({m.year}) - {m.editionTitle}\n"
-
-            bigString += "\nShows\n-----\n"
-            for s in series.search():
-                showEpisodes = {}
-                for e in s.episodes():
-                    if e.addedAt >= logDate:
-                        regexPattern = r"[sS](\d{1,4})[eE](\d{1,4})"
-                        epTitle = re.search(regexPattern, e.locations[0], re.IGNORECASE)
-                        if epTitle:
-                            season = epTitle.group(1)
-                            episode = epTitle.group(2)
-                            
-                            if season not in showEpisodes:
-                                showEpisodes[season] = []
-                            
-                            if int(episode) not in showEpisodes[season]:
-                                showEpisodes[season].append(int(episode))
-                                
-                if showEpisodes:
-                    bigString += f" o {s.title} ({s.year})\n"
-                    for season in sorted(showEpisodes.keys(), key=int):
-                        bigString += f"    + S{season}E{format_numbers(sorted(showEpisodes[season]))}\n"
-
-            bigString += "\nGames\n-----\n"
-            gameCh = bot.get_channel(1229215621875630151)
-            games = gameCh.threads
-            gSort = []
-
-            for g in games:
-                if (((g.created_at).strftime('%Y/%m/%d') > logDate.strftime('%Y/%m/%d')) and (g.name != "Game Library Index")):
-                    gSort.append(g.name)
-                    gSort.sort()  
-            for g2 in gSort: bigString += f" + {g2}\n"
-
-            bigString += "```"
-
-            newTime = (datetime.strptime(nowDate, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-
-
-            with open('plexDate.txt', 'w') as dateFile:
-                dateFile.write(newTime)
-
-            channel = bot.get_channel(1223505800706789378)
-            await channel.send(bigString)
-            #print(bigString)
+        return {"first_run": logDate + timedelta(days=7), "last_run": logDate}
+
+    # Send the weekly Plex changelog, covering everything added since the last one
+    async def plex_log(self, logDate: datetime) -> None:
+        # Only ask Plex for what was added since the last sync, everything older is already indexed.
+        # The first sync indexes the whole library, the changelog still only lists what came after logDate
+        await self.plex_library.sync(self.plex)
+
+        movies = await self.plex_library.get_new_movies(logDate)
+        shows = await self.plex_library.get_new_episodes(logDate)
+
+        # The game library index is kept sorted by creation time, no need to walk every thread
+        gSort = self.game_library.names_since(logDate)
+
+        # Busy weeks don't fit in one message, send the changelog in as many as it takes.
+        # The scheduler only moves the date forward once every message went through.
+        messages = list(pack_messages(changelog_blocks(logDate, datetime.now(), movies, shows, gSort)))
+        channel = self.get_channel(1223505800706789378) or await self.fetch_channel(1223505800706789378)
+        # The scheduler retries a failed run with the same logDate, pick up after the last message
+        # that went through instead of posting the start of the changelog again
+        sentDate, sent = self.plex_log_sent
+        if sentDate != logDate:
+            sent = 0
+        for message in messages[sent:]:
+            await self.outbox.send(channel, message)
+            sent += 1
+            self.plex_log_sent = (logDate, sent)
+        self.plex_log_sent = (None, 0)
+
+    # Drop the items that were removed from Plex from the library snapshot
+    async def plex_prune(self, lastRun: datetime) -> None:
+        removed = await self.plex_library.prune(self.plex)
+        self.logger.info(f"Dropped {removed} removed items from the Plex library snapshot")
 
     # Task to change bot status every minute
     @tasks.loop(minutes=1.0)
@@ -292,24 +229,43 @@ class DiscordBot(commands.Bot):
                     "Dreamcast", "GameCube", "Wii U", "PS1 games", "PS2 games",
                     "Toonami", "with dogs", "with Banjo", "the market", "chance",
                     "with rats", "with illegal fireworks"]
-        await self.change_presence(activity=discord.Game(random.choice(statuses)))
+        with self.metrics.timer("task_seconds", "status_task"):
+            await self.change_presence(activity=discord.Game(random.choice(statuses)))
 
-    ### Necessary pre-checks to prevent loops from beginning before bot is ready ###
+    # Write the metrics to a Prometheus text file for node_exporter's textfile collector
+    @tasks.loop(minutes=1.0)
+    async def metrics_export(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.metrics.write_prometheus, self.config["metrics_file"]
+        )
 
-    # Pre-check for Plex logger
-    @plex_log.before_loop
-    async def before_plex_log(self) -> None:
-        await self.wait_until_ready()
+    ### Necessary pre-checks to prevent loops from beginning before bot is ready ###
 
     # Pre-check for status loop
     @status_task.before_loop
     async def before_status_task(self) -> None:
         await self.wait_until_ready()
 
-    # Pre-check for keeping threads active
-    @games_active.before_loop
-    async def before_games_active(self) -> None:
+    # Pre-check for the job scheduler and the game library keepalive.
+    # They are singletons: only processes whose shards see the game library take part,
+    # and the lease picks the one of them that runs the jobs and the keepalive.
+    async def before_scheduler(self) -> None:
         await self.wait_until_ready()
+        gameCh = self.get_channel(GAME_CHANNEL_ID)
+        if self.shard_ids is not None and gameCh is None:
+            self.logger.info("The game library is on another process's shards, leaving the scheduled jobs to it")
+            return
+        # Fill the game library index before any job runs, plex_log may be due right away
+        # and games_active only resyncs it every few hours
+        if gameCh is not None:
+            self.game_keepalive.load(gameCh.threads)
+        self.lease.start()
+        self.scheduler.start()
+        while True:
+            await self.lease.wait()
+            self.game_keepalive.start(self.logger)
+            await self.lease.wait_lost()
+            self.game_keepalive.stop()
 
     # Pre-check for video stream scheduling
     #@vid_stream.before_loop
@@ -325,28 +281,165 @@ class DiscordBot(commands.Bot):
         self.logger.info(f"Running on: {platform.system()} {platform.release()} ({os.name})")
         self.logger.info("-------------------")
 
+        # Start the metrics first, so the rest of the startup is measured
+        self.instrument_http()
+        self.outbox.start()
+        self.metrics.start(self.config["metrics_lag_interval"])
+        if self.config["metrics_file"]:
+            self.metrics_export.start()
+
         # Initialize databse and cogs
-        await self.init_db()
-        await self.load_cogs()
+        self.lazy_lock = asyncio.Lock()
+        with self.startup.phase("database"):
+            await self.init_db()
+        with self.startup.phase("cogs"):
+            await self.load_cogs()
+
+        self.plex_library = PlexLibrary(database=self.database)
+        self.plex = PlexClient(
+            os.getenv("PLEX_URL"),
+            os.getenv("PLEX_TOKEN"),
+            workers=self.config["plex_workers"],
+            timeout=self.config["plex_timeout"],
+        )
+        self.metrics.instrument(self.plex, "plex_seconds", ("search_rows", "fetch_rows", "rating_keys"))
 
         # Initialize task loops
+        self.game_library = GameLibraryIndex(GAME_CHANNEL_ID)
+        self.game_keepalive = GameKeepalive(self.game_library, self.outbox)
+        self.metrics.instrument(self.game_keepalive, "task_seconds", ("run_pass",), prefix="game_keepalive")
+        self.streams = StreamScheduler(
+            "schedule.csv",
+            BrowserPool(size=self.config["stream_slots"], logger=self.logger),
+        )
         self.status_task.start()
-        self.plex_log.start()
-        self.games_active.start()
         #self.vid_stream.start()
 
-        # Start the database
-        self.database = DatabaseManager(
-            connection=await aiosqlite.connect(
-                f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
-            )
+        # Initialize scheduled jobs, their next run is kept in the database between restarts
+        self.lease = Lease(
+            "singletons",
+            f"{platform.node()}:{os.getpid()}",
+            database=self.database,
+            logger=self.logger,
+        )
+        self.scheduler = JobScheduler(
+            database=self.database, lease=self.lease, logger=self.logger
         )
+        await self.scheduler.add_job(
+            "plex_log",
+            self.metrics.wrap(self.plex_log, "task_seconds", "plex_log"),
+            timedelta(days=7),
+            **self.plex_log_seed(),
+        )
+        await self.scheduler.add_job(
+            "plex_prune",
+            self.metrics.wrap(self.plex_prune, "task_seconds", "plex_prune"),
+            timedelta(days=30),
+            first_run=datetime.now() + timedelta(days=30),
+        )
+        await self.scheduler.add_job(
+            "games_active",
+            self.metrics.wrap(self.games_active, "task_seconds", "games_active"),
+            timedelta(hours=6),
+        )
+        # Keep a reference so the task is not garbage collected, nothing awaits it so log what it raises
+        self.scheduler_task = asyncio.create_task(self.before_scheduler())
+        self.scheduler_task.add_done_callback(self.log_task_error)
+
+    # Log the error a background task ended with
+    def log_task_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            self.logger.error(f"Task {task.get_coro().__qualname__} failed\n{type(e).__name__}: {e}")
+
+    # This code is run when the bot shuts down
+    async def close(self) -> None:
+        self.metrics.stop()
+        self.outbox.stop()
+        if self.plex is not None:
+            self.plex.close()
+        if self.scheduler_task is not None:
+            self.scheduler_task.cancel()
+        if self.game_keepalive is not None:
+            self.game_keepalive.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.streams is not None:
+            await self.streams.pool.close()
+        if self.lease is not None:
+            await self.lease.stop()
+        if self.database is not None:
+            await self.database.close()
+        await super().close()
+
+    # This code is run once the gateway connection is ready
+    async def on_ready(self) -> None:
+        if self.startup is not None:
+            self.startup.mark("gateway ready", time.perf_counter() - self.startup.started)
+            self.logger.info(f"Startup timings:\n{self.startup.report()}")
+            self.startup = None
+
+    # The prefixes are the same for every message, resolve when_mentioned_or only once
+    def get_prefixes(self) -> tuple:
+        if self.prefixes is None:
+            self.prefixes = tuple(commands.when_mentioned_or(self.config["prefix"])(self, None))
+        return self.prefixes
+
+    async def get_prefix(self, message: discord.Message) -> list:
+        return list(self.get_prefixes())
+
+    # Names of every command and alias, lazy ones included, dropped whenever a command is added or removed
+    def get_command_names(self) -> frozenset:
+        if self.command_names is None:
+            self.command_names = frozenset(self.all_commands).union(self.lazy_commands)
+        return self.command_names
+
+    def add_command(self, command: commands.Command) -> None:
+        super().add_command(command)
+        self.command_names = None
+
+    def remove_command(self, name: str):
+        self.command_names = None
+        return super().remove_command(name)
+
+    # Get the command name a message invokes, parsed like discord.py does, or None if it has no prefix
+    def invoked_name(self, message: discord.Message):
+        content = message.content
+        prefixes = self.get_prefixes()
+        if not content.startswith(prefixes):
+            return None
+        for prefix in prefixes:
+            if content.startswith(prefix):
+                return INVOKED_NAME.match(content, len(prefix)).group()
 
     # This code is run any time someone sends any message
     async def on_message(self, message: discord.Message) -> None:
         if message.author == self.user or message.author.bot: return
+        # Nearly every message is chatter, only build a context for the ones that invoke a command
+        if self.invoked_name(message) not in self.get_command_names(): return
         await self.process_commands(message)
 
+    # Same as the default, but gives lazy cogs a chance to load before the command is looked up
+    async def process_commands(self, message: discord.Message) -> None:
+        if message.author.bot:
+            return
+        context = await self.get_context(message)
+        if context.command is None and context.invoked_with is not None:
+            if await self.load_lazy_command(context.invoked_with):
+                context = await self.get_context(message)
+        await self.invoke(context)
+
+    # Keep the game library index in sync with the channel
+    async def on_thread_create(self, thread: discord.Thread) -> None:
+        self.game_keepalive.add(thread)
+
+    async def on_thread_update(self, before: discord.Thread, after: discord.Thread) -> None:
+        self.game_keepalive.update(after)
+
+    # Raw event, so threads that dropped out of the cache are removed as well
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent) -> None:
+        self.game_keepalive.remove(payload.thread_id)
+
     # This code is run every time a command is successfully executed
     async def on_command_completion(self, context: Context) -> None:
         full_command_name = context.command.qualified_name
@@ -362,6 +455,21 @@ class DiscordBot(commands.Bot):
             )
 
 
+    # Time prefix commands, slash commands are timed from their interaction below
+    async def invoke(self, context: Context) -> None:
+        if context.command is None:
+            return await super().invoke(context)
+        with self.metrics.timer("command_seconds", context.command.qualified_name):
+            await super().invoke(context)
+
+    # Slash commands are timed from when Discord created the interaction, which is what the user waited
+    async def on_app_command_completion(self, interaction: discord.Interaction, command) -> None:
+        self.metrics.observe(
+            "command_seconds",
+            command.qualified_name,
+            (discord.utils.utcnow() - interaction.created_at).total_seconds(),
+        )
+
     # This code is run every time a command errors out
     async def on_command_error(self, context: Context, error) -> None:
         if isinstance(error, commands.CommandOnCooldown):
@@ -372,12 +480,12 @@ class DiscordBot(commands.Bot):
                 description=f"**Please slow down** - You can use this command again in {f'{round(hours)} hours' if round(hours) > 0 else ''} {f'{round(minutes)} minutes' if round(minutes) > 0 else ''} {f'{round(seconds)} seconds' if round(seconds) > 0 else ''}.",
                 color=0xE02B2B,
             )
-            await context.send(embed=embed)
+            await self.outbox.send(context, embed=embed, priority=COMMAND, coalesce=True)
         elif isinstance(error, commands.NotOwner):
             embed = discord.Embed(
                 description="You are not the owner of the bot!", color=0xE02B2B
             )
-            await context.send(embed=embed)
+            await self.outbox.send(context, embed=embed, priority=COMMAND, coalesce=True)
             if context.guild:
                 self.logger.warning(
                     f"{context.author} (ID: {context.author.id}) tried to execute an owner only command in the guild {context.guild.name} (ID: {context.guild.id}), but the user is not an owner of the bot."
@@ -393,7 +501,7 @@ class DiscordBot(commands.Bot):
                 + "` to execute this command!",
                 color=0xE02B2B,
             )
-            await context.send(embed=embed)
+            await self.outbox.send(context, embed=embed, priority=COMMAND, coalesce=True)
         elif isinstance(error, commands.BotMissingPermissions):
             embed = discord.Embed(
                 description="I am missing the permission(s) `"
@@ -401,7 +509,7 @@ class DiscordBot(commands.Bot):
                 + "` to fully perform this command!",
                 color=0xE02B2B,
             )
-            await context.send(embed=embed)
+            await self.outbox.send(context, embed=embed, priority=COMMAND, coalesce=True)
         elif isinstance(error, commands.MissingRequiredArgument):
             embed = discord.Embed(
                 title="Error!",
@@ -409,12 +517,50 @@ class DiscordBot(commands.Bot):
                 description=str(error).capitalize(),
                 color=0xE02B2B,
             )
-            await context.send(embed=embed)
+            await self.outbox.send(context, embed=embed, priority=COMMAND, coalesce=True)
         else:
             raise error
 
 
-# Load dotenv values and run the bot
-load_dotenv()
-bot = DiscordBot()
-bot.run(os.getenv("TOKEN"))
+# Run one bot process, with the given shards or with all of them
+def run_bot(shardIds: list = None, logFile: str = "discord.log") -> None:
+    # discord.py's own records go through the same queue
+    logListener = setup_logging(
+        ("discord_bot", "discord"),
+        filename=logFile,
+        max_bytes=config["log_max_bytes"],
+        backup_count=config["log_backups"],
+        json_format=config["log_json"],
+    )
+    load_dotenv()
+    bot = DiscordBot(shardIds, config["shard_count"])
+    try:
+        bot.run(os.getenv("TOKEN"), log_handler=None)
+    finally:
+        logListener.stop()
+
+
+# Spread the shards over worker processes if configured, they share the database
+if __name__ == "__main__":
+    processes = config["shard_processes"]
+    if processes <= 1:
+        run_bot()
+    elif not config["shard_count"]:
+        sys.exit("'shard_count' must be set in config.json to spread the shards over processes.")
+    else:
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(
+                target=run_bot,
+                args=(
+                    [s for s in range(config["shard_count"]) if s % processes == i],
+                    f"discord-{i}.log",
+                ),
+                name=f"shards-{i}",
+            )
+            for i in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
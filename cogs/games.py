@@ -0,0 +1,54 @@
+"""
+Description:
+Lookups in the game library forum, answered from the bot's game library index.
+"""
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.ext.commands import Context
+
+
+class Games(commands.Cog, name="games"):
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+    @commands.hybrid_command(
+        name="game",
+        description="Find a game in the game library.",
+    )
+    @app_commands.describe(name="The name of the game.")
+    async def game(self, context: Context, *, name: str) -> None:
+        """
+        Link the game library thread of a game.
+
+        :param context: The hybrid command context.
+        :param name: The name of the game, or the start of it.
+        """
+        threads = self.bot.game_library.search(name, limit=10)
+        if not threads:
+            embed = discord.Embed(
+                description=f"There is no game called `{name}` in the library.",
+                color=0xE02B2B,
+            )
+            await context.send(embed=embed)
+            return
+        embed = discord.Embed(
+            title="Game Library",
+            description="\n".join(thread.mention for thread in threads),
+            color=0xBEBEFE,
+        )
+        await context.send(embed=embed)
+
+    @game.autocomplete("name")
+    async def game_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list:
+        return [
+            app_commands.Choice(name=thread.name[:100], value=thread.name[:100])
+            for thread in self.bot.game_library.search(current, limit=25)
+        ]
+
+
+async def setup(bot) -> None:
+    await bot.add_cog(Games(bot))
@@ -0,0 +1,88 @@
+"""
+Description:
+Commands that answer from the local snapshot of the Plex library, without
+contacting the Plex server.
+"""
+
+from datetime import datetime
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from plex.changelog import changelog_blocks, pack_messages
+
+
+class Library(commands.Cog, name="library"):
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+    @commands.hybrid_command(
+        name="library",
+        description="Search the Plex library for a movie or show.",
+    )
+    @app_commands.describe(title="The start of the title to look for.")
+    async def library(self, context: Context, *, title: str) -> None:
+        """
+        Search the Plex library snapshot for movies and shows by the start of their title.
+
+        :param context: The hybrid command context.
+        :param title: The start of the title to look for.
+        """
+        results = await self.bot.plex_library.search(title, limit=15)
+        if not results:
+            embed = discord.Embed(
+                description=f"Nothing in the library starts with `{title}`.",
+                color=0xE02B2B,
+            )
+            await context.send(embed=embed)
+            return
+        lines = []
+        for itemType, itemTitle, year, editionTitle in results:
+            line = f"{itemTitle} ({year})"
+            if editionTitle is not None:
+                line += f" - {editionTitle}"
+            lines.append(f"{'🎬' if itemType == 'movie' else '📺'} {line}")
+        embed = discord.Embed(
+            title="Library", description="\n".join(lines), color=0xBEBEFE
+        )
+        await context.send(embed=embed)
+
+    @commands.hybrid_command(
+        name="changelog",
+        description="Rebuild the Plex changelog for a date range.",
+    )
+    @app_commands.describe(
+        since="The first day of the range, as YYYY-MM-DD.",
+        until="The day after the range, as YYYY-MM-DD. Defaults to now.",
+    )
+    @commands.is_owner()
+    async def changelog(
+        self, context: Context, since: str, until: str = None
+    ) -> None:
+        """
+        Rebuild the changelog for a date range from the library snapshot.
+
+        :param context: The hybrid command context.
+        :param since: The first day of the range.
+        :param until: The day after the range.
+        """
+        try:
+            start = datetime.strptime(since, "%Y-%m-%d")
+            end = datetime.strptime(until, "%Y-%m-%d") if until else datetime.now()
+        except ValueError:
+            embed = discord.Embed(
+                description="Dates must be given as `YYYY-MM-DD`.", color=0xE02B2B
+            )
+            await context.send(embed=embed)
+            return
+        movies = await self.bot.plex_library.get_new_movies(start, end)
+        shows = await self.bot.plex_library.get_new_episodes(start, end)
+        games = self.bot.game_library.names_since(start, end)
+        for message in pack_messages(changelog_blocks(start, end, movies, shows, games)):
+            await context.send(message)
+
+
+async def setup(bot) -> None:
+    await bot.add_cog(Library(bot))
@@ -0,0 +1,54 @@
+"""
+Description:
+Owner-only view of the latency histograms and gauges the bot collects.
+"""
+
+from discord import app_commands
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from plex.changelog import pack_messages
+
+
+class Stats(commands.Cog, name="stats"):
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+    @commands.hybrid_command(
+        name="stats",
+        description="Show task, command, database, Discord and Plex latency and the warn cache.",
+    )
+    @app_commands.describe(metric="Only show metrics whose name contains this, e.g. database.")
+    @commands.is_owner()
+    async def stats(self, context: Context, metric: str = "") -> None:
+        """
+        Show the count, percentiles and maximum of every latency histogram, in milliseconds,
+        then the current value of every gauge, e.g. the hits and misses of the warn cache.
+
+        :param context: The hybrid command context.
+        :param metric: Only show metrics whose name contains this.
+        """
+        blocks = [[f"{'metric':<44} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}\n"]]
+        for name, label, count, p50, p95, p99, peak in self.bot.metrics.summary():
+            if metric not in name:
+                continue
+            key = f"{name.removesuffix('_seconds')} {label}".strip()
+            blocks.append(
+                [
+                    f"{key[:44]:<44} {count:>7} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f} "
+                    f"{p99 * 1000:>8.1f} {peak * 1000:>8.1f}\n"
+                ]
+            )
+        gauges = [
+            f"{name[:44]:<44} {value:>7}\n"
+            for name, value in self.bot.metrics.gauge_values()
+            if metric in name
+        ]
+        if gauges:
+            blocks.append([f"\n{'gauge':<44} {'value':>7}\n", *gauges])
+        for message in pack_messages(blocks):
+            await context.send(message)
+
+
+async def setup(bot) -> None:
+    await bot.add_cog(Stats(bot))
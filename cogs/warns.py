@@ -0,0 +1,243 @@
+"""
+Description:
+Server-wide warning reports for moderators: every warning of the server or of a
+user, the most warned users, the warnings per moderator and over time. Results
+are shown in embeds with buttons to page through them, warnings are read one
+page at a time so a server with any number of them can be browsed.
+"""
+
+from datetime import datetime, timedelta
+from typing import Literal, Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.ext.commands import Context
+
+PER_PAGE = 10
+REPORT_LIMIT = 100
+BAR_WIDTH = 16
+
+
+class WarningPages:
+    def __init__(self, database, server_id: int, user_id: Optional[int] = None) -> None:
+        self.database = database
+        self.server_id = server_id
+        self.user_id = user_id
+        # The key every page seen so far starts after, the warnings themselves are not kept
+        self.starts = [None]
+
+    async def get_page(self, index: int) -> tuple:
+        """
+        Get the lines of a page and whether there is a next one.
+
+        :param index: The page, starting at 0. Only pages up to one after the furthest seen can be asked for.
+        """
+        warnings = await self.database.get_warnings_page(
+            self.server_id,
+            user_id=self.user_id,
+            after=self.starts[index],
+            limit=PER_PAGE + 1,
+        )
+        more = len(warnings) > PER_PAGE
+        warnings = warnings[:PER_PAGE]
+        if more and len(self.starts) == index + 1:
+            self.starts.append((warnings[-1][0], warnings[-1][5]))
+        lines = []
+        for warning in warnings:
+            # The user is in the title when only their warnings are listed
+            user = f"<@{warning[0]}> " if self.user_id is None else ""
+            lines.append(
+                f"• {user}warned by <@{warning[2]}>: **{warning[3]}** (<t:{warning[4]}>) - Warn ID #{warning[5]}"
+            )
+        return lines, more
+
+
+class ReportPages:
+    def __init__(self, lines: list) -> None:
+        self.lines = lines
+
+    async def get_page(self, index: int) -> tuple:
+        start = index * PER_PAGE
+        return self.lines[start : start + PER_PAGE], start + PER_PAGE < len(self.lines)
+
+
+class Paginator(discord.ui.View):
+    def __init__(self, author: discord.abc.User, title: str, source, empty: str) -> None:
+        super().__init__(timeout=180)
+        self.author = author
+        self.title = title
+        self.source = source
+        self.empty = empty
+        self.index = 0
+        self.message = None
+
+    async def render(self) -> discord.Embed:
+        lines, more = await self.source.get_page(self.index)
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = not more
+        embed = discord.Embed(
+            title=self.title, description="\n".join(lines) or self.empty, color=0xBEBEFE
+        )
+        embed.set_footer(text=f"Page {self.index + 1}")
+        return embed
+
+    async def start(self, context: Context) -> None:
+        embed = await self.render()
+        if self.previous_page.disabled and self.next_page.disabled:
+            await context.send(embed=embed)
+            return
+        self.message = await context.send(embed=embed, view=self)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.author.id
+
+    async def turn(self, interaction: discord.Interaction, step: int) -> None:
+        self.index += step
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.blurple)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.turn(interaction, -1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.blurple)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self.turn(interaction, 1)
+
+    async def on_timeout(self) -> None:
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+
+def since_days(days: Optional[int]) -> Optional[datetime]:
+    return datetime.now() - timedelta(days=days) if days else None
+
+
+def bar(count: int, peak: int) -> str:
+    return "█" * max(1, round(count / peak * BAR_WIDTH))
+
+
+class Warns(commands.Cog, name="warns"):
+    def __init__(self, bot) -> None:
+        self.bot = bot
+
+    @commands.hybrid_group(
+        name="warns",
+        description="Reports on the warnings of the server.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    async def warns(self, context: Context) -> None:
+        """
+        Reports on the warnings of the server.
+
+        :param context: The hybrid command context.
+        """
+        if context.invoked_subcommand is None:
+            embed = discord.Embed(
+                description="Please specify a subcommand.\n\n**Subcommands:**\n`list` - List the warnings of the server or of a user.\n`top` - Show the most warned users.\n`moderators` - Show how many warnings every moderator gave.\n`timeline` - Show the warnings per day, week or month.",
+                color=0xE02B2B,
+            )
+            await context.send(embed=embed)
+
+    @warns.command(
+        name="list",
+        description="Lists every warning of the server, or of a user.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    @app_commands.describe(user="Only list the warnings of this user.")
+    async def warns_list(self, context: Context, user: Optional[discord.User] = None) -> None:
+        """
+        Lists every warning of the server, or of a user, ordered by user and warn ID.
+
+        :param context: The hybrid command context.
+        :param user: Only list the warnings of this user.
+        """
+        pages = WarningPages(
+            self.bot.database, context.guild.id, user.id if user is not None else None
+        )
+        title = f"Warnings of {user}" if user is not None else f"Warnings in {context.guild.name}"
+        empty = "This user has no warnings." if user is not None else "Nobody has been warned yet."
+        await Paginator(context.author, title, pages, empty).start(context)
+
+    @warns.command(
+        name="top",
+        description="Shows the most warned users of the server.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    @app_commands.describe(days="Only count the warnings of the last days.")
+    async def warns_top(self, context: Context, days: Optional[int] = None) -> None:
+        """
+        Shows the most warned users of the server.
+
+        :param context: The hybrid command context.
+        :param days: Only count the warnings of the last days.
+        """
+        rows = await self.bot.database.get_top_warned(
+            context.guild.id, since=since_days(days), limit=REPORT_LIMIT
+        )
+        lines = [
+            f"**{rank}.** <@{user_id}> - {count} warnings"
+            for rank, (user_id, count) in enumerate(rows, 1)
+        ]
+        await Paginator(
+            context.author, "Most warned users", ReportPages(lines), "Nobody has been warned."
+        ).start(context)
+
+    @warns.command(
+        name="moderators",
+        description="Shows how many warnings every moderator of the server gave.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    @app_commands.describe(days="Only count the warnings of the last days.")
+    async def warns_moderators(self, context: Context, days: Optional[int] = None) -> None:
+        """
+        Shows how many warnings every moderator of the server gave, busiest first.
+
+        :param context: The hybrid command context.
+        :param days: Only count the warnings of the last days.
+        """
+        rows = await self.bot.database.get_warns_per_moderator(
+            context.guild.id, since=since_days(days), limit=REPORT_LIMIT
+        )
+        lines = [f"<@{moderator_id}> - {count} warnings" for moderator_id, count in rows]
+        await Paginator(
+            context.author, "Warnings per moderator", ReportPages(lines), "Nobody has been warned."
+        ).start(context)
+
+    @warns.command(
+        name="timeline",
+        description="Shows how many warnings were given per day, week or month.",
+    )
+    @commands.has_permissions(manage_messages=True)
+    @app_commands.describe(
+        period="Count the warnings per day, week or month.",
+        days="Only count the warnings of the last days.",
+    )
+    async def warns_timeline(
+        self,
+        context: Context,
+        period: Literal["day", "week", "month"] = "month",
+        days: Optional[int] = None,
+    ) -> None:
+        """
+        Shows how many warnings were given per day, week or month, most recent first.
+
+        :param context: The hybrid command context.
+        :param period: Count the warnings per day, week or month.
+        :param days: Only count the warnings of the last days.
+        """
+        rows = await self.bot.database.get_warns_over_time(
+            context.guild.id, period=period, since=since_days(days), limit=REPORT_LIMIT
+        )
+        peak = max((count for _, count in rows), default=1)
+        lines = [f"`{key}` {bar(count, peak)} {count}" for key, count in reversed(rows)]
+        await Paginator(
+            context.author, f"Warnings per {period}", ReportPages(lines), "Nobody has been warned."
+        ).start(context)
+
+
+async def setup(bot) -> None:
+    await bot.add_cog(Warns(bot))
@@ -7,44 +7,283 @@ Version: 6.1.0
 """
 
 
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
 import aiosqlite
 
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # With WAL, NORMAL only syncs at checkpoints and is still safe against corruption
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+READER_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA query_only=ON",
+)
+# What the warns over time report groups by, created_at is stored as "YYYY-MM-DD HH:MM:SS"
+PERIODS = {
+    "day": "substr(created_at, 1, 10)",
+    "week": "strftime('%Y-W%W', created_at)",
+    "month": "substr(created_at, 1, 7)",
+}
+WARN_COLUMNS = "user_id, server_id, moderator_id, reason, strftime('%s', created_at), id"
+
+
+class WarningCache:
+    def __init__(self, size: int = 256, ttl: float = 300.0, clock=time.monotonic) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        # Bumped on every write, a lookup that raced with a write does not get cached
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, warnings: tuple, version: int) -> None:
+        if self.size <= 0 or version != self.version:
+            return
+        self.entries[key] = (self.clock() + self.ttl, warnings)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: tuple) -> None:
+        self.version += 1
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
 
 class DatabaseManager:
-    def __init__(self, *, connection: aiosqlite.Connection) -> None:
+    def __init__(
+        self,
+        *,
+        connection: aiosqlite.Connection,
+        reader: Optional[aiosqlite.Connection] = None,
+        batch_delay: float = 0.002,
+        cache_size: int = 256,
+        cache_ttl: float = 300.0,
+    ) -> None:
         self.connection = connection
+        self.reader = reader if reader is not None else connection
+        self.batch_delay = batch_delay
+        # Warnings per (server_id, user_id), kept in sync by every write to warns
+        self.warn_cache = WarningCache(cache_size, cache_ttl)
+        self._write_lock = asyncio.Lock()
+        self._pending = []
+        self._flusher = None
 
-    async def add_warn(
-        self, user_id: int, server_id: int, moderator_id: int, reason: str
-    ) -> int:
+    @classmethod
+    async def connect(cls, path: str, **kwargs) -> "DatabaseManager":
         """
-        This function will add a warn to the database.
+        This function will open the writer connection in WAL mode and a separate reader connection.
 
-        :param user_id: The ID of the user that should be warned.
-        :param reason: The reason why the user should be warned.
+        :param path: The path of the database file.
+        """
+        connection = await aiosqlite.connect(path)
+        for pragma in WRITER_PRAGMAS:
+            await connection.execute(pragma)
+        reader = None
+        if path != ":memory:":
+            reader = await aiosqlite.connect(f"file:{path}?mode=ro", uri=True)
+            for pragma in READER_PRAGMAS:
+                await reader.execute(pragma)
+        return cls(connection=connection, reader=reader, **kwargs)
+
+    async def migrate(self, directory: str) -> int:
         """
-        rows = await self.connection.execute(
-            "SELECT id FROM warns WHERE user_id=? AND server_id=? ORDER BY id DESC LIMIT 1",
+        This function will apply the migrations that have not run yet, each in its own transaction.
+
+        Migrations are the ``NNNN_name.sql`` files of the directory, the number of the last applied
+        one is kept in the ``user_version`` of the database. Several processes can migrate the same
+        database at once, a migration another process applied first is skipped.
+
+        :param directory: The directory holding the migration files.
+        :return: The schema version after migrating.
+        """
+        async with self.transaction() as connection:
+            rows = await connection.execute("PRAGMA user_version")
+            async with rows as cursor:
+                version = (await cursor.fetchone())[0]
+            for file in sorted(os.listdir(directory)):
+                if not file.endswith(".sql") or int(file.split("_")[0]) <= version:
+                    continue
+                version = int(file.split("_")[0])
+                with open(os.path.join(directory, file)) as migration:
+                    script = migration.read()
+                # The version is checked again once the write lock is held, the guard's CHECK fails
+                # and rolls the migration back if another process got there first
+                try:
+                    await connection.executescript(
+                        "BEGIN IMMEDIATE;\n"
+                        "CREATE TEMP TABLE migration_guard (pending CHECK (pending));\n"
+                        f"INSERT INTO migration_guard SELECT user_version<{version} FROM pragma_user_version;\n"
+                        "DROP TABLE temp.migration_guard;\n"
+                        f"{script}\nPRAGMA user_version={version};\nCOMMIT;"
+                    )
+                except Exception:
+                    await connection.rollback()
+                    rows = await connection.execute("PRAGMA user_version")
+                    async with rows as cursor:
+                        if (await cursor.fetchone())[0] < version:
+                            raise
+        return version
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            await self._flusher
+        if self.reader is not self.connection:
+            await self.reader.close()
+        await self.connection.close()
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        This function will give exclusive use of the writer connection and commit once the block is done.
+        """
+        async with self._write_lock:
+            try:
+                yield self.connection
+            except BaseException:
+                await self.connection.rollback()
+                raise
+            await self.connection.commit()
+
+    async def write(self, func):
+        """
+        This function will run a write operation, grouped with the others that arrive at the same time
+        into a single transaction, so they share one commit.
+
+        :param func: A coroutine function that gets the writer connection and does the write.
+        :return: Whatever the function returned.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((func, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.batch_delay)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            results = []
+            try:
+                async with self.transaction() as connection:
+                    # Take the write lock up front, so other processes make this wait instead of failing
+                    await connection.execute("BEGIN IMMEDIATE")
+                    for func, future in batch:
+                        # Each write gets its own savepoint, so a failing one does not undo the others
+                        await connection.execute("SAVEPOINT write")
+                        try:
+                            results.append((future, await func(connection), None))
+                        except Exception as e:
+                            await connection.execute("ROLLBACK TO write")
+                            results.append((future, None, e))
+                        await connection.execute("RELEASE write")
+            except Exception as e:
+                # The commit itself failed, none of the writes went through
+                results = [(future, None, e) for _, future in batch]
+            # Only answer once the commit is done, so callers never see uncommitted writes
+            for future, result, error in results:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    async def _add_warn(
+        self,
+        connection: aiosqlite.Connection,
+        user_id: int,
+        server_id: int,
+        moderator_id: int,
+        reason: str,
+    ) -> int:
+        # The next ID is taken and inserted by the same statement, so it can't be handed out twice
+        rows = await connection.execute(
+            "INSERT INTO warns(id, user_id, server_id, moderator_id, reason) "
+            "SELECT COALESCE(MAX(id), 0) + 1, ?, ?, ?, ? FROM warns WHERE server_id=? AND user_id=? "
+            "RETURNING id",
             (
                 user_id,
                 server_id,
+                moderator_id,
+                reason,
+                server_id,
+                user_id,
             ),
         )
         async with rows as cursor:
             result = await cursor.fetchone()
-            warn_id = result[0] + 1 if result is not None else 1
-            await self.connection.execute(
-                "INSERT INTO warns(id, user_id, server_id, moderator_id, reason) VALUES (?, ?, ?, ?, ?)",
-                (
-                    warn_id,
-                    user_id,
-                    server_id,
-                    moderator_id,
-                    reason,
-                ),
+            return result[0]
+
+    async def add_warn(
+        self, user_id: int, server_id: int, moderator_id: int, reason: str
+    ) -> int:
+        """
+        This function will add a warn to the database.
+
+        :param user_id: The ID of the user that should be warned.
+        :param reason: The reason why the user should be warned.
+        """
+        try:
+            return await self.write(
+                lambda connection: self._add_warn(
+                    connection, user_id, server_id, moderator_id, reason
+                )
             )
-            await self.connection.commit()
-            return warn_id
+        finally:
+            self.warn_cache.invalidate((server_id, user_id))
+
+    async def add_warns(self, warns: list) -> list:
+        """
+        This function will add many warns to the database in a single transaction, e.g. to import them.
+
+        :param warns: A list of (user_id, server_id, moderator_id, reason) tuples.
+        :return: The IDs of the added warns, in the same order.
+        """
+
+        async def add(connection: aiosqlite.Connection) -> list:
+            return [await self._add_warn(connection, *warn) for warn in warns]
+
+        try:
+            return await self.write(add)
+        finally:
+            self.warn_cache.invalidate(*{(warn[1], warn[0]) for warn in warns})
 
     async def remove_warn(self, warn_id: int, user_id: int, server_id: int) -> int:
         """
@@ -54,44 +293,226 @@ class DatabaseManager:
         :param user_id: The ID of the user that was warned.
         :param server_id: The ID of the server where the user has been warned
         """
-        await self.connection.execute(
-            "DELETE FROM warns WHERE id=? AND user_id=? AND server_id=?",
+
+        async def remove(connection: aiosqlite.Connection) -> int:
+            await connection.execute(
+                "DELETE FROM warns WHERE server_id=? AND user_id=? AND id=?",
+                (
+                    server_id,
+                    user_id,
+                    warn_id,
+                ),
+            )
+            rows = await connection.execute(
+                "SELECT COUNT(*) FROM warns WHERE server_id=? AND user_id=?",
+                (
+                    server_id,
+                    user_id,
+                ),
+            )
+            async with rows as cursor:
+                result = await cursor.fetchone()
+                return result[0] if result is not None else 0
+
+        try:
+            return await self.write(remove)
+        finally:
+            self.warn_cache.invalidate((server_id, user_id))
+
+    async def get_warnings(self, user_id: int, server_id: int) -> tuple:
+        """
+        This function will get all the warnings of a user.
+
+        :param user_id: The ID of the user that should be checked.
+        :param server_id: The ID of the server that should be checked.
+        :return: A tuple of all the warnings of the user.
+        """
+        warnings = self.warn_cache.get((server_id, user_id))
+        if warnings is not None:
+            return warnings
+        version = self.warn_cache.version
+        rows = await self.reader.execute(
+            f"SELECT {WARN_COLUMNS} FROM warns WHERE server_id=? AND user_id=? ORDER BY id",
             (
-                warn_id,
-                user_id,
                 server_id,
-            ),
-        )
-        await self.connection.commit()
-        rows = await self.connection.execute(
-            "SELECT COUNT(*) FROM warns WHERE user_id=? AND server_id=?",
-            (
                 user_id,
-                server_id,
             ),
         )
         async with rows as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result is not None else 0
+            warnings = tuple(await cursor.fetchall())
+        self.warn_cache.put((server_id, user_id), warnings, version)
+        return warnings
 
-    async def get_warnings(self, user_id: int, server_id: int) -> list:
+    async def get_warnings_bulk(self, user_ids: list, server_id: int) -> dict:
         """
-        This function will get all the warnings of a user.
+        This function will get all the warnings of several users with a single query.
 
-        :param user_id: The ID of the user that should be checked.
+        :param user_ids: The IDs of the users that should be checked.
         :param server_id: The ID of the server that should be checked.
-        :return: A list of all the warnings of the user.
+        :return: A dictionary of user ID to the tuple of their warnings, users without warnings are left out.
         """
-        rows = await self.connection.execute(
-            "SELECT user_id, server_id, moderator_id, reason, strftime('%s', created_at), id FROM warns WHERE user_id=? AND server_id=?",
-            (
-                user_id,
-                server_id,
-            ),
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            warnings = self.warn_cache.get((server_id, user_id))
+            if warnings is None:
+                missing.append(user_id)
+            elif warnings:
+                result[user_id] = warnings
+        if not missing:
+            return result
+        version = self.warn_cache.version
+        found = {user_id: [] for user_id in missing}
+        rows = await self.reader.execute(
+            f"SELECT {WARN_COLUMNS} FROM warns "
+            f"WHERE server_id=? AND user_id IN ({','.join('?' * len(missing))}) ORDER BY user_id, id",
+            (server_id, *missing),
+        )
+        async with rows as cursor:
+            async for row in cursor:
+                found[row[0]].append(row)
+        for user_id, warnings in found.items():
+            warnings = tuple(warnings)
+            self.warn_cache.put((server_id, user_id), warnings, version)
+            if warnings:
+                result[user_id] = warnings
+        return result
+
+    async def get_warnings_page(
+        self,
+        server_id: int,
+        *,
+        user_id: Optional[int] = None,
+        after: Optional[tuple] = None,
+        limit: int = 10,
+    ) -> list:
+        """
+        This function will get a page of the warnings of a server, or of one user, ordered by user and warn ID.
+
+        A page starts after the last warning of the previous one instead of at an offset,
+        so every page is a lookup in the warns index no matter how far in it is.
+
+        :param server_id: The ID of the server that should be checked.
+        :param user_id: Only get the warnings of this user.
+        :param after: The (user ID, warn ID) of the last warning of the previous page, None for the first page.
+        :param limit: The maximum number of warnings on the page.
+        :return: A list of warnings, in the same format as get_warnings.
+        """
+        query = f"SELECT {WARN_COLUMNS} FROM warns WHERE server_id=?"
+        parameters = [server_id]
+        # Within one user the warn ID alone is the key, so the index range ends with their warnings
+        if user_id is not None:
+            query += " AND user_id=? AND id>?"
+            parameters.extend((user_id, after[1] if after is not None else 0))
+        elif after is not None:
+            query += " AND (user_id, id)>(?, ?)"
+            parameters.extend(after)
+        rows = await self.reader.execute(
+            f"{query} ORDER BY user_id, id LIMIT ?", (*parameters, limit)
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def iter_warnings(
+        self, server_id: int, *, user_id: Optional[int] = None, page_size: int = 500
+    ):
+        """
+        This function will stream the warnings of a server, or of one user, a page at a time.
+
+        Only one page is in memory at a time, however many warnings there are.
+
+        :param server_id: The ID of the server that should be checked.
+        :param user_id: Only get the warnings of this user.
+        :param page_size: How many warnings are read per query.
+        :return: An async generator of lists of warnings, in the same format as get_warnings.
+        """
+        after = None
+        while True:
+            page = await self.get_warnings_page(
+                server_id, user_id=user_id, after=after, limit=page_size
+            )
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1][0], page[-1][5])
+
+    async def get_top_warned(
+        self, server_id: int, *, since: Optional[datetime] = None, limit: int = 10
+    ) -> list:
+        """
+        This function will get the users of a server with the most warnings.
+
+        :param server_id: The ID of the server that should be checked.
+        :param since: Only count the warnings given from then on.
+        :param limit: The maximum number of users.
+        :return: A list of (user ID, number of warnings) tuples, most warned first.
+        """
+        return await self._warn_report(
+            "SELECT user_id, COUNT(*) FROM warns WHERE server_id=?{since} "
+            "GROUP BY user_id ORDER BY COUNT(*) DESC, user_id LIMIT ?",
+            server_id,
+            since,
+            limit,
+        )
+
+    async def get_warns_per_moderator(
+        self, server_id: int, *, since: Optional[datetime] = None, limit: int = 25
+    ) -> list:
+        """
+        This function will count the warnings every moderator of a server gave.
+
+        :param server_id: The ID of the server that should be checked.
+        :param since: Only count the warnings given from then on.
+        :param limit: The maximum number of moderators.
+        :return: A list of (moderator ID, number of warnings) tuples, busiest first.
+        """
+        return await self._warn_report(
+            "SELECT moderator_id, COUNT(*) FROM warns WHERE server_id=?{since} "
+            "GROUP BY moderator_id ORDER BY COUNT(*) DESC, moderator_id LIMIT ?",
+            server_id,
+            since,
+            limit,
+        )
+
+    async def get_warns_over_time(
+        self,
+        server_id: int,
+        *,
+        period: str = "month",
+        since: Optional[datetime] = None,
+        limit: int = 120,
+    ) -> list:
+        """
+        This function will count the warnings of a server per day, week or month.
+
+        :param server_id: The ID of the server that should be checked.
+        :param period: Either "day", "week" or "month".
+        :param since: Only count the warnings given from then on.
+        :param limit: The maximum number of periods, the most recent ones are kept.
+        :return: A list of (period, number of warnings) tuples, oldest first. Periods without warnings are left out.
+        """
+        rows = await self._warn_report(
+            f"SELECT {PERIODS[period]} AS period, COUNT(*) FROM warns "
+            "WHERE server_id=?{since} GROUP BY period ORDER BY period DESC LIMIT ?",
+            server_id,
+            since,
+            limit,
+        )
+        return rows[::-1]
+
+    async def _warn_report(
+        self, query: str, server_id: int, since: Optional[datetime], limit: int
+    ) -> list:
+        parameters = [server_id]
+        if since is not None:
+            # created_at is stored in UTC by CURRENT_TIMESTAMP
+            parameters.append(
+                since.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            )
+        rows = await self.reader.execute(
+            query.format(since=" AND created_at>=?" if since is not None else ""),
+            (*parameters, limit),
         )
         async with rows as cursor:
-            result = await cursor.fetchall()
-            result_list = []
-            for row in result:
-                result_list.append(row)
-            return result_list
+            return await cursor.fetchall()
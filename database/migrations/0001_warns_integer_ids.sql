@@ -0,0 +1,43 @@
+-- Store the IDs as integers and index warns by (server_id, user_id, id), so every warn
+-- query and the ID allocation are index lookups instead of full table scans.
+-- The copies below look up every row's duplicates and highest ID, without an index on the old
+-- table that is a scan per row. It goes away with the old table.
+CREATE INDEX `warns_old_server_user_id` ON `warns` (`server_id`, `user_id`, `id`);
+
+CREATE TABLE `warns_new` (
+  `id` INTEGER NOT NULL,
+  `user_id` INTEGER NOT NULL,
+  `server_id` INTEGER NOT NULL,
+  `moderator_id` INTEGER NOT NULL,
+  `reason` varchar(255) NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO `warns_new` (`id`, `user_id`, `server_id`, `moderator_id`, `reason`, `created_at`)
+SELECT CAST(`id` AS INTEGER), CAST(`user_id` AS INTEGER), CAST(`server_id` AS INTEGER),
+       CAST(`moderator_id` AS INTEGER), `reason`, `created_at`
+FROM `warns` w
+WHERE w.rowid = (
+  SELECT MIN(d.rowid) FROM `warns` d
+  WHERE d.`server_id` = w.`server_id` AND d.`user_id` = w.`user_id` AND d.`id` = w.`id`
+);
+
+-- Two moderators warning the same user at once could get the same ID, move the later ones
+-- past the user's highest ID.
+INSERT INTO `warns_new` (`id`, `user_id`, `server_id`, `moderator_id`, `reason`, `created_at`)
+SELECT (
+         SELECT MAX(CAST(m.`id` AS INTEGER)) FROM `warns` m
+         WHERE m.`server_id` = w.`server_id` AND m.`user_id` = w.`user_id`
+       ) + ROW_NUMBER() OVER (PARTITION BY w.`server_id`, w.`user_id` ORDER BY w.rowid),
+       CAST(`user_id` AS INTEGER), CAST(`server_id` AS INTEGER),
+       CAST(`moderator_id` AS INTEGER), `reason`, `created_at`
+FROM `warns` w
+WHERE w.rowid <> (
+  SELECT MIN(d.rowid) FROM `warns` d
+  WHERE d.`server_id` = w.`server_id` AND d.`user_id` = w.`user_id` AND d.`id` = w.`id`
+);
+
+DROP TABLE `warns`;
+ALTER TABLE `warns_new` RENAME TO `warns`;
+
+CREATE UNIQUE INDEX `warns_server_user_id` ON `warns` (`server_id`, `user_id`, `id`);
@@ -0,0 +1,3 @@
+-- Case insensitive title indexes, so prefix searches of the library snapshot never scan the table.
+CREATE INDEX IF NOT EXISTS `plex_items_title` ON `plex_items` (`type`, `title` COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS `plex_shows_title` ON `plex_shows` (`title` COLLATE NOCASE);
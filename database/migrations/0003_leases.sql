@@ -0,0 +1,6 @@
+-- Leases elect the one process that runs the singleton jobs when the shards are spread over processes.
+CREATE TABLE IF NOT EXISTS `leases` (
+  `name` varchar(50) NOT NULL PRIMARY KEY,
+  `holder` varchar(100) NOT NULL,
+  `expires_at` real NOT NULL
+);
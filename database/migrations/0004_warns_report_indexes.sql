@@ -0,0 +1,3 @@
+-- Server-wide warn reports group by moderator and by time, these let them read an index instead of the table.
+CREATE INDEX IF NOT EXISTS `warns_server_moderator` ON `warns` (`server_id`, `moderator_id`);
+CREATE INDEX IF NOT EXISTS `warns_server_created` ON `warns` (`server_id`, `created_at`);
@@ -5,4 +5,37 @@ CREATE TABLE IF NOT EXISTS `warns` (
   `moderator_id` varchar(20) NOT NULL,
   `reason` varchar(255) NOT NULL,
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS `plex_items` (
+  `rating_key` int(11) NOT NULL PRIMARY KEY,
+  `type` varchar(10) NOT NULL,
+  `title` varchar(255) NOT NULL,
+  `title_sort` varchar(255),
+  `year` int(4),
+  `edition_title` varchar(255),
+  `show_key` int(11),
+  `season` varchar(4),
+  `episode` int(4),
+  `added_at` int(11) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS `plex_items_added_at` ON `plex_items` (`type`, `added_at`);
+
+CREATE TABLE IF NOT EXISTS `plex_shows` (
+  `rating_key` int(11) NOT NULL PRIMARY KEY,
+  `title` varchar(255) NOT NULL,
+  `title_sort` varchar(255),
+  `year` int(4)
+);
+
+CREATE TABLE IF NOT EXISTS `plex_sync` (
+  `section` varchar(10) NOT NULL PRIMARY KEY,
+  `high_water` int(11) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS `jobs` (
+  `name` varchar(50) NOT NULL PRIMARY KEY,
+  `next_run` real NOT NULL,
+  `last_run` real
+);
@@ -0,0 +1,336 @@
+"""
+Description:
+Keeps the game library forum threads alive and sorted alphabetically. The forum
+lists threads by latest activity, so bumping them in reverse alphabetical order
+puts them in order. The index is kept up to date from the gateway thread events
+and only the threads that are out of order or about to auto-archive are bumped.
+The same index answers game lookups and "created since" queries with bisects.
+"""
+
+import asyncio
+import bisect
+import functools
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import discord
+
+from outbox import MAINTENANCE, route_key
+
+GAME_CHANNEL_ID = 1229215621875630151
+INDEX_THREAD_NAME = "Game Library Index"
+BUMP_MESSAGE = "Just checking to see if this thread is still active!"
+
+
+def last_activity(thread: discord.Thread) -> datetime:
+    """
+    Get the time of the latest activity in a thread from the cached thread data.
+
+    :param thread: The thread to check.
+    """
+    times = [thread.created_at, thread.archive_timestamp]
+    if thread.last_message_id:
+        times.append(discord.utils.snowflake_time(thread.last_message_id))
+    return max(t for t in times if t is not None)
+
+
+def normalize(name: str) -> str:
+    """
+    Normalize a game name for lookups, ignoring case, accents and repeated whitespace.
+
+    :param name: The name to normalize.
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def created_at(thread: discord.Thread) -> datetime:
+    # Threads created before 2022-01-09 have no creation time, their ID still has one
+    return thread.created_at or discord.utils.snowflake_time(thread.id)
+
+
+class GameLibraryIndex:
+    def __init__(self, channel_id: int = GAME_CHANNEL_ID) -> None:
+        self.channel_id = channel_id
+        self.threads = {}
+        # (name, id) pairs sorted by name, the order the threads should be listed in
+        self.order = []
+        # (normalized name, id) pairs, for lookups
+        self.keys = []
+        # (creation timestamp, id) pairs, for "created since" queries
+        self.created = []
+        # What each thread was indexed under, the cached thread is renamed in place
+        self._entries = {}
+
+    def __contains__(self, thread_id: int) -> bool:
+        return thread_id in self.threads
+
+    def __len__(self) -> int:
+        return len(self.threads)
+
+    def is_game(self, thread: discord.Thread) -> bool:
+        return thread.parent_id == self.channel_id and thread.name != INDEX_THREAD_NAME
+
+    def _entry(self, thread: discord.Thread) -> tuple:
+        return (
+            (thread.name, thread.id),
+            (normalize(thread.name), thread.id),
+            (created_at(thread).timestamp(), thread.id),
+        )
+
+    def load(self, threads: list) -> None:
+        """
+        Build the index from the threads currently cached for the channel.
+
+        :param threads: The active threads of the game library channel.
+        """
+        self.threads = {t.id: t for t in threads if self.is_game(t)}
+        self._entries = {id: self._entry(t) for id, t in self.threads.items()}
+        entries = self._entries.values()
+        self.order = sorted(e[0] for e in entries)
+        self.keys = sorted(e[1] for e in entries)
+        self.created = sorted(e[2] for e in entries)
+
+    def add(self, thread: discord.Thread) -> bool:
+        """
+        Index a new game thread.
+
+        :return: Whether the thread was added.
+        """
+        if not self.is_game(thread) or thread.id in self.threads:
+            return False
+        self.threads[thread.id] = thread
+        entry = self._entries[thread.id] = self._entry(thread)
+        for index, item in zip((self.order, self.keys, self.created), entry):
+            bisect.insort(index, item)
+        return True
+
+    def remove(self, thread_id: int) -> bool:
+        """
+        Drop a thread from the index.
+
+        :return: Whether the thread was indexed.
+        """
+        if self.threads.pop(thread_id, None) is None:
+            return False
+        entry = self._entries.pop(thread_id)
+        for index, item in zip((self.order, self.keys, self.created), entry):
+            del index[bisect.bisect_left(index, item)]
+        return True
+
+    def update(self, thread: discord.Thread) -> bool:
+        """
+        Pick up a change to a thread, moving it in the index if it was renamed.
+
+        :return: Whether the index changed, or the thread is an indexed game thread.
+        """
+        indexed = thread.id in self.threads
+        if indexed and (
+            not self.is_game(thread) or self._entries[thread.id][0][0] != thread.name
+        ):
+            self.remove(thread.id)
+        if not self.add(thread) and thread.id in self.threads:
+            self.threads[thread.id] = thread
+        return indexed or thread.id in self.threads
+
+    def created_since(self, since: datetime, until: Optional[datetime] = None) -> list:
+        """
+        Get the threads created within a date range.
+
+        :param since: The start of the range.
+        :param until: The end of the range, exclusive. Defaults to everything after since.
+        :return: The threads, oldest first.
+        """
+        lo = bisect.bisect_left(self.created, (since.timestamp(),))
+        hi = (
+            bisect.bisect_left(self.created, (until.timestamp(),))
+            if until is not None
+            else len(self.created)
+        )
+        return [self.threads[id] for _, id in self.created[lo:hi]]
+
+    def names_since(self, since: datetime, until: Optional[datetime] = None) -> list:
+        """
+        Get the sorted names of the games added within a date range, as listed in the changelog.
+        """
+        return sorted(t.name for t in self.created_since(since, until))
+
+    def search(self, query: str, limit: int = 25) -> list:
+        """
+        Look up games by name, names starting with the query come first, then names containing it.
+
+        :param query: The name to look for, case and accents are ignored.
+        :param limit: The maximum number of threads.
+        :return: The matching threads.
+        """
+        key = normalize(query)
+        found = []
+        for name, id in self.keys[bisect.bisect_left(self.keys, (key,)) :]:
+            if not name.startswith(key) or len(found) == limit:
+                break
+            found.append(id)
+        if len(found) < limit and key:
+            prefixed = set(found)
+            for name, id in self.keys:
+                if key in name and id not in prefixed:
+                    found.append(id)
+                    if len(found) == limit:
+                        break
+        return [self.threads[id] for id in found]
+
+
+class GameKeepalive:
+    def __init__(
+        self,
+        index: GameLibraryIndex,
+        outbox,
+        *,
+        margin: timedelta = timedelta(days=1),
+        max_idle: timedelta = timedelta(hours=6),
+        min_idle: timedelta = timedelta(minutes=1),
+        debounce: float = 5.0,
+    ) -> None:
+        self.index = index
+        self.outbox = outbox
+        self.margin = margin
+        self.max_idle = max_idle
+        self.min_idle = min_idle
+        self.debounce = debounce
+        # Our own bumps, so a pass does not depend on the gateway echoing them back
+        self.touched = {}
+        self.bumps = 0
+        self._wake = asyncio.Event()
+        self._runner = None
+
+    def activity(self, thread: discord.Thread) -> datetime:
+        touched = self.touched.get(thread.id)
+        activity = last_activity(thread)
+        return max(activity, touched) if touched is not None else activity
+
+    def load(self, threads: list) -> None:
+        self.index.load(threads)
+        self.refresh()
+
+    def add(self, thread: discord.Thread) -> None:
+        if self.index.add(thread):
+            self.refresh()
+
+    def remove(self, thread_id: int) -> None:
+        self.touched.pop(thread_id, None)
+        if self.index.remove(thread_id):
+            self.refresh()
+
+    def update(self, after: discord.Thread) -> None:
+        if self.index.update(after):
+            self.refresh()
+
+    def plan(self, now: datetime) -> list:
+        """
+        Work out which threads have to be bumped, in the order they have to be bumped.
+
+        A bump makes a thread the most recent one, so the bumped threads are always a prefix of
+        the alphabetical order and the rest must already be ordered by activity.
+
+        :param now: The current time, timezone aware.
+        :return: The thread IDs to bump, last alphabetically first.
+        """
+        order, threads = self.index.order, self.index.threads
+        activity = [self.activity(threads[id]) for _, id in order]
+        count = 0
+        for i in range(len(activity) - 1):
+            if activity[i] <= activity[i + 1]:
+                count = i + 1
+        for i, (_, id) in enumerate(order):
+            thread = threads[id]
+            deadline = activity[i] + timedelta(minutes=thread.auto_archive_duration)
+            if thread.archived or deadline - self.margin <= now:
+                count = max(count, i + 1)
+        return [id for _, id in reversed(order[:count])]
+
+    def next_check(self, now: datetime) -> float:
+        """
+        Get how many seconds there are until the next thread gets close to auto-archiving.
+
+        :param now: The current time, timezone aware.
+        """
+        delay = self.max_idle
+        for thread in self.index.threads.values():
+            deadline = self.activity(thread) + timedelta(
+                minutes=thread.auto_archive_duration
+            )
+            delay = min(delay, deadline - self.margin - now)
+        return max(delay, self.min_idle).total_seconds()
+
+    def refresh(self) -> None:
+        """
+        Wake the keepalive so it checks the order again.
+        """
+        self._wake.set()
+
+    async def bump(self, thread: discord.Thread) -> None:
+        # Bumps are maintenance traffic, the outbox holds them back while other messages are waiting
+        async def request(method: str, path: str, factory):
+            return await self.outbox.request(
+                route_key(method, path), factory, priority=MAINTENANCE
+            )
+
+        unarchive = functools.partial(
+            thread.edit, archived=False, auto_archive_duration=10080
+        )
+        archived = thread.archived
+        if archived:
+            await request("PATCH", f"/channels/{thread.id}", unarchive)
+        message = await request(
+            "POST",
+            f"/channels/{thread.id}/messages",
+            functools.partial(thread.send, BUMP_MESSAGE),
+        )
+        await request(
+            "DELETE", f"/channels/{thread.id}/messages/{message.id}", message.delete
+        )
+        if not archived:
+            await request("PATCH", f"/channels/{thread.id}", unarchive)
+        self.touched[thread.id] = message.created_at
+        self.bumps += 1
+
+    async def run_pass(self) -> int:
+        """
+        Bump every thread that needs it, one after the other.
+
+        :return: The number of threads bumped.
+        """
+        ids = self.plan(datetime.now(timezone.utc))
+        for id in ids:
+            thread = self.index.threads.get(id)
+            if thread is not None:
+                await self.bump(thread)
+        return len(ids)
+
+    async def run(self, logger=None) -> None:
+        # One pass at a time, events that arrive during a pass are handled by the next one
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), self.next_check(datetime.now(timezone.utc))
+                )
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                bumped = await self.run_pass()
+                if bumped and logger is not None:
+                    logger.info(f"Bumped {bumped} game library threads")
+            except discord.HTTPException as e:
+                if logger is not None:
+                    logger.error(f"Game library keepalive failed\n{type(e).__name__}: {e}")
+
+    def start(self, logger=None) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self.run(logger))
+
+    def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
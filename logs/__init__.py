@@ -0,0 +1,148 @@
+"""
+Description:
+Non-blocking logging. Loggers only put records on a queue, a listener thread
+formats them and writes them to the console and to a size-rotated log file whose
+old generations are gzipped. The file can be written as JSON lines instead.
+"""
+
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class LoggingFormatter(logging.Formatter):
+    # Colors
+    black = "\x1b[30m"
+    red = "\x1b[31m"
+    green = "\x1b[32m"
+    yellow = "\x1b[33m"
+    blue = "\x1b[34m"
+    gray = "\x1b[38m"
+    # Styles
+    reset = "\x1b[0m"
+    bold = "\x1b[1m"
+
+    COLORS = {
+        logging.DEBUG: gray + bold,
+        logging.INFO: blue + bold,
+        logging.WARNING: yellow + bold,
+        logging.ERROR: red,
+        logging.CRITICAL: red + bold,
+    }
+
+    def __init__(self) -> None:
+        super().__init__()
+        # One formatter per level, built once instead of for every record
+        self.formatters = {
+            level: logging.Formatter(self.layout(color), DATE_FORMAT, style="{")
+            for level, color in self.COLORS.items()
+        }
+
+    def layout(self, log_color: str) -> str:
+        format = "(black){asctime}(reset) (levelcolor){levelname:<8}(reset) (green){name}(reset) {message}"
+        format = format.replace("(black)", self.black + self.bold)
+        format = format.replace("(reset)", self.reset)
+        format = format.replace("(levelcolor)", log_color)
+        format = format.replace("(green)", self.green + self.bold)
+        return format
+
+    def format(self, record):
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            formatter = self.formatters[logging.INFO]
+        return formatter.format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as file, gzip.open(dest, "wb") as compressed:
+        shutil.copyfileobj(file, compressed)
+    os.remove(source)
+
+
+class RecordQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves the process, so the record is passed on as is instead of
+        # being formatted and copied here, only the message is rendered while args are current
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename: str, max_bytes: int, backup_count: int) -> None:
+        # Appends, so the log of the previous run is kept until it rotates out
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = gzip_rotator
+
+
+def setup_logging(
+    names: tuple,
+    *,
+    filename: str,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    json_format: bool = False,
+    level: int = logging.INFO,
+) -> QueueListener:
+    """
+    Send the records of the given loggers through a queue to the console and a rotated log file.
+
+    :param names: The names of the loggers to set up.
+    :param filename: The path of the log file.
+    :param max_bytes: The size the log file is rotated at.
+    :param backup_count: How many compressed old log files are kept.
+    :param json_format: Write the log file as JSON lines.
+    :param level: The level of the loggers.
+    :return: The started listener, stop it on shutdown so the queue is flushed.
+    """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(LoggingFormatter())
+    file_handler = CompressedRotatingFileHandler(filename, max_bytes, backup_count)
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(
+            logging.Formatter(
+                "[{asctime}] [{levelname:<8}] {name}: {message}", DATE_FORMAT, style="{"
+            )
+        )
+
+    # None of the formats use the caller, thread or process, skip collecting them for every record
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    records = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(records)
+    for name in names:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+    listener = QueueListener(
+        records, console_handler, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    return listener
@@ -0,0 +1,231 @@
+"""
+Description:
+Low overhead latency histograms for the hot paths of the bot: task iterations,
+commands, database methods, Discord and Plex calls, and the event loop lag.
+Observations go into fixed exponential buckets, so recording one is a bisect
+and a few additions, and percentiles are estimated from the buckets.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import functools
+import inspect
+import os
+import time
+
+# 0.1 ms to ~52 s, every bucket twice as wide as the one before it
+BUCKETS = tuple(0.0001 * 2**i for i in range(20))
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+
+        :param q: The quantile, between 0 and 1.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self, clock=time.perf_counter) -> None:
+        self.clock = clock
+        # (metric name, label) to Histogram
+        self.histograms = {}
+        # Gauge name prefix to a callable returning the current values
+        self.gauges = {}
+        self._sampler = None
+
+    def histogram(self, name: str, label: str = "") -> Histogram:
+        histogram = self.histograms.get((name, label))
+        if histogram is None:
+            histogram = self.histograms[(name, label)] = Histogram()
+        return histogram
+
+    def observe(self, name: str, label: str, seconds: float) -> None:
+        self.histogram(name, label).observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, label: str = ""):
+        """
+        Time the code inside the block, also when it raises.
+
+        :param name: The metric name, e.g. ``command_seconds``.
+        :param label: What is being timed, e.g. the name of the command.
+        """
+        histogram = self.histogram(name, label)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            histogram.observe(self.clock() - start)
+
+    def wrap(self, func, name: str, label: str):
+        """
+        Wrap a coroutine function so every call of it is timed.
+
+        :param func: The coroutine function to time.
+        :param name: The metric name.
+        :param label: The label the calls are recorded under.
+        """
+        histogram = self.histogram(name, label)
+        clock = self.clock
+
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(clock() - start)
+
+        return timed
+
+    def instrument(self, obj, name: str, methods=None, prefix: str = None) -> None:
+        """
+        Time the coroutine methods of an object, by replacing them on the instance.
+
+        :param obj: The object to instrument.
+        :param name: The metric name.
+        :param methods: The names of the methods to time. Defaults to every public coroutine method.
+        :param prefix: Put in front of the method names in the labels.
+        """
+        if methods is None:
+            methods = [
+                method
+                for method, func in inspect.getmembers(type(obj), inspect.iscoroutinefunction)
+                if not method.startswith("_")
+            ]
+        for method in methods:
+            label = f"{prefix}.{method}" if prefix else method
+            setattr(obj, method, self.wrap(getattr(obj, method), name, label))
+
+    def gauge(self, name: str, read) -> None:
+        """
+        Export the values a callable returns as gauges, read whenever the metrics are shown.
+
+        :param name: The metric name prefix, e.g. ``warn_cache``.
+        :param read: Returns a dict of value names to numbers, e.g. ``WarningCache.stats``.
+        """
+        self.gauges[name] = read
+
+    def gauge_values(self) -> list:
+        """
+        Read every gauge.
+
+        :return: A list of (name, value) tuples, sorted by name.
+        """
+        return [
+            (f"{name}_{key}", value)
+            for name, read in sorted(self.gauges.items())
+            for key, value in sorted(read().items())
+        ]
+
+    async def sample_lag(self, interval: float = 0.5) -> None:
+        """
+        Measure how late the event loop wakes up from a sleep, for as long as the task runs.
+
+        :param interval: How long to sleep between samples, in seconds.
+        """
+        loop = asyncio.get_running_loop()
+        histogram = self.histogram("loop_lag_seconds")
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            histogram.observe(max(0.0, loop.time() - start - interval))
+
+    def start(self, interval: float = 0.5) -> None:
+        if self._sampler is None or self._sampler.done():
+            self._sampler = asyncio.create_task(self.sample_lag(interval))
+
+    def stop(self) -> None:
+        if self._sampler is not None:
+            self._sampler.cancel()
+
+    def summary(self) -> list:
+        """
+        Summarize every histogram that has observations.
+
+        :return: A list of (name, label, count, p50, p95, p99, max) tuples, sorted by name and label.
+        """
+        return [
+            (
+                name,
+                label,
+                histogram.count,
+                histogram.quantile(0.5),
+                histogram.quantile(0.95),
+                histogram.quantile(0.99),
+                histogram.max,
+            )
+            for (name, label), histogram in sorted(self.histograms.items())
+            if histogram.count
+        ]
+
+    def prometheus(self) -> str:
+        """
+        Render every histogram and gauge in the Prometheus text format.
+        """
+        lines = []
+        previous = None
+        for (name, label), histogram in sorted(self.histograms.items()):
+            metric = f"fulcrum_{name}"
+            if name != previous:
+                lines.append(f"# TYPE {metric} histogram")
+                previous = name
+            labels = [f'label="{_escape(label)}"'] if label else []
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = f'le="{bound:g}"'
+                lines.append(f"{metric}_bucket{_labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{metric}_bucket{_labels(labels, le)} {histogram.count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        for name, value in self.gauge_values():
+            lines.append(f"# TYPE fulcrum_{name} gauge")
+            lines.append(f"fulcrum_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write the metrics to a Prometheus text file, replacing it atomically for scrapers.
+
+        :param path: Where to write the file.
+        """
+        temp = f"{path}.tmp"
+        with open(temp, "w") as file:
+            file.write(self.prometheus())
+        os.replace(temp, path)
+
+
+def _labels(labels: list, *extra: str) -> str:
+    labels = labels + list(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
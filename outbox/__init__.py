@@ -0,0 +1,290 @@
+"""
+Description:
+Central queue for the messages the bot sends on its own. Requests wait in a
+priority queue, command replies go ahead of the changelog and the changelog goes
+ahead of keepalive bumps. A request is only handed to discord.py once its route
+has budget left according to the rate limit headers of the previous responses,
+so background traffic waits in the queue instead of in front of the replies.
+Maintenance traffic also leaves the last request of every window to the others.
+Identical error embeds to the same channel are only sent once per window.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import json
+import re
+import time
+
+import aiohttp
+import discord
+
+COMMAND = 0
+NORMAL = 1
+MAINTENANCE = 2
+
+# Requests a route keeps back from maintenance traffic in every window, so a reply never waits for the reset
+MAINTENANCE_HEADROOM = 1
+
+# IDs after the major parameter share the route's bucket, e.g. every message of a channel
+MINOR_ID = re.compile(r"(?<=/messages/)\d+|(?<=/reactions/)[^/]+")
+API_PREFIX = re.compile(r"^/api/v\d+")
+
+
+def route_key(method: str, path: str) -> str:
+    """
+    Get the key of a route, the method and the path with everything but the major parameter masked.
+
+    :param method: The HTTP method.
+    :param path: The request path, with or without the /api/vN prefix.
+    """
+    return f"{method.upper()} {MINOR_ID.sub('{id}', API_PREFIX.sub('', path))}"
+
+
+class RouteBucket:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self) -> None:
+        # Unknown until the first response of the route came back
+        self.remaining = None
+        self.reset_at = 0.0
+
+    def update(self, remaining: int, reset_after: float, now: float) -> None:
+        self.remaining = remaining
+        self.reset_at = now + reset_after
+
+    def delay(self, now: float, reserve: int = 0) -> float:
+        """
+        How long until the route can take a request.
+
+        :param now: The current time of the clock.
+        :param reserve: How many of the requests left in the window are kept back for others.
+        """
+        if self.remaining is not None and self.remaining <= reserve and self.reset_at > now:
+            return self.reset_at - now
+        return 0.0
+
+    def take(self, now: float) -> None:
+        if self.reset_at <= now:
+            # The window is over, the next response tells what the new one holds
+            self.remaining = None
+        elif self.remaining is not None:
+            self.remaining -= 1
+
+
+class Outbox:
+    def __init__(
+        self,
+        *,
+        concurrency: int = 8,
+        maintenance_concurrency: int = 1,
+        coalesce_window: float = 30.0,
+        clock=time.monotonic,
+    ) -> None:
+        self.concurrency = concurrency
+        self.maintenance_concurrency = maintenance_concurrency
+        self.coalesce_window = coalesce_window
+        self.clock = clock
+        # (priority, sequence, route, factory, future) entries
+        self.queue = []
+        self.buckets = {}
+        self.global_reset = 0.0
+        self.sent = 0
+        self.coalesced = 0
+        self.limited = 0
+        self._sequence = itertools.count()
+        self._busy = set()
+        self._inflight = {}
+        self._tasks = set()
+        self._recent = {}
+        self._wake = asyncio.Event()
+        self._runner = None
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Get an aiohttp trace config that feeds the rate limit headers of every Discord response to the buckets.
+        """
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_end(session, context, params) -> None:
+            self.observe(
+                params.method, params.url.path, params.response.status, params.response.headers
+            )
+
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def observe(self, method: str, path: str, status: int, headers) -> None:
+        """
+        Update the bucket of a route from the headers of a response.
+
+        :param method: The HTTP method of the request.
+        :param path: The request path.
+        :param status: The HTTP status of the response.
+        :param headers: The response headers.
+        """
+        now = self.clock()
+        if status == 429:
+            self.limited += 1
+            if headers.get("X-RateLimit-Global") or headers.get("X-RateLimit-Scope") == "global":
+                self.global_reset = now + float(headers.get("Retry-After", 1))
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is None or reset_after is None:
+            return
+        key = route_key(method, path)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = RouteBucket()
+        bucket.update(int(remaining), float(reset_after), now)
+        self._wake.set()
+
+    def submit(
+        self, route: str, factory, *, priority: int = NORMAL, coalesce=None
+    ) -> asyncio.Future:
+        """
+        Queue a request.
+
+        :param route: The route key of the request, see route_key.
+        :param factory: A function without arguments that starts the request and returns its coroutine.
+        :param priority: COMMAND, NORMAL or MAINTENANCE.
+        :param coalesce: If given, requests with the same key within the coalesce window share one result.
+        :return: A future with the result of the request.
+        """
+        now = self.clock()
+        if coalesce is not None:
+            recent = self._recent.get(coalesce)
+            if recent is not None and recent[0] > now:
+                self.coalesced += 1
+                return recent[1]
+        future = asyncio.get_running_loop().create_future()
+        if coalesce is not None:
+            self._recent[coalesce] = (now + self.coalesce_window, future)
+            if len(self._recent) > 1024:
+                self._recent = {k: v for k, v in self._recent.items() if v[0] > now}
+        heapq.heappush(
+            self.queue, (priority, next(self._sequence), route, factory, future)
+        )
+        self._wake.set()
+        return future
+
+    async def request(self, route: str, factory, **kwargs):
+        return await asyncio.shield(self.submit(route, factory, **kwargs))
+
+    async def send(
+        self,
+        channel: discord.abc.Messageable,
+        *args,
+        priority: int = NORMAL,
+        coalesce: bool = False,
+        **kwargs,
+    ) -> discord.Message:
+        """
+        Send a message through the queue.
+
+        :param channel: The channel, thread or context to send to.
+        :param priority: COMMAND, NORMAL or MAINTENANCE.
+        :param coalesce: Send the message only once if the same one is sent to the channel again within the window.
+        """
+        target = getattr(channel, "channel", channel)
+        key = None
+        # Every interaction needs its own response, only plain channel messages are coalesced
+        if coalesce and getattr(channel, "interaction", None) is None:
+            embed = kwargs.get("embed")
+            key = (
+                target.id,
+                args[0] if args else kwargs.get("content"),
+                json.dumps(embed.to_dict(), sort_keys=True) if embed is not None else None,
+            )
+        return await self.request(
+            route_key("POST", f"/channels/{target.id}/messages"),
+            functools.partial(channel.send, *args, **kwargs),
+            priority=priority,
+            coalesce=key,
+        )
+
+    def _next(self, now: float):
+        """
+        Pop the most urgent request whose route is free and has budget left.
+
+        :return: The entry, or None and how long until a held back route frees up.
+        """
+        if self.global_reset > now:
+            return None, self.global_reset - now
+        held, entry, delay = [], None, None
+        while self.queue:
+            candidate = heapq.heappop(self.queue)
+            priority, _, route, _, future = candidate
+            if future.cancelled():
+                continue
+            bucket = self.buckets.get(route)
+            wait = 0.0
+            if bucket is not None:
+                wait = bucket.delay(now, MAINTENANCE_HEADROOM if priority >= MAINTENANCE else 0)
+            if (
+                route in self._busy
+                or wait > 0
+                or len(self._busy) >= self.concurrency
+                or priority >= MAINTENANCE
+                and self._inflight.get(MAINTENANCE, 0) >= self.maintenance_concurrency
+            ):
+                held.append(candidate)
+                if wait > 0:
+                    delay = wait if delay is None else min(delay, wait)
+                continue
+            entry = candidate
+            break
+        for candidate in held:
+            heapq.heappush(self.queue, candidate)
+        return entry, delay
+
+    async def _dispatch(self, entry, level: int) -> None:
+        _, _, route, factory, future = entry
+        try:
+            result = await factory()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.sent += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._busy.discard(route)
+            self._inflight[level] -= 1
+            self._wake.set()
+
+    async def run(self) -> None:
+        while True:
+            self._wake.clear()
+            entry, delay = self._next(self.clock())
+            if entry is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Claim the route before the next pick, the task only starts on the next loop iteration
+            route = entry[2]
+            level = min(entry[0], MAINTENANCE)
+            self._busy.add(route)
+            self._inflight[level] = self._inflight.get(level, 0) + 1
+            bucket = self.buckets.get(route)
+            if bucket is not None:
+                bucket.take(self.clock())
+            task = asyncio.create_task(self._dispatch(entry, level))
+            # Keep a reference so the task is not garbage collected while it runs
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+        for entry in self.queue:
+            entry[4].cancel()
+        self.queue = []
@@ -0,0 +1,254 @@
+"""
+Description:
+Incremental index of the Plex library that the weekly changelog is built from.
+Only items added since the last synced item are requested from the server, so
+the cost of a changelog run scales with new content instead of library size.
+The index is a snapshot of the library: changelogs for any date range and
+title searches are answered from it without contacting Plex.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from plex.episodes import group_episodes, parse_episode
+
+SECTIONS = {"movie": ("Movies", {}), "episode": ("Series", {"libtype": "episode"})}
+
+
+class PlexLibrary:
+    def __init__(self, *, database) -> None:
+        self.database = database
+
+    async def get_high_water(self, section: str) -> Optional[int]:
+        """
+        This function will get the addedAt timestamp of the newest synced item of a section.
+
+        :param section: The name of the section, either "movie" or "episode".
+        :return: The timestamp, or None if the section was never synced.
+        """
+        rows = await self.database.reader.execute(
+            "SELECT high_water FROM plex_sync WHERE section=?", (section,)
+        )
+        async with rows as cursor:
+            result = await cursor.fetchone()
+            return result[0] if result is not None else None
+
+    async def set_high_water(self, connection, section: str, high_water: int) -> None:
+        """
+        This function will store the addedAt timestamp of the newest synced item of a section.
+
+        :param connection: The writer connection of the ongoing transaction.
+        :param section: The name of the section, either "movie" or "episode".
+        :param high_water: The timestamp of the newest synced item.
+        """
+        await connection.execute(
+            "INSERT INTO plex_sync(section, high_water) VALUES (?, ?) "
+            "ON CONFLICT(section) DO UPDATE SET high_water=MAX(high_water, excluded.high_water)",
+            (section, high_water),
+        )
+
+    async def _search(self, section: str) -> dict:
+        high_water = await self.get_high_water(section)
+        if high_water is None:
+            # Never synced, the whole section is indexed with a single search
+            return {}
+        # Plex only filters with one second precision, re-read the boundary second and upsert it.
+        return {"filters": {"addedAt>>": datetime.fromtimestamp(high_water - 1)}}
+
+    async def sync(self, plex) -> None:
+        """
+        This function will pull every movie and episode added after the last synced item into the index.
+
+        A section that was never synced is indexed in full, however old its items are.
+
+        :param plex: The PlexClient to request from.
+        """
+        await asyncio.gather(self.sync_movies(plex), self.sync_episodes(plex))
+
+    async def sync_movies(self, plex) -> None:
+        """
+        This function will index the movies added after the last synced movie, or every movie on the first sync.
+
+        :param plex: The PlexClient to request from.
+        """
+        rows = await plex.search_rows("Movies", movie_row, **await self._search("movie"))
+        if not rows:
+            return
+        async with self.database.transaction() as connection:
+            await connection.executemany(
+                "INSERT OR REPLACE INTO plex_items(rating_key, type, title, title_sort, year, edition_title, added_at) "
+                "VALUES (?, 'movie', ?, ?, ?, ?, ?)",
+                rows,
+            )
+            await self.set_high_water(connection, "movie", max(row[5] for row in rows))
+
+    async def sync_episodes(self, plex) -> None:
+        """
+        This function will index the episodes added after the last synced episode, or every episode on the first sync.
+
+        :param plex: The PlexClient to request from.
+        """
+        rows = await plex.search_rows(
+            "Series", episode_row, libtype="episode", **await self._search("episode")
+        )
+        if not rows:
+            return
+        show_keys = {row[2] for row in rows}
+        shows = await self.fetch_shows(plex, show_keys)
+        async with self.database.transaction() as connection:
+            await connection.executemany(
+                "INSERT OR REPLACE INTO plex_shows(rating_key, title, title_sort, year) VALUES (?, ?, ?, ?)",
+                shows,
+            )
+            await connection.executemany(
+                "INSERT OR REPLACE INTO plex_items(rating_key, type, title, show_key, season, episode, added_at) "
+                "VALUES (?, 'episode', ?, ?, ?, ?, ?)",
+                rows,
+            )
+            await self.set_high_water(connection, "episode", max(row[5] for row in rows))
+
+    async def prune(self, plex) -> int:
+        """
+        This function will drop the items that were removed from Plex since they were indexed.
+
+        Only the rating keys of each section are compared, nothing is re-indexed.
+
+        :param plex: The PlexClient to request from.
+        :return: The number of items dropped.
+        """
+        removed = 0
+        for section, (name, kwargs) in SECTIONS.items():
+            keys = await plex.rating_keys(name, **kwargs)
+            async with self.database.transaction() as connection:
+                await connection.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS plex_keep (rating_key INTEGER PRIMARY KEY)"
+                )
+                await connection.execute("DELETE FROM plex_keep")
+                await connection.executemany(
+                    "INSERT OR IGNORE INTO plex_keep VALUES (?)", ((k,) for k in keys)
+                )
+                cursor = await connection.execute(
+                    "DELETE FROM plex_items WHERE type=? AND rating_key NOT IN (SELECT rating_key FROM plex_keep)",
+                    (section,),
+                )
+                removed += cursor.rowcount
+                await connection.execute("DELETE FROM plex_keep")
+        async with self.database.transaction() as connection:
+            await connection.execute(
+                "DELETE FROM plex_shows WHERE rating_key NOT IN "
+                "(SELECT show_key FROM plex_items WHERE type='episode')"
+            )
+        return removed
+
+    async def fetch_shows(self, plex, show_keys: set) -> list:
+        """
+        This function will look up the title and year of shows that are not indexed yet.
+
+        :param plex: The PlexClient to request from.
+        :param show_keys: The rating keys of the shows that had new episodes.
+        :return: A list of (rating key, title, title sort, year) tuples for the shows that were missing.
+        """
+        rows = await self.database.reader.execute(
+            f"SELECT rating_key FROM plex_shows WHERE rating_key IN ({','.join('?' * len(show_keys))})",
+            tuple(show_keys),
+        )
+        async with rows as cursor:
+            known = {row[0] for row in await cursor.fetchall()}
+        missing = sorted(show_keys - known)
+        if not missing:
+            return []
+        return await plex.fetch_rows(missing, show_row)
+
+    async def get_new_movies(self, since: datetime, until: Optional[datetime] = None) -> list:
+        """
+        This function will get the indexed movies added within a date range.
+
+        :param since: The date of the last changelog.
+        :param until: The end of the range, exclusive. Defaults to everything after since.
+        :return: A list of (title, year, edition title) tuples, ordered like the Plex library.
+        """
+        rows = await self.database.reader.execute(
+            "SELECT title, year, edition_title FROM plex_items "
+            "WHERE type='movie' AND added_at>=? AND added_at<? ORDER BY title_sort",
+            _bounds(since, until),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def get_new_episodes(self, since: datetime, until: Optional[datetime] = None) -> list:
+        """
+        This function will get the indexed episodes added within a date range, grouped by show and season.
+
+        :param since: The date of the last changelog.
+        :param until: The end of the range, exclusive. Defaults to everything after since.
+        :return: A list of (show title, show year, {season: sorted episode numbers}) tuples, seasons are ints.
+        """
+        rows = await self.database.reader.execute(
+            "SELECT e.show_key, s.title, s.year, e.season, e.episode FROM plex_items e "
+            "JOIN plex_shows s ON s.rating_key=e.show_key "
+            "WHERE e.type='episode' AND e.added_at>=? AND e.added_at<? AND e.season IS NOT NULL "
+            "ORDER BY s.title_sort, e.show_key",
+            _bounds(since, until),
+        )
+        shows = {}
+        async with rows as cursor:
+            async for show_key, title, year, season, episode in cursor:
+                if show_key not in shows:
+                    shows[show_key] = (title, year, [])
+                shows[show_key][2].append((int(season), episode))
+        return [
+            (title, year, group_episodes(pairs))
+            for title, year, pairs in shows.values()
+        ]
+
+    async def search(self, query: str, limit: int = 25) -> list:
+        """
+        This function will look up movies and shows whose title starts with the query, ignoring case.
+
+        :param query: The start of the title.
+        :param limit: The maximum number of results.
+        :return: A list of (type, title, year, edition title) tuples ordered by title, type is "movie" or "show".
+        """
+        pattern = _escape_like(query) + "%"
+        rows = await self.database.reader.execute(
+            "SELECT * FROM ("
+            "SELECT 'movie', title, year, edition_title, title_sort FROM plex_items "
+            "WHERE type='movie' AND title LIKE ? ESCAPE '\\' "
+            "UNION ALL "
+            "SELECT 'show', title, year, NULL, title_sort FROM plex_shows "
+            "WHERE title LIKE ? ESCAPE '\\'"
+            ") ORDER BY COALESCE(title_sort, title) LIMIT ?",
+            (pattern, pattern, limit),
+        )
+        async with rows as cursor:
+            return [row[:4] for row in await cursor.fetchall()]
+
+
+# Rows of the index, read from plexapi items inside the PlexClient's thread pool, see plex.client.rows
+def movie_row(m) -> tuple:
+    return (m.ratingKey, m.title, m.titleSort, m.year, m.editionTitle, int(m.addedAt.timestamp()))
+
+
+def episode_row(e) -> tuple:
+    season = episode = None
+    parsed = parse_episode(e)
+    if parsed is not None:
+        season = f"{parsed[0]:02d}"
+        episode = parsed[1]
+    return (e.ratingKey, e.title, e.grandparentRatingKey, season, episode, int(e.addedAt.timestamp()))
+
+
+def show_row(s) -> tuple:
+    return (s.ratingKey, s.title, s.titleSort, s.year)
+
+
+def _bounds(since: datetime, until: Optional[datetime]) -> tuple:
+    return (
+        int(since.timestamp()),
+        int(until.timestamp()) if until is not None else 2**63 - 1,
+    )
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,107 @@
+"""
+Description:
+Renders the weekly changelog as a stream of blocks and packs them into code block
+messages that fit Discord's message size limit. A block is a movie, a show with
+all of its seasons or a game, section headers stay with the first block after
+them, so messages are only split between entries.
+"""
+
+from datetime import datetime
+
+from plex.episodes import season_ranges
+
+MESSAGE_LIMIT = 2000
+FENCE_OPEN = "```\n"
+FENCE_CLOSE = "```"
+
+
+def changelog_blocks(
+    since: datetime, until: datetime, movies: list, shows: list, games: list
+):
+    """
+    Yield the changelog as blocks of lines, each line ending with a newline.
+
+    :param since: The date of the last changelog.
+    :param until: The date of this changelog.
+    :param movies: (title, year, edition title) tuples of the new movies.
+    :param shows: (title, year, {season: sorted episode numbers}) tuples of the shows with new episodes.
+    :param games: The names of the new games.
+    """
+    yield [
+        f"FULCRUM Automated Changelog // {since.strftime('%Y/%m/%d')} - {until.strftime('%Y/%m/%d')}\n",
+        "\n",
+    ]
+
+    header = ["Movies\n", "------\n"]
+    for title, year, editionTitle in movies:
+        if editionTitle is None:
+            yield header + [f" + {title} ({year})\n"]
+        else:
+            yield header + [f" + {title} ({year}) - {editionTitle}\n"]
+        header = []
+    if header:
+        yield header
+
+    header = ["\n", "Shows\n", "-----\n"]
+    for title, year, showEpisodes in shows:
+        block = header + [f" o {title} ({year})\n"]
+        for season, ranges in season_ranges(showEpisodes):
+            block.append(f"    + S{season}E{ranges}\n")
+        yield block
+        header = []
+    if header:
+        yield header
+
+    header = ["\n", "Games\n", "-----\n"]
+    for name in games:
+        yield header + [f" + {name}\n"]
+        header = []
+    if header:
+        yield header
+
+
+def split_block(block: list, budget: int) -> list:
+    """
+    Split a block that does not fit in a message on its own, at line boundaries where possible.
+
+    :param block: The lines of the block.
+    :param budget: How many characters fit in a message.
+    """
+    parts = []
+    part, size = [], 0
+    for line in block:
+        while len(line) > budget:
+            if part:
+                parts.append("".join(part))
+                part, size = [], 0
+            parts.append(line[:budget])
+            line = line[budget:]
+        if size + len(line) > budget:
+            parts.append("".join(part))
+            part, size = [], 0
+        part.append(line)
+        size += len(line)
+    if part:
+        parts.append("".join(part))
+    return parts
+
+
+def pack_messages(blocks, limit: int = MESSAGE_LIMIT):
+    """
+    Pack blocks into code block messages of at most ``limit`` characters, keeping their order.
+
+    :param blocks: The blocks to pack, as yielded by changelog_blocks.
+    :param limit: The maximum length of a message.
+    """
+    budget = limit - len(FENCE_OPEN) - len(FENCE_CLOSE)
+    chunk, size = [], 0
+    for block in blocks:
+        text = "".join(block)
+        for part in [text] if len(text) <= budget else split_block(block, budget):
+            if chunk and size + len(part) > budget:
+                yield FENCE_OPEN + "".join(chunk) + FENCE_CLOSE
+                chunk, size = [], 0
+            chunk.append(part)
+            size += len(part)
+    if chunk:
+        yield FENCE_OPEN + "".join(chunk) + FENCE_CLOSE
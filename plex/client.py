@@ -0,0 +1,160 @@
+"""
+Description:
+Async facade over plexapi. Every blocking call runs in a bounded thread pool with
+a timeout so the gateway heartbeat never waits on Plex, and a single PlexServer
+session is kept alive between runs. Results are read into plain rows inside the
+pool too, reading a plexapi attribute can itself be a request. Section searches
+are read a page at a time, so a full scan is many short calls instead of one
+that pages through the whole section under a single timeout.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# How many items one request of a section search returns
+PAGE_SIZE = 500
+# Pages start this many items before the previous one ended, so an item removed while the
+# pages are read does not shift another one past the page boundary unseen
+PAGE_OVERLAP = 10
+
+
+class PlexClient:
+    def __init__(
+        self, baseurl: str, token: str, *, workers: int = 4, timeout: float = 30.0
+    ) -> None:
+        self.baseurl = baseurl
+        self.token = token
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="plex"
+        )
+        self._server = None
+        self._lock = asyncio.Lock()
+
+    async def call(self, func, *args, **kwargs):
+        """
+        This function will run a blocking plexapi call in the thread pool.
+
+        :param func: The blocking function to call.
+        :return: Whatever the function returned.
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs)),
+            self.timeout,
+        )
+
+    async def server(self):
+        """
+        This function will get the shared PlexServer session, connecting on first use.
+        """
+        async with self._lock:
+            if self._server is None:
+                # plexapi is only imported once the bot actually talks to Plex
+                from plexapi.server import PlexServer
+
+                self._server = await self.call(
+                    PlexServer, self.baseurl, self.token, timeout=self.timeout
+                )
+            return self._server
+
+    async def request(self, func, *args, **kwargs):
+        """
+        This function will run a plexapi call and drop the session if it failed, so the next call reconnects.
+
+        :param func: The blocking function to call.
+        """
+        try:
+            return await self.call(func, *args, **kwargs)
+        except Exception:
+            self._server = None
+            raise
+
+    async def rating_keys(self, section: str, **kwargs) -> set:
+        """
+        This function will list the rating keys of a library section, the items themselves never leave the thread pool.
+
+        :param section: The name of the library section.
+        """
+        return set(
+            await self.pages(section, lambda items: [item.ratingKey for item in items], **kwargs)
+        )
+
+    async def search_rows(self, section: str, row, **kwargs) -> list:
+        """
+        This function will search a library section and turn every result into a row inside the thread pool.
+
+        :param section: The name of the library section.
+        :param row: The function that reads an item into a row, see rows.
+        """
+        return await self.pages(section, lambda items: rows(items, row), **kwargs)
+
+    async def pages(self, section: str, read, page_size: int = PAGE_SIZE, **kwargs) -> list:
+        """
+        This function will search a library section a page at a time, every page is one request with its own timeout.
+
+        Neighbouring pages overlap, the items they share are read twice.
+
+        :param section: The name of the library section.
+        :param read: The function that reads the items of a page into a list, run in the thread pool.
+        :param page_size: How many items a page holds.
+        """
+        plex = await self.server()
+        library = await self.request(plex.library.section, section)
+        result = []
+        start = 0
+        while True:
+            page = await self.request(
+                lambda start: read(
+                    library.search(
+                        container_start=start,
+                        container_size=page_size,
+                        maxresults=page_size,
+                        **kwargs,
+                    )
+                ),
+                start,
+            )
+            result.extend(page)
+            if len(page) < page_size:
+                return result
+            start += page_size - PAGE_OVERLAP
+
+    async def fetch_rows(self, keys: list, row, chunk_size: int = 100) -> list:
+        """
+        This function will fetch items by rating key and turn them into rows inside the thread pool.
+
+        :param keys: The rating keys to fetch.
+        :param row: The function that reads an item into a row, see rows.
+        :param chunk_size: How many rating keys go into one request.
+        """
+        plex = await self.server()
+        chunks = await asyncio.gather(
+            *(
+                self.request(lambda chunk: rows(plex.fetchItems(chunk), row), keys[i : i + chunk_size])
+                for i in range(0, len(keys), chunk_size)
+            )
+        )
+        return [item for chunk in chunks for item in chunk]
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def rows(items: list, row) -> list:
+    """
+    Read plexapi items into rows, with the auto reload of every item turned off.
+
+    plexapi fetches the whole item again when an attribute read from a search result is None,
+    most movies have no edition title and that would be one request per movie. Whatever the
+    listing did not have is left as None. Must run in the thread pool, like every plexapi call.
+
+    :param items: The plexapi items.
+    :param row: The function that reads an item into a row.
+    """
+    result = []
+    for item in items:
+        item._autoReload = False
+        result.append(row(item))
+    return result
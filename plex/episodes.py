@@ -0,0 +1,111 @@
+"""
+Description:
+Season/episode parsing for Plex episodes. The season and episode numbers come
+from the metadata Plex already sends with every episode, the file name is only
+parsed when they are missing, so no extra requests are made.
+"""
+
+import re
+from typing import Optional
+
+EPISODE_PATTERN = re.compile(r"[sS](\d{1,4})[eE](\d{1,4})", re.IGNORECASE)
+
+
+def format_numbers(arr: list) -> str:
+    """
+    Collapse a sorted list of episode numbers into ranges, e.g. ``01-03, 05``.
+
+    :param arr: The sorted episode numbers.
+    """
+    if not arr:
+        return ""
+
+    result = []
+    start = arr[0]
+    end = arr[0]
+
+    for num in arr[1:]:
+        if num == end + 1:
+            end = num
+        else:
+            if start == end:
+                result.append(f"{start:02d}")
+            else:
+                result.append(f"{start:02d}-{end:02d}")
+            start = num
+            end = num
+    if start == end:
+        result.append(f"{start:02d}")
+    else:
+        result.append(f"{start:02d}-{end:02d}")
+    return ", ".join(result)
+
+
+def parse_location(location: str) -> Optional[tuple]:
+    """
+    Parse the season and episode number out of a file name like ``Show.S01E02.mkv``.
+
+    :param location: The path of the episode file.
+    :return: A (season, episode) tuple of ints, or None if the name has no SxxEyy in it.
+    """
+    match = EPISODE_PATTERN.search(location)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_episode(episode) -> Optional[tuple]:
+    """
+    Get the season and episode number of a Plex episode.
+
+    Only what the search listing sent is read: the episode's auto reload is turned off first,
+    plexapi would otherwise fetch the whole episode as soon as ``parentIndex``, ``index`` or its
+    media is missing, and ``seasonNumber`` would fetch the season.
+
+    :param episode: The plexapi Episode, its auto reload stays off.
+    :return: A (season, episode) tuple of ints, or None if neither the metadata nor the file name has them.
+    """
+    episode._autoReload = False
+    season = episode.parentIndex
+    index = episode.index
+    if season is not None and index is not None:
+        return season, index
+    locations = episode.locations
+    return parse_location(locations[0]) if locations else None
+
+
+def group_episodes(pairs) -> dict:
+    """
+    Group (season, episode) pairs by season, dropping duplicates.
+
+    :param pairs: An iterable of (season, episode) tuples, None entries are skipped.
+    :return: A dictionary of season to the sorted episode numbers.
+    """
+    seasons = {}
+    for pair in pairs:
+        if pair is not None:
+            seasons.setdefault(pair[0], set()).add(pair[1])
+    return {season: sorted(episodes) for season, episodes in seasons.items()}
+
+
+def season_ranges(seasons: dict) -> list:
+    """
+    Collapse the episodes of every season into ranges.
+
+    :param seasons: A dictionary of season to the sorted episode numbers.
+    :return: A list of (season, ranges) tuples ordered by season, e.g. ``[("01", "01-03, 05")]``.
+    """
+    return [
+        (f"{int(season):02d}", format_numbers(seasons[season]))
+        for season in sorted(seasons, key=int)
+    ]
+
+
+def episode_ranges(episodes) -> list:
+    """
+    Turn a list of Plex episodes into collapsed episode ranges per season.
+
+    :param episodes: The plexapi Episodes.
+    :return: A list of (season, ranges) tuples ordered by season.
+    """
+    return season_ranges(group_episodes(parse_episode(e) for e in episodes))
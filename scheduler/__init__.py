@@ -0,0 +1,283 @@
+"""
+Description:
+Persistent scheduler for the bot's periodic jobs. The next run of every job is
+stored in SQLite, a single timer sleeps until the next job is due, and a job's
+state only moves forward once the job has finished successfully. When several
+processes share the database, a lease row elects the one that runs the jobs.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class Job:
+    def __init__(self, name: str, func, interval: timedelta) -> None:
+        self.name = name
+        self.func = func
+        self.interval = interval
+        # The stored slot, next_run only moves away from it while a failed run is retried
+        self.scheduled = 0.0
+        self.next_run = 0.0
+        self.last_run = None
+
+
+class Lease:
+    def __init__(
+        self,
+        name: str,
+        holder: str,
+        *,
+        database,
+        ttl: float = 60.0,
+        clock=time.time,
+        sleep=asyncio.sleep,
+        logger=None,
+    ) -> None:
+        self.name = name
+        self.holder = holder
+        self.database = database
+        self.ttl = ttl
+        self.clock = clock
+        self.sleep = sleep
+        self.logger = logger
+        # Bumped every time the lease is taken over, whatever was read before may be stale then
+        self.generation = 0
+        self.expires_at = 0.0
+        self._held = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._lost.set()
+        self._runner = None
+
+    @property
+    def held(self) -> bool:
+        return self._held.is_set() and self.clock() < self.expires_at
+
+    async def acquire(self) -> bool:
+        """
+        This function will take the lease if it is free or expired, or renew it if it is ours.
+
+        :return: Whether this process holds the lease now.
+        """
+        now = self.clock()
+        async with self.database.transaction() as connection:
+            rows = await connection.execute(
+                "INSERT INTO leases(name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at "
+                "WHERE leases.holder=excluded.holder OR leases.expires_at<? "
+                "RETURNING holder",
+                (self.name, self.holder, now + self.ttl, now),
+            )
+            async with rows as cursor:
+                held = await cursor.fetchone() is not None
+        if held:
+            self.expires_at = now + self.ttl
+        self._set(held)
+        return held
+
+    async def release(self) -> None:
+        async with self.database.transaction() as connection:
+            await connection.execute(
+                "DELETE FROM leases WHERE name=? AND holder=?", (self.name, self.holder)
+            )
+        self._set(False)
+
+    def _set(self, held: bool) -> None:
+        if held and not self._held.is_set():
+            self.generation += 1
+            self._lost.clear()
+            self._held.set()
+            if self.logger is not None:
+                self.logger.info(f"Took the {self.name} lease as {self.holder}")
+        elif not held and self._held.is_set():
+            self._held.clear()
+            self._lost.set()
+            if self.logger is not None:
+                self.logger.warning(f"Lost the {self.name} lease")
+
+    async def wait(self) -> None:
+        await self._held.wait()
+
+    async def wait_lost(self) -> None:
+        await self._lost.wait()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.acquire()
+            except Exception as e:
+                # The database may be busy, the lease is still ours until it expires
+                if self.clock() >= self.expires_at:
+                    self._set(False)
+                if self.logger is not None:
+                    self.logger.error(f"Renewing the {self.name} lease failed\n{type(e).__name__}: {e}")
+            await self.sleep(self.ttl / 3)
+
+    def start(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+        if self._held.is_set():
+            await self.release()
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        *,
+        database,
+        clock=time.time,
+        sleep=asyncio.sleep,
+        retry_delay: timedelta = timedelta(minutes=5),
+        lease: Optional[Lease] = None,
+        logger=None,
+    ) -> None:
+        self.database = database
+        self.lease = lease
+        self.clock = clock
+        self.sleep = sleep
+        self.retry_delay = retry_delay
+        self.logger = logger
+        self.jobs = {}
+        self._generation = 0
+        self._runner = None
+
+    async def add_job(
+        self,
+        name: str,
+        func,
+        interval: timedelta,
+        *,
+        first_run: Optional[datetime] = None,
+        last_run: Optional[datetime] = None,
+    ) -> Job:
+        """
+        This function will register a job, restoring its state if it already ran before.
+        Jobs have to be registered before the scheduler is started.
+
+        :param name: The unique name of the job.
+        :param func: The coroutine function to run, called with the time of the last successful run.
+        :param interval: How much time there is between two runs.
+        :param first_run: When the job should first run if it has no stored state. Default is now.
+        :param last_run: The last run to store if the job has no stored state.
+        """
+        job = Job(name, func, interval)
+        async with self.database.transaction() as connection:
+            await connection.execute(
+                "INSERT OR IGNORE INTO jobs(name, next_run, last_run) VALUES (?, ?, ?)",
+                (
+                    name,
+                    first_run.timestamp() if first_run is not None else self.clock(),
+                    last_run.timestamp() if last_run is not None else None,
+                ),
+            )
+            rows = await connection.execute(
+                "SELECT next_run, last_run FROM jobs WHERE name=?", (name,)
+            )
+            async with rows as cursor:
+                job.scheduled, job.last_run = await cursor.fetchone()
+        job.next_run = job.scheduled
+        self.jobs[name] = job
+        return job
+
+    async def reload(self) -> None:
+        """
+        This function will read the state of every job again, another process may have run them meanwhile.
+        """
+        rows = await self.database.reader.execute("SELECT name, next_run, last_run FROM jobs")
+        async with rows as cursor:
+            async for name, next_run, last_run in cursor:
+                job = self.jobs.get(name)
+                if job is not None:
+                    job.scheduled = job.next_run = next_run
+                    job.last_run = last_run
+
+    async def run_job(self, job: Job) -> None:
+        """
+        This function will run a job and store its next run once it succeeded.
+
+        Runs that were missed while the bot was offline are collapsed into this one.
+
+        :param job: The job to run.
+        """
+        started = self.clock()
+        try:
+            await job.func(
+                datetime.fromtimestamp(job.last_run) if job.last_run is not None else None
+            )
+        except Exception as e:
+            # Keep the stored state, so the job is also retried if the bot restarts meanwhile
+            job.next_run = started + self.retry_delay.total_seconds()
+            if self.logger is not None:
+                self.logger.error(f"Job {job.name} failed\n{type(e).__name__}: {e}")
+            return
+        interval = job.interval.total_seconds()
+        next_run = job.scheduled + interval
+        if next_run <= started:
+            next_run += ((started - next_run) // interval + 1) * interval
+        async with self.database.transaction() as connection:
+            await connection.execute(
+                "UPDATE jobs SET next_run=?, last_run=? WHERE name=?",
+                (next_run, started, job.name),
+            )
+        job.scheduled = job.next_run = next_run
+        job.last_run = started
+
+    async def step(self) -> None:
+        """
+        This function will wait for the next job that is due and run it.
+        """
+        if self.lease is not None:
+            await self.lease.wait()
+            if self.lease.generation != self._generation:
+                await self.reload()
+                self._generation = self.lease.generation
+        job = min(self.jobs.values(), key=lambda j: j.next_run)
+        delay = job.next_run - self.clock()
+        if delay > 0:
+            await self.sleep(delay)
+            return
+        # Renew right before the run, in case the lease ran out while the timer slept.
+        # If it had to be taken over again, the state is read again first.
+        if self.lease is not None and (
+            not await self.renew() or self.lease.generation != self._generation
+        ):
+            return
+        await self.run_job(job)
+
+    async def renew(self) -> bool:
+        """
+        This function will renew the lease before a run, a busy database counts as not holding it.
+
+        :return: Whether this process holds the lease now.
+        """
+        try:
+            return await self.lease.acquire()
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error(f"Renewing the {self.lease.name} lease failed\n{type(e).__name__}: {e}")
+            # Check again at the pace Lease.run renews at
+            await self.sleep(self.lease.ttl / 3)
+            return False
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.step()
+            except Exception as e:
+                # The database may be busy, one failed step must not stop every job until a restart
+                if self.logger is not None:
+                    self.logger.error(f"The job scheduler failed\n{type(e).__name__}: {e}")
+                await self.sleep(self.retry_delay.total_seconds())
+
+    def start(self) -> None:
+        if self.jobs and (self._runner is None or self._runner.done()):
+            self._runner = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
@@ -0,0 +1,53 @@
+"""
+Description:
+Startup helpers: a per-phase timer for the boot sequence and a command tree that
+loads lazy cogs the first time one of their slash commands is used.
+"""
+
+import contextlib
+import time
+
+import discord
+from discord import app_commands
+
+
+class StartupTimer:
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Time the code inside the block as one phase of the startup.
+
+        :param name: The name the phase is reported under.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    def report(self) -> str:
+        lines = [f"{name:<24} {seconds * 1000:>9.1f} ms" for name, seconds in self.phases]
+        lines.append(
+            f"{'total':<24} {(time.perf_counter() - self.started) * 1000:>9.1f} ms"
+        )
+        return "\n".join(lines)
+
+
+class LazyCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # The command is looked up after this check, so a lazy cog loaded here can still handle it
+        if interaction.type in (
+            discord.InteractionType.application_command,
+            discord.InteractionType.autocomplete,
+        ):
+            name = (interaction.data or {}).get("name")
+            if name is not None:
+                await self.client.load_lazy_command(name)
+        return True
@@ -0,0 +1,180 @@
+"""
+Description:
+Video stream scheduling. schedule.csv is parsed once and again only when it
+changes on disk, entries wait in a heap ordered by time and fire exactly once,
+and every stream runs in its own context of one long-lived browser, with a
+fixed number of streams open at the same time.
+"""
+
+import asyncio
+import csv
+import heapq
+import os
+from datetime import datetime, timedelta
+
+
+def parse_schedule(path: str) -> list:
+    """
+    Parse the stream schedule, one ``YYYY-MM-DD,HH:MM:SS,code`` entry per row.
+
+    :param path: The path of the schedule file.
+    :return: A list of (time, code) tuples.
+    """
+    entries = []
+    with open(path, newline="") as schedFile:
+        for row in csv.reader(schedFile, delimiter=" ", quotechar="|"):
+            if not row:
+                continue
+            itemDate, itemClock, itemCode = str(row[0]).split(",")[:3]
+            itemTime = datetime.strptime(f"{itemDate} {itemClock}", "%Y-%m-%d %H:%M:%S")
+            entries.append((itemTime, itemCode))
+    return entries
+
+
+async def launch_chromium(headless: bool = True) -> tuple:
+    """
+    Launch a headless Chromium through playwright.
+
+    :return: The browser and the coroutine function that shuts playwright down again.
+    """
+    from playwright.async_api import async_playwright
+
+    playwright = await async_playwright().start()
+    browser = await playwright.chromium.launch(headless=headless)
+    return browser, playwright.stop
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        launch=launch_chromium,
+        *,
+        size: int = 2,
+        url: str = "http://www.youtube.com",
+        duration: timedelta = timedelta(hours=2),
+        logger=None,
+    ) -> None:
+        self.launch = launch
+        self.size = size
+        self.url = url
+        self.duration = duration
+        self.logger = logger
+        self.browser = None
+        self.launches = 0
+        self.open = 0
+        self._stop = None
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(size)
+        self._streams = set()
+
+    async def get_browser(self):
+        async with self._lock:
+            if self.browser is None:
+                self.browser, self._stop = await self.launch()
+                self.launches += 1
+            return self.browser
+
+    async def play(self, itemTime: datetime, itemCode: str) -> None:
+        """
+        Open a stream in a fresh browser context once a slot is free, and close it after its duration.
+
+        :param itemTime: The time the stream was scheduled for.
+        :param itemCode: The code of the scheduled item.
+        """
+        async with self._slots:
+            browser = await self.get_browser()
+            context = await browser.new_context()
+            self.open += 1
+            try:
+                page = await context.new_page()
+                await page.goto(self.url)
+                if self.logger is not None:
+                    self.logger.info(f"Started stream {itemCode} scheduled for {itemTime}: {await page.title()}")
+                await asyncio.sleep(self.duration.total_seconds())
+            finally:
+                self.open -= 1
+                await context.close()
+
+    def submit(self, itemTime: datetime, itemCode: str) -> None:
+        task = asyncio.create_task(self.play(itemTime, itemCode))
+        # Keep a reference to running streams so they aren't garbage collected
+        self._streams.add(task)
+        task.add_done_callback(self._streams.discard)
+
+    async def close(self) -> None:
+        for task in list(self._streams):
+            task.cancel()
+        if self.browser is not None:
+            await self.browser.close()
+            await self._stop()
+            self.browser = None
+
+
+class StreamScheduler:
+    def __init__(
+        self,
+        path: str,
+        pool: BrowserPool,
+        *,
+        clock=datetime.now,
+        grace: timedelta = timedelta(minutes=5),
+    ) -> None:
+        self.path = path
+        self.pool = pool
+        self.clock = clock
+        self.grace = grace
+        self.heap = []
+        self.fired = set()
+        self.mtime = None
+        self.started = clock()
+
+    def reload(self) -> bool:
+        """
+        Parse the schedule again if the file changed since it was last parsed.
+
+        :return: Whether the schedule was parsed.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.mtime, self.heap = None, []
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        # Entries that were due well before the bot started are stale, they are not played late
+        stale = self.started - self.grace
+        self.heap = [
+            entry
+            for entry in set(parse_schedule(self.path))
+            if entry not in self.fired and entry[0] >= stale
+        ]
+        heapq.heapify(self.heap)
+        return True
+
+    def due(self) -> list:
+        """
+        Pop every entry that is due, each entry is only ever returned once.
+        """
+        now = self.clock()
+        entries = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            self.fired.add(entry)
+            entries.append(entry)
+        return entries
+
+    def tick(self) -> int:
+        """
+        Hand every due entry to the browser pool.
+
+        :return: The number of streams started.
+        """
+        self.reload()
+        entries = self.due()
+        for itemTime, itemCode in entries:
+            self.pool.submit(itemTime, itemCode)
+        return len(entries)
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
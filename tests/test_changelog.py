@@ -0,0 +1,113 @@
+"""
+Description:
+The changelog renderer: 10k item weeks packed into messages that fit Discord's
+limit, split between entries only and reading the same as the single message
+plex_log used to send, a show too long for one message, and an empty week.
+"""
+
+import random
+import time
+from datetime import datetime
+
+from plex.changelog import FENCE_CLOSE, FENCE_OPEN, MESSAGE_LIMIT, changelog_blocks, pack_messages
+from plex.episodes import format_numbers
+
+SINCE = datetime(2024, 8, 15)
+UNTIL = datetime(2024, 8, 22)
+
+
+def old_layout(movies: list, shows: list, games: list) -> str:
+    """
+    The changelog the way plex_log built it into one string before it was split, without the code block.
+    """
+    text = f"FULCRUM Automated Changelog // {SINCE.strftime('%Y/%m/%d')} - {UNTIL.strftime('%Y/%m/%d')}\n\n"
+    text += "Movies\n------\n"
+    for title, year, editionTitle in movies:
+        if editionTitle is None:
+            text += f" + {title} ({year})\n"
+        else:
+            text += f" + {title} ({year}) - {editionTitle}\n"
+    text += "\nShows\n-----\n"
+    for title, year, showEpisodes in shows:
+        text += f" o {title} ({year})\n"
+        for season in sorted(showEpisodes):
+            text += f"    + S{season:02d}E{format_numbers(showEpisodes[season])}\n"
+    text += "\nGames\n-----\n"
+    for name in games:
+        text += f" + {name}\n"
+    return text
+
+
+def week(items: int, seed: int = 0) -> tuple:
+    rng = random.Random(seed)
+    movies = [
+        (f"Movie {i}", rng.randint(1950, 2025), "Director's Cut" if i % 50 == 0 else None)
+        for i in range(items * 4 // 10)
+    ]
+    shows = []
+    for i in range(items * 3 // 10):
+        seasons = {}
+        for season in range(1, rng.randint(1, 4) + 1):
+            seasons[season] = sorted(rng.sample(range(1, 25), rng.randint(1, 12)))
+        shows.append((f"Show {i}", rng.randint(1990, 2025), seasons))
+    games = sorted(f"Game {i}" for i in range(items - len(movies) - len(shows)))
+    return movies, shows, games
+
+
+def body(message: str) -> str:
+    assert message.startswith(FENCE_OPEN) and message.endswith(FENCE_CLOSE)
+    return message[len(FENCE_OPEN) : -len(FENCE_CLOSE)]
+
+
+def test_10k_items_fit_and_split_between_entries():
+    movies, shows, games = week(10_000)
+    blocks = list(changelog_blocks(SINCE, UNTIL, movies, shows, games))
+    messages = list(pack_messages(blocks))
+
+    assert len(messages) > 1
+    assert max(len(message) for message in messages) <= MESSAGE_LIMIT
+    assert "".join(body(message) for message in messages) == old_layout(movies, shows, games)
+
+    # Every message starts where an entry does
+    starts, offset = set(), 0
+    for block in blocks:
+        starts.add(offset)
+        offset += len("".join(block))
+    offset = 0
+    for message in messages:
+        assert offset in starts
+        offset += len(body(message))
+
+
+def test_building_is_linear():
+    def build(items: int) -> float:
+        movies, shows, games = week(items)
+        start = time.perf_counter()
+        for _ in pack_messages(changelog_blocks(SINCE, UNTIL, movies, shows, games)):
+            pass
+        return time.perf_counter() - start
+
+    build(1_000)
+    small = min(build(10_000) for _ in range(3))
+    large = min(build(40_000) for _ in range(3))
+    # Four times the items, anything quadratic would take sixteen times as long
+    assert large < small * 8
+
+
+def test_show_longer_than_a_message_is_split_at_lines():
+    # Every other episode of 30 seasons of 99, the ranges alone are several messages long
+    seasons = {season: list(range(1, 100, 2)) for season in range(1, 31)}
+    movies, shows, games = [("Before", 2001, None)], [("Long Show", 1999, seasons)], ["After"]
+    messages = list(pack_messages(changelog_blocks(SINCE, UNTIL, movies, shows, games)))
+
+    assert len(messages) > 2
+    assert max(len(message) for message in messages) <= MESSAGE_LIMIT
+    assert all(body(message).endswith("\n") for message in messages)
+    assert "".join(body(message) for message in messages) == old_layout(movies, shows, games)
+
+
+def test_empty_week():
+    messages = list(pack_messages(changelog_blocks(SINCE, UNTIL, [], [], [])))
+
+    assert messages == [FENCE_OPEN + old_layout([], [], []) + FENCE_CLOSE]
+    assert body(messages[0]).endswith("\nGames\n-----\n")
@@ -0,0 +1,160 @@
+"""
+Description:
+The warns table: the query plans of the warn queries, and the migration of a
+database that still has the baseline schema, duplicate IDs included and at
+50k rows, and the counters of the warn cache exported as gauges.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+
+from bench.fakes import ROOT, open_database
+from database import DatabaseManager
+from metrics import Metrics
+
+SERVER = 42
+USER = 1000
+
+
+async def traced(database: DatabaseManager, operation) -> list:
+    """
+    Run a database operation and get the statements it ran on warns, with their values filled in.
+    """
+    statements = []
+
+    def trace(statement: str) -> None:
+        if " warns" in statement and not statement.startswith(("BEGIN", "SAVEPOINT", "RELEASE")):
+            statements.append(statement)
+
+    for connection in {database.connection, database.reader}:
+        await connection.set_trace_callback(trace)
+    try:
+        await operation
+    finally:
+        for connection in {database.connection, database.reader}:
+            await connection.set_trace_callback(None)
+    return statements
+
+
+def test_warn_queries_use_the_warns_index(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        await database.add_warns([(USER + i % 50, SERVER, 7, "Spamming") for i in range(500)])
+
+        statements = await traced(database, database.add_warn(USER, SERVER, 7, "Spamming"))
+        statements += await traced(database, database.get_warnings(USER, SERVER))
+        statements += await traced(database, database.remove_warn(3, USER, SERVER))
+        await database.close()
+        return statements
+
+    statements = asyncio.run(main())
+    assert [s.split()[0] for s in statements] == ["INSERT", "SELECT", "DELETE", "SELECT"]
+    assert "COUNT(*)" in statements[-1]
+    with sqlite3.connect(os.path.join(tmp_path, "database.db")) as connection:
+        for statement in statements:
+            plan = " ".join(
+                row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}")
+            )
+            assert "warns_server_user_id" in plan, (statement, plan)
+            assert "SCAN warns" not in plan, (statement, plan)
+
+
+def test_migration_moves_duplicate_ids_past_the_highest(tmp_path):
+    async def main():
+        # A database of before the migrations: the baseline schema, IDs and snowflakes as text
+        database = await DatabaseManager.connect(os.path.join(tmp_path, "database.db"))
+        async with database.transaction() as connection:
+            with open(os.path.join(ROOT, "database", "schema.sql")) as file:
+                await connection.executescript(file.read())
+            await connection.executemany(
+                "INSERT INTO warns(id, user_id, server_id, moderator_id, reason) VALUES (?, ?, ?, ?, ?)",
+                [
+                    ("1", str(USER), str(SERVER), "7", "first"),
+                    ("2", str(USER), str(SERVER), "7", "second"),
+                    ("3", str(USER), str(SERVER), "7", "third"),
+                    # Two moderators warned at the same time and got an ID that was taken
+                    ("3", str(USER), str(SERVER), "8", "raced third"),
+                    ("2", str(USER), str(SERVER), "8", "raced second"),
+                    ("1", str(USER + 1), str(SERVER), "7", "another user"),
+                    ("1", str(USER), str(SERVER + 1), "7", "another server"),
+                ],
+            )
+        version = await database.migrate(os.path.join(ROOT, "database", "migrations"))
+        rows = await database.reader.execute(
+            "SELECT server_id, user_id, id, reason, typeof(id), typeof(user_id) FROM warns "
+            "ORDER BY server_id, user_id, id"
+        )
+        async with rows as cursor:
+            warns = await cursor.fetchall()
+        next_id = await database.add_warn(USER, SERVER, 7, "after the migration")
+        await database.close()
+        return version, warns, next_id
+
+    version, warns, next_id = asyncio.run(main())
+    assert version == max(
+        int(file.split("_")[0]) for file in os.listdir(os.path.join(ROOT, "database", "migrations"))
+    )
+    assert [warn[:4] for warn in warns] == [
+        (SERVER, USER, 1, "first"),
+        (SERVER, USER, 2, "second"),
+        (SERVER, USER, 3, "third"),
+        (SERVER, USER, 4, "raced third"),
+        (SERVER, USER, 5, "raced second"),
+        (SERVER, USER + 1, 1, "another user"),
+        (SERVER + 1, USER, 1, "another server"),
+    ]
+    assert {warn[4:] for warn in warns} == {("integer", "integer")}
+    assert next_id == 6
+
+
+def test_migration_of_a_large_table_is_not_a_scan_per_row(tmp_path):
+    async def main():
+        database = await DatabaseManager.connect(os.path.join(tmp_path, "database.db"))
+        async with database.transaction() as connection:
+            with open(os.path.join(ROOT, "database", "schema.sql")) as file:
+                await connection.executescript(file.read())
+            # 50k warnings of 1000 users, a scan per row took minutes
+            await connection.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < 50000) "
+                "INSERT INTO warns(id, user_id, server_id, moderator_id, reason) "
+                "SELECT i / 1000 + 1, 1000 + i % 1000, ?, 7, 'Spamming' FROM n",
+                (str(SERVER),),
+            )
+        start = time.perf_counter()
+        await database.migrate(os.path.join(ROOT, "database", "migrations"))
+        elapsed = time.perf_counter() - start
+        rows = await database.reader.execute(
+            "SELECT COUNT(*), (SELECT group_concat(name) FROM sqlite_master WHERE type='index' "
+            "AND name LIKE 'warns_old%') FROM warns"
+        )
+        async with rows as cursor:
+            count, old_indexes = await cursor.fetchone()
+        await database.close()
+        return elapsed, count, old_indexes
+
+    elapsed, count, old_indexes = asyncio.run(main())
+    assert count == 50_000
+    assert elapsed < 5.0
+    # The index the copies used went away with the old table
+    assert old_indexes is None
+
+
+def test_warn_cache_stats_are_exported(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        metrics = Metrics()
+        metrics.gauge("warn_cache", database.warn_cache.stats)
+        await database.add_warn(USER, SERVER, 7, "Spamming")
+        await database.get_warnings(USER, SERVER)
+        await database.get_warnings(USER, SERVER)
+        await database.close()
+        return metrics
+
+    metrics = asyncio.run(main())
+    values = dict(metrics.gauge_values())
+    assert values["warn_cache_hits"] == 1
+    assert values["warn_cache_misses"] == 1
+    assert values["warn_cache_size"] == 1
+    assert "# TYPE fulcrum_warn_cache_hits gauge\nfulcrum_warn_cache_hits 1\n" in metrics.prometheus()
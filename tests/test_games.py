@@ -0,0 +1,83 @@
+"""
+Description:
+The game library keepalive on a simulated 200 thread forum: the API calls and
+the wall clock time it takes to keep the threads in order and alive, with the
+bumps going through the outbox into a rate limited fake API.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench.fakes import FakeDiscordAPI, FakeThread
+from games import GAME_CHANNEL_ID, GameKeepalive, GameLibraryIndex
+from outbox import Outbox
+
+THREADS = 200
+# A bump is a message and its deletion, and unarchiving or resetting the archive duration
+CALLS_PER_BUMP = 3
+
+
+def forum(api: FakeDiscordAPI, now: datetime) -> list:
+    # Listed alphabetically already: the further down the alphabet, the longer ago the last activity
+    return [
+        FakeThread(
+            api,
+            10_000_000 + i,
+            f"Game {i:03d}",
+            GAME_CHANNEL_ID,
+            now - timedelta(days=30),
+            now - timedelta(minutes=i + 1),
+        )
+        for i in range(THREADS)
+    ]
+
+
+def test_200_thread_library():
+    async def main():
+        now = datetime.now(timezone.utc)
+        outbox = Outbox()
+        outbox.start()
+        api = FakeDiscordAPI(latency=0.001, limit=5, window=0.5, observer=outbox.observe)
+        threads = forum(api, now)
+        keepalive = GameKeepalive(GameLibraryIndex(), outbox, debounce=0.01)
+        keepalive.load(threads)
+
+        # In order and nowhere near archiving, nothing to do
+        assert await keepalive.run_pass() == 0
+        assert sum(api.calls.values()) == 0
+
+        # A thread half way down that is about to auto-archive, it and everything above it is bumped
+        threads[49].archive_timestamp = now - timedelta(days=6, hours=12)
+        start = time.perf_counter()
+        bumped = await keepalive.run_pass()
+        elapsed = time.perf_counter() - start
+        assert bumped == 50
+        assert sum(api.calls.values()) == CALLS_PER_BUMP * 50
+        # The old loop slept 3 times 28 seconds for every thread
+        assert elapsed < 5
+        assert keepalive.plan(datetime.now(timezone.utc)) == []
+
+        # A new game shows up as the most recent thread, the keepalive wakes up for it on its own
+        calls = sum(api.calls.values())
+        keepalive.start()
+        new = FakeThread(
+            api, 10_001_000, "Game 099a", GAME_CHANNEL_ID, now, datetime.now(timezone.utc)
+        )
+        start = time.perf_counter()
+        keepalive.add(new)
+        # The 100 threads above the new one alphabetically, so they are listed before it again
+        expected = calls + CALLS_PER_BUMP * 100
+        while sum(api.calls.values()) < expected:
+            await asyncio.sleep(0.01)
+            assert time.perf_counter() - start < 5
+        # And nothing after them
+        await asyncio.sleep(0.1)
+        keepalive.stop()
+        outbox.stop()
+
+        assert sum(api.calls.values()) == expected
+        assert keepalive.plan(datetime.now(timezone.utc)) == []
+        assert api.limited == 0
+
+    asyncio.run(main())
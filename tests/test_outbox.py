@@ -0,0 +1,150 @@
+"""
+Description:
+The outbox against a local endpoint that rate limits like Discord: replies go
+ahead of queued bumps, a global 429 pauses the whole queue, identical embeds
+are only sent once and bumps leave the last request of a window to replies.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import aiohttp
+import discord
+
+from bench.fakes import FakeDiscordServer
+from outbox import COMMAND, MAINTENANCE, Outbox, route_key
+
+
+async def with_server(test, **kwargs):
+    """
+    Run a test coroutine with a fake Discord server and an outbox fed the headers of its responses.
+    """
+    server = FakeDiscordServer(**kwargs)
+    url = await server.start()
+    outbox = Outbox()
+    try:
+        async with aiohttp.ClientSession(trace_configs=[outbox.trace_config()]) as session:
+
+            async def post(channel: int) -> int:
+                async with session.post(f"{url}/channels/{channel}/messages", json={}) as response:
+                    return response.status
+
+            return await test(server, outbox, post)
+    finally:
+        outbox.stop()
+        await server.stop()
+
+
+def test_command_goes_ahead_of_earlier_maintenance():
+    async def test(server, outbox, post):
+        order = []
+
+        def send(name: str, priority: int) -> asyncio.Future:
+            async def request():
+                order.append(name)
+                return await post(4001)
+
+            return outbox.submit(
+                route_key("POST", "/channels/4001/messages"), request, priority=priority
+            )
+
+        # Queued before the outbox runs, the bumps first
+        futures = [send(f"bump {i}", MAINTENANCE) for i in range(3)]
+        futures.append(send("reply", COMMAND))
+        outbox.start()
+        return order, await asyncio.gather(*futures)
+
+    order, statuses = asyncio.run(with_server(test, limit=10))
+    assert order == ["reply", "bump 0", "bump 1", "bump 2"]
+    assert statuses == [200] * 4
+
+
+def test_global_429_pauses_the_queue():
+    async def test(server, outbox, post):
+        starts = []
+        limits = []
+        observe = outbox.observe
+
+        def observed(method, path, status, headers):
+            if status == 429:
+                limits.append(time.monotonic())
+            observe(method, path, status, headers)
+
+        outbox.observe = observed
+        outbox.start()
+
+        async def request(channel: int) -> int:
+            starts.append(time.monotonic())
+            return await post(channel)
+
+        # Every channel is its own route, only the global limit can hold them back
+        statuses = await asyncio.gather(
+            *(
+                outbox.request(
+                    route_key("POST", f"/channels/{channel}/messages"),
+                    lambda channel=channel: request(channel),
+                )
+                for channel in range(4001, 4031)
+            )
+        )
+        return starts, limits, statuses
+
+    starts, limits, statuses = asyncio.run(with_server(test, limit=10, global_every=10))
+    assert statuses.count(429) == len(limits) == 3
+    # Nothing was started within the 50 ms Retry-After of a global 429
+    for limited in limits:
+        assert not [start for start in starts if limited < start < limited + 0.045]
+    # The last 429 is the last request, the two before it held the queue back
+    assert max(starts) - min(starts) >= 2 * 0.045
+
+
+def test_identical_embeds_are_coalesced():
+    async def test(server, outbox, post):
+        outbox.start()
+
+        async def send(**kwargs):
+            return await post(channel.id)
+
+        channel = SimpleNamespace(id=4001, send=send)
+
+        def error(description: str) -> discord.Embed:
+            return discord.Embed(title="Error!", description=description, color=0xE02B2B)
+
+        results = await asyncio.gather(
+            *(outbox.send(channel, embed=error("Slow down"), coalesce=True) for _ in range(3)),
+            outbox.send(channel, embed=error("Missing permissions"), coalesce=True),
+            # Only sends that ask for it are coalesced
+            outbox.send(channel, embed=error("Slow down")),
+        )
+        return server.requests, results, outbox.coalesced
+
+    requests, results, coalesced = asyncio.run(with_server(test, limit=10))
+    assert requests == 3
+    assert coalesced == 2
+    assert results == [200] * 5
+
+
+def test_maintenance_leaves_the_last_request_to_replies():
+    async def test(server, outbox, post):
+        outbox.start()
+        route = route_key("POST", "/channels/4001/messages")
+
+        async def timed(priority: int) -> float:
+            start = time.monotonic()
+            await outbox.request(route, lambda: post(4001), priority=priority)
+            return time.monotonic() - start
+
+        # Two of the three requests of the window are spent
+        await timed(MAINTENANCE)
+        await timed(MAINTENANCE)
+        bump = asyncio.create_task(timed(MAINTENANCE))
+        await asyncio.sleep(0.05)
+        reply = await timed(COMMAND)
+        return reply, await bump, server.limited
+
+    reply, bump, limited = asyncio.run(with_server(test, limit=3, window=1.0))
+    assert reply < 0.2
+    # The bump waited for the next window
+    assert bump > 0.5
+    assert limited == 0
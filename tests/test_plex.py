@@ -0,0 +1,269 @@
+"""
+Description:
+The incremental Plex sync against a fake PlexServer: how many requests a run
+makes on a library of thousands of episodes, that reading real plexapi search
+results never reloads them, and the memory and query latency of serving a 100k
+item snapshot.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from xml.etree import ElementTree
+
+from bench import summarize
+from bench.fakes import FakePlexServer, fake_plex_client, open_database
+from plex import PlexLibrary
+from plex.client import PAGE_OVERLAP, PAGE_SIZE
+
+NOW = datetime(2024, 8, 22, 12, 0, 0)
+
+
+def pages(items: int) -> int:
+    """
+    How many requests a full scan of a section takes, a page at a time.
+    """
+    count, start = 1, 0
+    while start + PAGE_SIZE <= items:
+        start += PAGE_SIZE - PAGE_OVERLAP
+        count += 1
+    return count
+
+
+async def sync_runs(directory: str, movies: int, shows: int, episodes: int) -> list:
+    """
+    Sync a library three times: the first sync, a week with nothing new and a week with new items.
+
+    :return: The requests and reloads of every run, and what the last week lists.
+    """
+    server = FakePlexServer()
+    server.add(NOW - timedelta(days=3650), NOW - timedelta(days=14), movies, shows, episodes)
+    plex = fake_plex_client(server)
+    database = await open_database(directory)
+    library = PlexLibrary(database=database)
+    runs = []
+
+    async def run() -> None:
+        requests = server.requests
+        await library.sync(plex)
+        runs.append(server.requests - requests)
+
+    try:
+        await run()
+        await run()
+        # 5 movies and 20 episodes, half of them of 2 shows that are not indexed yet
+        server.add(NOW - timedelta(days=7), NOW, movies=5, shows=2, episodes=10, seed=1)
+        server.add(NOW - timedelta(days=7), NOW, movies=0, shows=len(server.shows) + 2, episodes=0)
+        server.add(NOW - timedelta(days=7), NOW, movies=0, shows=2, episodes=10, seed=2)
+        await run()
+        week = (
+            await library.get_new_movies(NOW - timedelta(days=7)),
+            await library.get_new_episodes(NOW - timedelta(days=7)),
+        )
+    finally:
+        plex.close()
+        await database.close()
+    return runs, server.reloads, week
+
+
+def test_requests_per_run_do_not_grow_with_the_library(tmp_path):
+    (tmp_path / "small").mkdir()
+    (tmp_path / "large").mkdir()
+    small = asyncio.run(sync_runs(str(tmp_path / "small"), 500, 50, 2_000))
+    large = asyncio.run(sync_runs(str(tmp_path / "large"), 5_000, 500, 20_000))
+
+    for runs, reloads, (movies, shows) in (small, large):
+        # A section lookup and a search per section, plus one lookup per 100 new shows
+        assert runs[1:] == [4, 5]
+        assert reloads == 0
+        assert len(movies) == 5
+        assert sum(len(episodes) for _, _, seasons in shows for episodes in seasons.values()) == 20
+    # The first sync reads both sections in full, a page per request
+    assert small[0][0] == 2 + pages(500) + pages(2_000) + 1
+    assert large[0][0] == 2 + pages(5_000) + pages(20_000) + 5
+
+
+def test_full_scan_is_paged_under_the_timeout(tmp_path):
+    async def main():
+        # 5 ms per 100 items, a single call paging through the whole section would take 1 s
+        server = FakePlexServer(latency=0.005)
+        server.add(NOW - timedelta(days=3650), NOW, movies=20_000, shows=10, episodes=0)
+        plex = fake_plex_client(server, timeout=0.2)
+        database = await open_database(str(tmp_path))
+        library = PlexLibrary(database=database)
+        try:
+            await library.sync(plex)
+            removed = await library.prune(plex)
+            return removed, await library.get_new_movies(NOW - timedelta(days=3650))
+        finally:
+            plex.close()
+            await database.close()
+
+    removed, movies = asyncio.run(main())
+    assert removed == 0
+    assert len(movies) == 20_000
+
+
+class XMLServer:
+    """
+    Answers with real plexapi objects built from XML, and counts the requests their auto reload makes.
+    """
+
+    def __init__(self) -> None:
+        self.queries = []
+        self.elements = {}
+        self.sections = {"Movies": [], "Series": []}
+        self.library = SimpleNamespace(section=self.section)
+
+    def element(self, tag: str, section: str = None, **attributes):
+        attributes = {key: str(value) for key, value in attributes.items() if value is not None}
+        attributes["key"] = f"/library/metadata/{attributes['ratingKey']}"
+        element = ElementTree.Element(tag, attributes)
+        self.elements[attributes["key"]] = element
+        if section is not None:
+            self.sections[section].append(element)
+        return element
+
+    def query(self, key: str):
+        self.queries.append(key)
+        container = ElementTree.Element("MediaContainer")
+        container.append(self.elements[key.split("?")[0]])
+        return container
+
+    def section(self, name: str):
+        from plexapi.video import Episode, Movie
+
+        cls = Movie if name == "Movies" else Episode
+
+        def search(libtype=None, filters=None, container_start=0, container_size=100, maxresults=None):
+            elements = self.sections[name][container_start : container_start + maxresults]
+            return [cls(self, element, f"/library/sections/{name}/all") for element in elements]
+
+        return SimpleNamespace(search=search)
+
+    def fetchItems(self, keys: list) -> list:
+        from plexapi.video import Show
+
+        return [
+            Show(self, self.elements[f"/library/metadata/{key}"], "/library/metadata/fetch")
+            for key in keys
+        ]
+
+
+def test_plexapi_results_are_not_reloaded(tmp_path):
+    added = int(NOW.timestamp())
+    server = XMLServer()
+    # What Plex can leave out of a listing: the edition, the year, the episode numbers
+    server.element("Video", "Movies", type="movie", ratingKey=1, title="Plain", addedAt=added)
+    server.element(
+        "Video",
+        "Movies",
+        type="movie",
+        ratingKey=2,
+        title="Cut",
+        year=1982,
+        editionTitle="Final Cut",
+        addedAt=added,
+    )
+    server.element("Directory", type="show", ratingKey=10, title="Show", year=2001, childCount=2)
+    episode = server.element(
+        "Video",
+        "Series",
+        type="episode",
+        ratingKey=11,
+        title="Pilot",
+        grandparentRatingKey=10,
+        addedAt=added,
+    )
+    part = ElementTree.SubElement(ElementTree.SubElement(episode, "Media"), "Part")
+    part.set("file", "/tv/Show/Season 02/Show - S02E05.mkv")
+
+    async def main():
+        database = await open_database(str(tmp_path))
+        library = PlexLibrary(database=database)
+        plex = fake_plex_client(server)
+        try:
+            await library.sync(plex)
+            return (
+                await library.get_new_movies(NOW - timedelta(days=1)),
+                await library.get_new_episodes(NOW - timedelta(days=1)),
+            )
+        finally:
+            plex.close()
+            await database.close()
+
+    movies, shows = asyncio.run(main())
+    assert server.queries == []
+    assert sorted(movies) == [("Cut", 1982, "Final Cut"), ("Plain", None, None)]
+    assert shows == [("Show", 2001, {2: [5]})]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def serve_snapshot(directory: str) -> None:
+    """
+    Answer searches and weekly changelogs from a snapshot, writing down the memory and latency.
+    """
+
+    async def main():
+        baseline = rss_mb()
+        database = await open_database(directory)
+        library = PlexLibrary(database=database)
+        searches = []
+        for i in range(1_000):
+            start = time.perf_counter()
+            await library.search(f"{'Movie' if i % 2 else 'Show'} {1_000_000 + i * 97}")
+            searches.append(time.perf_counter() - start)
+        weeks = []
+        for week in range(52):
+            since, until = NOW - timedelta(days=7 * (week + 1)), NOW - timedelta(days=7 * week)
+            start = time.perf_counter()
+            await library.get_new_movies(since, until)
+            await library.get_new_episodes(since, until)
+            weeks.append(time.perf_counter() - start)
+        growth = rss_mb() - baseline
+        await database.close()
+        return {"rss_growth_mb": growth, "search": summarize(searches), "week": summarize(weeks)}
+
+    with open(os.path.join(directory, "serve.json"), "w") as file:
+        json.dump(asyncio.run(main()), file)
+
+
+def test_100k_snapshot_memory_and_latency(tmp_path):
+    async def build():
+        server = FakePlexServer()
+        server.add(NOW - timedelta(days=3650), NOW, movies=40_000, shows=2_000, episodes=60_000)
+        plex = fake_plex_client(server)
+        database = await open_database(str(tmp_path))
+        try:
+            await PlexLibrary(database=database).sync(plex)
+            await database.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            plex.close()
+            await database.close()
+
+    asyncio.run(build())
+    # The snapshot is served by a fresh process, so the fake library it was built from is not counted
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=serve_snapshot, args=(str(tmp_path),))
+    process.start()
+    process.join(120)
+    if process.is_alive():
+        process.kill()
+    assert process.exitcode == 0
+    with open(tmp_path / "serve.json") as file:
+        result = json.load(file)
+
+    # The snapshot stays on disk, only SQLite's page caches of the two connections are held,
+    # 16 MB each at most and here less than the whole file
+    assert result["rss_growth_mb"] < 2 * 16
+    assert result["rss_growth_mb"] < os.path.getsize(tmp_path / "database.db") / 2**20
+    assert result["search"]["p95_ms"] < 1
+    assert result["week"]["p95_ms"] < 20
@@ -0,0 +1,374 @@
+"""
+Description:
+The job scheduler against a fake clock: missed runs, failed runs, a changelog
+that failed part way, restarts, and the order the bot starts it in.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+from bench.fakes import (
+    FakeDiscordAPI,
+    FakePlexServer,
+    fake_plex_client,
+    make_threads,
+    open_database,
+)
+from games import GAME_CHANNEL_ID, GameKeepalive, GameLibraryIndex
+from plex import PlexLibrary
+from scheduler import JobScheduler, Lease
+
+NOW = 1_700_000_000.0
+DAY = 86_400.0
+
+
+class FakeClock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+        self.until = None
+        self.parked = asyncio.Event()
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        # Time passes at once, up to the end of the test where the sleeper is parked for good
+        if self.until is not None and self.now + delay > self.until:
+            self.now = self.until
+            self.parked.set()
+            await asyncio.Event().wait()
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+async def run_until(scheduler: JobScheduler, clock: FakeClock, until: float) -> None:
+    clock.until = until
+    clock.parked.clear()
+    scheduler.start()
+    try:
+        # A scheduler that died never gets there
+        await asyncio.wait_for(clock.parked.wait(), 5)
+    finally:
+        scheduler.stop()
+
+
+async def stored(database, name: str) -> tuple:
+    rows = await database.reader.execute(
+        "SELECT next_run, last_run FROM jobs WHERE name=?", (name,)
+    )
+    async with rows as cursor:
+        return await cursor.fetchone()
+
+
+def test_missed_runs_collapse_into_one(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        scheduler = JobScheduler(database=database, clock=clock, sleep=clock.sleep)
+        runs = []
+
+        async def job(lastRun):
+            runs.append((clock(), lastRun))
+
+        # Offline for a bit over four weeks
+        first = NOW - 30 * DAY
+        await scheduler.add_job(
+            "weekly",
+            job,
+            timedelta(days=7),
+            first_run=datetime.fromtimestamp(first),
+            last_run=datetime.fromtimestamp(first - 7 * DAY),
+        )
+        await run_until(scheduler, clock, NOW + DAY)
+
+        assert runs == [(NOW, datetime.fromtimestamp(first - 7 * DAY))]
+        # Still on the original weekly slots, the next one after now
+        assert await stored(database, "weekly") == (first + 35 * DAY, NOW)
+        await database.close()
+
+    asyncio.run(main())
+
+
+def test_failed_run_is_retried_without_advancing(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        scheduler = JobScheduler(
+            database=database, clock=clock, sleep=clock.sleep, retry_delay=timedelta(minutes=5)
+        )
+        runs = []
+
+        async def job(lastRun):
+            runs.append((clock(), lastRun, await stored(database, "flaky")))
+            if len(runs) == 1:
+                raise RuntimeError("Plex is down")
+
+        await scheduler.add_job(
+            "flaky", job, timedelta(days=7), last_run=datetime.fromtimestamp(NOW - 7 * DAY)
+        )
+        await run_until(scheduler, clock, NOW + DAY)
+
+        assert [run[0] for run in runs] == [NOW, NOW + 300]
+        # The retry gets the same last run, nothing was stored in between
+        assert runs[0][1:] == runs[1][1:] == (
+            datetime.fromtimestamp(NOW - 7 * DAY),
+            (NOW, NOW - 7 * DAY),
+        )
+        assert await stored(database, "flaky") == (NOW + 7 * DAY, NOW + 300)
+        await database.close()
+
+    asyncio.run(main())
+
+
+def test_changelog_retry_resumes_after_the_delivered_messages(tmp_path):
+    async def main():
+        from bot import DiscordBot
+
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        scheduler = JobScheduler(
+            database=database, clock=clock, sleep=clock.sleep, retry_delay=timedelta(minutes=5)
+        )
+        server = FakePlexServer()
+        logDate = datetime.fromtimestamp(NOW - 7 * DAY)
+        server.add(logDate, datetime.fromtimestamp(NOW), movies=300, shows=0, episodes=0)
+        attempts = []
+
+        async def send(channel, message):
+            # Discord goes away after the second message of the first run
+            if len(attempts) == 1 and len(attempts[0]) == 2:
+                raise discord.HTTPException(SimpleNamespace(status=503, reason="Unavailable"), "")
+            attempts[-1].append(message)
+
+        bot = SimpleNamespace(
+            plex_library=PlexLibrary(database=database),
+            plex=fake_plex_client(server),
+            game_library=GameLibraryIndex(),
+            get_channel=lambda id: SimpleNamespace(id=id),
+            outbox=SimpleNamespace(send=send),
+            plex_log_sent=(None, 0),
+        )
+
+        async def plex_log(lastRun):
+            attempts.append([])
+            await DiscordBot.plex_log(bot, lastRun)
+
+        await scheduler.add_job("plex_log", plex_log, timedelta(days=7), last_run=logDate)
+        try:
+            await run_until(scheduler, clock, NOW + DAY)
+        finally:
+            bot.plex.close()
+            await database.close()
+        return attempts, bot.plex_log_sent
+
+    attempts, sent = asyncio.run(main())
+    assert len(attempts) == 2
+    assert len(attempts[0]) == 2
+    # The retry carries on with the third message, the changelog went out once
+    messages = attempts[0] + attempts[1]
+    assert len(messages) > 3
+    assert "".join(messages).count("FULCRUM Automated Changelog") == 1
+    movies = [
+        line for message in messages for line in message.splitlines() if line.startswith(" + ")
+    ]
+    assert len(movies) == len(set(movies)) == 300
+    assert sent == (None, 0)
+    assert sent == (None, 0)
+
+
+def test_database_error_does_not_stop_the_scheduler(tmp_path, caplog):
+    async def main():
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        scheduler = JobScheduler(
+            database=database,
+            clock=clock,
+            sleep=clock.sleep,
+            logger=logging.getLogger("test"),
+        )
+        runs = []
+
+        async def job(lastRun):
+            runs.append(clock())
+
+        await scheduler.add_job("weekly", job, timedelta(days=7))
+        # A long Plex sync holds the writer past the busy timeout, storing the run fails once
+        transaction = database.transaction
+        errors = [sqlite3.OperationalError("database is locked")]
+
+        def locked():
+            if errors:
+                raise errors.pop()
+            return transaction()
+
+        database.transaction = locked
+        await run_until(scheduler, clock, NOW + DAY)
+
+        # The run was not stored, so it is retried once the database is free again
+        assert runs == [NOW, NOW + 300]
+        assert await stored(database, "weekly") == (NOW + 7 * DAY, NOW + 300)
+        await database.close()
+
+    with caplog.at_level(logging.ERROR, logger="test"):
+        asyncio.run(main())
+    assert "OperationalError: database is locked" in caplog.text
+
+
+def test_busy_database_while_renewing_the_lease_skips_the_run(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        lease = Lease("singletons", "test", database=database, ttl=60.0, clock=clock, sleep=clock.sleep)
+        scheduler = JobScheduler(database=database, clock=clock, sleep=clock.sleep, lease=lease)
+        runs = []
+
+        async def job(lastRun):
+            runs.append(clock())
+
+        await scheduler.add_job("weekly", job, timedelta(days=7))
+        assert await lease.acquire()
+        acquire = lease.acquire
+        errors = [sqlite3.OperationalError("database is locked")]
+
+        async def busy():
+            if errors:
+                raise errors.pop()
+            return await acquire()
+
+        lease.acquire = busy
+        await run_until(scheduler, clock, NOW + DAY)
+
+        # Not held while the database was busy, the run waits for the next renewal
+        assert runs == [NOW + 20]
+        assert await stored(database, "weekly") == (NOW + 7 * DAY, NOW + 20)
+        await lease.stop()
+        await database.close()
+
+    asyncio.run(main())
+
+
+def test_restart_restores_state(tmp_path):
+    async def main():
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW)
+        runs = []
+
+        async def job(lastRun):
+            runs.append((clock(), lastRun))
+
+        scheduler = JobScheduler(database=database, clock=clock, sleep=clock.sleep)
+        await scheduler.add_job("weekly", job, timedelta(days=7))
+        await run_until(scheduler, clock, NOW + DAY)
+        await database.close()
+
+        # The bot comes back two days later, the seed it registers the job with is ignored
+        database = await open_database(str(tmp_path))
+        clock = FakeClock(NOW + 2 * DAY)
+        scheduler = JobScheduler(database=database, clock=clock, sleep=clock.sleep)
+        job = await scheduler.add_job(
+            "weekly", job, timedelta(days=7), first_run=datetime.fromtimestamp(NOW + 2 * DAY)
+        )
+        assert (job.next_run, job.last_run) == (NOW + 7 * DAY, NOW)
+
+        await run_until(scheduler, clock, NOW + 8 * DAY)
+        assert runs == [(NOW, None), (NOW + 7 * DAY, datetime.fromtimestamp(NOW))]
+        await database.close()
+
+    asyncio.run(main())
+
+
+async def startup(directory: str, shard_ids, channel) -> tuple:
+    """
+    Run DiscordBot.before_scheduler on a stand-in for the bot, with plex_log due right away.
+
+    :return: What plex_log saw of the game library, or None if it did not run, and the lease.
+    """
+    from bot import DiscordBot
+
+    database = await open_database(directory)
+    index = GameLibraryIndex()
+    lease = Lease("singletons", "test", database=database)
+    scheduler = JobScheduler(database=database, lease=lease)
+    seen = asyncio.get_running_loop().create_future()
+
+    async def plex_log(logDate):
+        seen.set_result(index.names_since(logDate))
+
+    await scheduler.add_job(
+        "plex_log", plex_log, timedelta(days=7), last_run=datetime(2024, 8, 15)
+    )
+
+    async def wait_until_ready():
+        pass
+
+    bot = SimpleNamespace(
+        shard_ids=shard_ids,
+        get_channel=lambda id: channel if id == GAME_CHANNEL_ID else None,
+        wait_until_ready=wait_until_ready,
+        game_keepalive=GameKeepalive(index, outbox=None),
+        lease=lease,
+        scheduler=scheduler,
+        logger=logging.getLogger("test"),
+    )
+    task = asyncio.create_task(DiscordBot.before_scheduler(bot))
+    names = None
+    try:
+        if shard_ids is None:
+            names = await asyncio.wait_for(seen, 5)
+        else:
+            # Nothing to wait for, it gives up once the gateway is ready
+            await asyncio.wait_for(task, 5)
+            await asyncio.sleep(0.1)
+    finally:
+        task.cancel()
+        bot.game_keepalive.stop()
+        scheduler.stop()
+        await lease.stop()
+        await database.close()
+    return names, lease
+
+
+def test_startup_fills_the_game_index_before_jobs_run(tmp_path):
+    async def main():
+        now = datetime.now(timezone.utc)
+        threads = make_threads(FakeDiscordAPI(), 50, GAME_CHANNEL_ID, now=now)
+        names, _ = await startup(str(tmp_path), None, SimpleNamespace(threads=threads))
+        since = datetime(2024, 8, 15).timestamp()
+        expected = sorted(t.name for t in threads if t.created_at.timestamp() >= since)
+        assert expected
+        assert names == expected
+
+    asyncio.run(main())
+
+
+def test_startup_leaves_jobs_to_the_shards_with_the_game_library(tmp_path):
+    async def main():
+        names, lease = await startup(str(tmp_path), [2, 3], None)
+        assert names is None
+        assert lease.generation == 0
+
+    asyncio.run(main())
+
+
+def test_startup_task_errors_are_logged(caplog):
+    from bot import DiscordBot
+
+    async def main():
+        bot = SimpleNamespace(logger=logging.getLogger("test"))
+
+        async def before_scheduler():
+            raise sqlite3.OperationalError("database is locked")
+
+        task = asyncio.create_task(before_scheduler())
+        task.add_done_callback(lambda task: DiscordBot.log_task_error(bot, task))
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    with caplog.at_level(logging.ERROR, logger="test"):
+        asyncio.run(main())
+    assert "before_scheduler failed\nOperationalError: database is locked" in caplog.text
@@ -0,0 +1,214 @@
+"""
+Description:
+Several bot processes on one database, each starting up the way run_bot does:
+the real setup_hook and before_scheduler, with a fake gateway delivering the
+READY and GUILD_CREATE events of its shards. Only the processes whose shards
+see the game library may take the lease, and every due job runs exactly once
+however many of them there are.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+from bench.fakes import (
+    FakeHTTP,
+    FakePlexServer,
+    fake_plex_client,
+    open_database,
+    state_files,
+    user_payload,
+)
+from games import GAME_CHANNEL_ID
+
+SHARDS = 4
+GUILD_ID = 1220000000000000000
+CHANGELOG_CHANNEL_ID = 1223505800706789378
+BOT_USER = user_payload(1238671384104800346, "fulcrum", bot=True)
+# The shard Discord puts the guild with the game library on
+GAME_SHARD = (GUILD_ID >> 22) % SHARDS
+
+
+def guild_payload(now: datetime) -> dict:
+    def channel(id: int, type: int, name: str) -> dict:
+        return {"id": str(id), "type": type, "name": name, "position": 0, "guild_id": str(GUILD_ID)}
+
+    threads = [
+        {
+            **channel(1230000000000000000 + i, 11, f"Game {i:02d}"),
+            "parent_id": str(GAME_CHANNEL_ID),
+            "owner_id": BOT_USER["id"],
+            "last_message_id": None,
+            "message_count": 1,
+            "member_count": 1,
+            "rate_limit_per_user": 0,
+            "thread_metadata": {
+                "archived": False,
+                "locked": False,
+                "auto_archive_duration": 10080,
+                # Older further down the alphabet, in order and nowhere near archiving
+                "archive_timestamp": (now - timedelta(minutes=i + 1)).isoformat(),
+                "create_timestamp": (now - timedelta(days=1)).isoformat(),
+            },
+        }
+        for i in range(20)
+    ]
+    return {
+        "id": str(GUILD_ID),
+        "name": "FULCRUM",
+        "unavailable": False,
+        "large": False,
+        "member_count": 0,
+        "members": [],
+        "roles": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "channels": [
+            channel(CHANGELOG_CHANNEL_ID, 0, "changelog"),
+            {**channel(GAME_CHANNEL_ID, 15, "game-library"), "available_tags": []},
+        ],
+        "threads": threads,
+    }
+
+
+def connect(bot, shardIds: list) -> None:
+    """
+    Feed the bot the gateway events of its shards, the guild only arrives on the shard it is on.
+    """
+    state = bot._connection
+    state.shard_ids = shardIds
+    state.guild_ready_timeout = 0.1
+    for shard in shardIds:
+        guilds = [{"id": str(GUILD_ID), "unavailable": True}] if shard == GAME_SHARD else []
+        state.parse_ready({"shard": [shard, SHARDS], "user": BOT_USER, "guilds": guilds})
+    if GAME_SHARD in shardIds:
+        state.parse_guild_create(guild_payload(datetime.now(timezone.utc)))
+
+
+def worker(directory: str, name: str, shardIds: list, seconds: float) -> None:
+    os.chdir(directory)
+    asyncio.run(work(directory, name, shardIds, seconds))
+
+
+async def work(directory: str, name: str, shardIds: list, seconds: float) -> None:
+    from bot import DiscordBot
+
+    bot = DiscordBot(shardIds, SHARDS)
+    await bot._async_setup_hook()
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=BOT_USER)
+    http = FakeHTTP(BOT_USER)
+    bot.http.request = http.request
+
+    # The same as DiscordBot.init_db, on the shared database of the test
+    async def init_db(self) -> None:
+        self.database = await open_database(directory)
+        self.metrics.instrument(self.database, "database_seconds")
+
+    bot.init_db = types.MethodType(init_db, bot)
+    await bot.setup_hook()
+    bot.plex.close()
+    server = FakePlexServer()
+    server.add(datetime.now() - timedelta(days=30), datetime.now(), movies=5, shows=2, episodes=10)
+    bot.plex = fake_plex_client(server)
+    # Short enough for a standby process to take over once the leader is gone
+    bot.lease.ttl = 1.0
+
+    # Write down every job run and keepalive start next to the jobs, before anything can be due
+    async with bot.database.transaction() as connection:
+        await connection.execute("CREATE TABLE IF NOT EXISTS test_runs (job TEXT, process TEXT)")
+    for job in bot.scheduler.jobs.values():
+
+        def recorded(func, jobName):
+            async def run(lastRun):
+                async with bot.database.transaction() as connection:
+                    await connection.execute("INSERT INTO test_runs VALUES (?, ?)", (jobName, name))
+                await func(lastRun)
+
+            return run
+
+        job.func = recorded(job.func, job.name)
+    leaseStarts, keepaliveStarts = [], []
+    startLease, startKeepalive = bot.lease.start, bot.game_keepalive.start
+    bot.lease.start = lambda: (leaseStarts.append(time.time()), startLease())
+    bot.game_keepalive.start = lambda logger=None: (
+        keepaliveStarts.append(time.time()),
+        startKeepalive(logger),
+    )
+
+    connect(bot, shardIds)
+    await asyncio.sleep(seconds)
+    result = {
+        "sees_game_library": bot.get_channel(GAME_CHANNEL_ID) is not None,
+        "lease_starts": leaseStarts,
+        "lease_generation": bot.lease.generation,
+        "keepalive_starts": keepaliveStarts,
+        "messages_sent": http.calls["POST /channels/{channel_id}/messages"],
+    }
+    await bot.close()
+    with open(os.path.join(directory, f"{name}.json"), "w") as file:
+        json.dump(result, file)
+
+
+def test_every_job_runs_once_across_processes():
+    others = [shard for shard in range(SHARDS) if shard != GAME_SHARD]
+    # "first" and "second" overlap on the shard with the game library, like the old and the new
+    # process of a restart. "first" leaves early, "second" takes over without rerunning anything.
+    processes = {
+        "first": ([GAME_SHARD], 6.0),
+        "others": (others, 9.0),
+        "second": ([GAME_SHARD], 9.0),
+    }
+    context = multiprocessing.get_context("spawn")
+    with state_files(plex_date=datetime.now() - timedelta(days=7)) as directory:
+        workers = [
+            context.Process(target=worker, args=(directory, name, shardIds, seconds))
+            for name, (shardIds, seconds) in processes.items()
+        ]
+        try:
+            for process in workers:
+                process.start()
+            for process in workers:
+                process.join(60)
+                assert process.exitcode == 0
+        finally:
+            for process in workers:
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+        results = {}
+        for name in processes:
+            with open(os.path.join(directory, f"{name}.json")) as file:
+                results[name] = json.load(file)
+        with sqlite3.connect(os.path.join(directory, "database.db"), timeout=10) as connection:
+            runs = connection.execute("SELECT job, process FROM test_runs").fetchall()
+            leases = connection.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+
+    # plex_prune is only due in 30 days, the other two were due at startup
+    assert sorted(job for job, _ in runs) == ["games_active", "plex_log"]
+    assert {process for _, process in runs} <= {"first", "second"}
+    # The changelog, the game library was in order so the keepalive had nothing to bump
+    assert sum(result["messages_sent"] for result in results.values()) == 1
+
+    assert [results[name]["sees_game_library"] for name in processes] == [True, False, True]
+    # The shards without the game library never ask for the lease
+    assert results["others"]["lease_starts"] == []
+    assert results["others"]["lease_generation"] == 0
+    assert results["others"]["keepalive_starts"] == []
+    # One keepalive at a time, the second process only starts its own after the first left
+    starts = sorted(
+        (start, name) for name in ("first", "second") for start in results[name]["keepalive_starts"]
+    )
+    assert starts
+    assert [name for _, name in starts] in (["first", "second"], ["second"])
+    # Everyone released the lease on the way out
+    assert leases == 0
@@ -0,0 +1,118 @@
+"""
+Description:
+The stream scheduler and browser pool over a 1,000 entry schedule, with a fake
+browser in place of Chromium and a fake clock ticking every minute.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from streams import BrowserPool, StreamScheduler
+
+START = datetime(2024, 8, 15, 18, 0, 0)
+ENTRIES = 1_000
+STALE = 100
+SLOTS = 3
+
+
+class FakeBrowser:
+    def __init__(self) -> None:
+        self.contexts = 0
+        self.open = 0
+        self.most_open = 0
+        self.closed = False
+
+    async def new_context(self):
+        self.contexts += 1
+        self.open += 1
+        self.most_open = max(self.most_open, self.open)
+        return FakeContext(self)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser: FakeBrowser) -> None:
+        self.browser = browser
+
+    async def new_page(self):
+        return FakePage()
+
+    async def close(self) -> None:
+        self.browser.open -= 1
+
+
+class FakePage:
+    async def goto(self, url: str) -> None:
+        await asyncio.sleep(0)
+
+    async def title(self) -> str:
+        return "YouTube"
+
+
+class Played:
+    def __init__(self) -> None:
+        self.codes = []
+
+    def info(self, message: str) -> None:
+        # "Started stream <code> scheduled for <time>: <title>"
+        self.codes.append(message.split()[2])
+
+
+def write_schedule(path: str, entries: list) -> None:
+    with open(path, "w") as file:
+        for itemTime, itemCode in entries:
+            file.write(f"{itemTime.strftime('%Y-%m-%d,%H:%M:%S')},{itemCode}\n")
+
+
+def test_every_entry_plays_once_on_one_browser(tmp_path):
+    async def main():
+        browser = FakeBrowser()
+        launches = 0
+
+        async def launch():
+            nonlocal launches
+            launches += 1
+
+            async def stop():
+                pass
+
+            return browser, stop
+
+        # The first entries were due long before the bot started, the rest come up six a minute,
+        # more at every tick than there are slots
+        entries = [(START - timedelta(hours=1, minutes=i), f"stale{i}") for i in range(STALE)]
+        entries += [
+            (START + timedelta(seconds=10 * i), f"item{i}") for i in range(ENTRIES - STALE)
+        ]
+        path = os.path.join(tmp_path, "schedule.csv")
+        write_schedule(path, entries)
+
+        now = START
+        played = Played()
+        pool = BrowserPool(launch, size=SLOTS, duration=timedelta(milliseconds=1), logger=played)
+        scheduler = StreamScheduler(path, pool, clock=lambda: now)
+        started = 0
+        end = entries[-1][0] + timedelta(minutes=2)
+        while now <= end:
+            if now == START + timedelta(hours=1):
+                # Rewritten with the same entries, nothing that already played plays again
+                write_schedule(path, entries)
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+            started += scheduler.tick()
+            await asyncio.sleep(0)
+            now += timedelta(minutes=1)
+        while pool._streams:
+            await asyncio.sleep(0.01)
+        await pool.close()
+
+        assert launches == pool.launches == 1
+        assert started == browser.contexts == ENTRIES - STALE
+        assert sorted(played.codes) == sorted(code for _, code in entries[STALE:])
+        assert browser.most_open == SLOTS
+        assert browser.open == pool.open == 0
+        assert browser.closed
+
+    asyncio.run(main())